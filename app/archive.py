@@ -0,0 +1,463 @@
+"""Cold history: closed months of call_logs archived to Parquet files.
+
+Year-over-year analytics read years of calls that never change again. The
+archive exports every call older than the hot horizon, the start of the
+ARCHIVE_HOT_MONTHS-th most recent month, with its owner's and list's names,
+to Parquet files in ARCHIVE_DIR, one directory per month. A manifest lists
+the files, the horizon and the highest call id exported: a call is archived
+when it is older than the horizon and its id is not above that. Each run
+exports the calls that are not yet archived, including ones logged late into
+months already archived.
+
+When an analytics date range starts before the horizon, the archived calls
+are queried in-process with DuckDB and added to the calls that are still hot
+in call_logs, so results are the same either way. Exporting leaves the calls
+in call_logs; prune() deletes archived calls from it. The leaderboard, agents'
+totals and list stats are of all time and read call_logs alone, so pruning
+is refused unless ARCHIVE_ALLOW_PRUNE accepts that they then undercount.
+
+Needs duckdb to query the archive and pyarrow to write it; without them, or
+without ARCHIVE_DIR, analytics read call_logs alone as before.
+
+    python -m app.archive [--prune]
+"""
+import argparse
+import heapq
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from sqlalchemy import and_, delete, func, not_, or_, select, text
+from sqlalchemy.orm import Session
+
+from app import metrics, readmodels
+from app.cache import mark_changed
+from app.database import engine
+from app.models import CallLog, LogList, User, UserRole
+
+try:
+    import duckdb
+except ImportError:  # The archive is then not read: analytics use call_logs alone
+    duckdb = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # Only needed to write the archive
+    pyarrow = parquet = None
+
+logger = logging.getLogger("app.archive")
+
+# Off unless set; every worker reads the files, so they need the same disk
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+# Months that stay only in call_logs, the current one included
+ARCHIVE_HOT_MONTHS = max(int(os.getenv("ARCHIVE_HOT_MONTHS", "3")), 1)
+# Pruned calls drop out of the all-time totals, which only read call_logs
+ARCHIVE_ALLOW_PRUNE = os.getenv("ARCHIVE_ALLOW_PRUNE", "false").lower() == "true"
+# Rows per Parquet row group, and per delete when pruning
+ARCHIVE_BATCH_ROWS = 50_000
+# Longest an export waits for open call_logs writes on Postgres
+ARCHIVE_LOCK_TIMEOUT_MS = 5000
+
+MANIFEST = "manifest.json"
+
+if pyarrow is not None:
+    SCHEMA = pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("call_type", pyarrow.string()),
+        ("timestamp", pyarrow.timestamp("us")),
+        ("is_potential", pyarrow.bool_()),
+        ("log_list_id", pyarrow.int64()),
+        ("list_name", pyarrow.string()),
+        ("owner_id", pyarrow.int64()),
+        ("owner_username", pyarrow.string()),
+        ("owner_name", pyarrow.string()),
+        ("owner_role", pyarrow.string()),
+    ])
+
+archived_rows = metrics.registry.counter(
+    "app_archive_rows_total", "Calls written to or pruned after the archive.", ("action",))
+query_seconds = metrics.registry.histogram(
+    "app_archive_query_seconds", "Time analytics queries on the archive took.", ("query",))
+
+
+def _utc(value: datetime) -> datetime:
+    """Naive UTC, as the archive stores timestamps."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _month_start(day: date, months_back: int = 0) -> datetime:
+    month = day.year * 12 + day.month - 1 - months_back
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """One version of the archive, for queries that must agree with each other."""
+    horizon: datetime
+    through_id: int
+    files: tuple
+    rows: int
+
+    def hot(self):
+        """Filter for call_logs rows that are not in this snapshot."""
+        return or_(CallLog.timestamp >= self.horizon, CallLog.id > self.through_id)
+
+    def archived(self):
+        return and_(CallLog.timestamp < self.horizon, CallLog.id <= self.through_id)
+
+    def _query(self, name: str, sql: str, params: list) -> list:
+        started = time.perf_counter()
+        # A cursor per query: DuckDB connections are not shared between threads
+        cursor = store.connection().cursor()
+        try:
+            rows = cursor.execute(sql.replace("{calls}", "read_parquet(?)"),
+                                  [list(self.files), *params]).fetchall()
+        finally:
+            cursor.close()
+        query_seconds.labels(name).observe(time.perf_counter() - started)
+        return rows
+
+    @staticmethod
+    def _where(since: datetime = None, until: datetime = None, call_type: str = None,
+               potential: bool = False, owner_id: int = None, search: str = None,
+               owned: bool = False):
+        """The analytics endpoints' filters, in DuckDB SQL.
+
+        owned: only calls whose list and owner still existed when archived,
+        as the inner joins of readmodels.owned_calls() return.
+        """
+        clauses, params = [], []
+        if owned:
+            clauses.append("list_name IS NOT NULL AND owner_username IS NOT NULL")
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(_utc(since))
+        if until is not None:
+            clauses.append("timestamp <= ?")
+            params.append(_utc(until))
+        if call_type:
+            clauses.append("call_type = ?")
+            params.append(call_type)
+        if potential:
+            clauses.append("is_potential")
+        if owner_id:
+            clauses.append("owner_id = ?")
+            params.append(owner_id)
+        if search:
+            clauses.append("(owner_username ILIKE ? OR owner_name ILIKE ? "
+                           "OR list_name ILIKE ? OR call_type ILIKE ?)")
+            params.extend([f"%{search}%"] * 4)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def call_type_counts(self, **filters) -> dict:
+        where, params = self._where(**filters)
+        return dict(self._query(
+            "call_types", f"SELECT call_type, count(*) FROM {{calls}}{where} GROUP BY call_type",
+            params))
+
+    def daily_counts(self, **filters) -> dict:
+        """(total, potential) calls per day."""
+        where, params = self._where(**filters)
+        return {day: (total, potential) for day, total, potential in self._query(
+            "daily", "SELECT CAST(timestamp AS DATE), count(*), count(*) FILTER (WHERE is_potential)"
+            f" FROM {{calls}}{where} GROUP BY 1", params)}
+
+    def count(self, **filters) -> int:
+        where, params = self._where(**filters)
+        return self._query("count", f"SELECT count(*) FROM {{calls}}{where}", params)[0][0]
+
+    def calls(self, limit: int, offset: int = 0, **filters) -> list:
+        """Calls offset to offset + limit, most recent first, as OwnedCallRows."""
+        where, params = self._where(**filters)
+        rows = self._query(
+            "calls", "SELECT id, call_type, timestamp, is_potential, log_list_id, list_name,"
+            " owner_id, owner_username, owner_name, owner_role"
+            f" FROM {{calls}}{where} ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset])
+        # Timestamps as call_logs returns them
+        aware = engine.dialect.name != "sqlite"
+        return [readmodels.OwnedCallRow(
+            *row[:2], row[2].replace(tzinfo=timezone.utc) if aware else row[2],
+            *row[3:9], row[9] and UserRole(row[9])) for row in rows]
+
+
+def analytics_filters(call_type: str) -> dict:
+    """Archive filters for the call_type parameter of performance and trends."""
+    if call_type == "all":
+        return {}
+    if call_type == "potential":
+        return {"potential": True}
+    return {"call_type": call_type}
+
+
+def _count(db: Session, query) -> int:
+    return db.execute(select(func.count()).select_from(query.subquery())).scalar()
+
+
+def page_calls(db: Session, query, snapshot: Snapshot, filters: dict,
+               offset: int, limit: int) -> tuple[int, list]:
+    """The total and calls offset to offset + limit of call_logs and the archive.
+
+    query: readmodels.owned_calls() with the filters applied that the archive
+    is queried with. Most recent first: the hot calls newer than the horizon,
+    then the archived ones, merged with calls logged late into archived
+    months, if there are any.
+    """
+    order = CallLog.timestamp.desc()
+    newer = query.where(CallLog.timestamp >= snapshot.horizon)
+    late = query.where(CallLog.timestamp < snapshot.horizon, CallLog.id > snapshot.through_id)
+    newer_count, late_count = _count(db, newer), _count(db, late)
+    total = newer_count + late_count + snapshot.count(**filters)
+
+    page = []
+    if offset < newer_count:
+        page = readmodels.fetch(db, newer.order_by(order).offset(offset).limit(limit),
+                                readmodels.OwnedCallRow)
+    skip, wanted = max(offset - newer_count, 0), limit - len(page)
+    if wanted <= 0:
+        return total, page
+    if not late_count:
+        return total, page + snapshot.calls(wanted, skip, **filters)
+    # The page is among the first skip + wanted calls of either
+    merged = heapq.merge(
+        readmodels.fetch(db, late.order_by(order).limit(skip + wanted), readmodels.OwnedCallRow),
+        snapshot.calls(skip + wanted, **filters),
+        key=lambda row: _utc(row.timestamp), reverse=True)
+    return total, page + [row for _, row in zip(range(skip + wanted), merged)][skip:]
+
+
+class Archive:
+    """The archive in a directory: its manifest, and writing and pruning it."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._manifest_mtime = None
+        self._connection = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory) and duckdb is not None
+
+    def connection(self):
+        with self._lock:
+            if self._connection is None:
+                self._connection = duckdb.connect()
+            return self._connection
+
+    def _read_manifest(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def snapshot(self) -> Optional[Snapshot]:
+        """The archive as last written, None if it has no calls yet."""
+        if not self.enabled:
+            return None
+        try:
+            mtime = os.stat(os.path.join(self.directory, MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._manifest_mtime:
+                manifest = self._read_manifest()
+                files = tuple(os.path.join(self.directory, file)
+                              for month in manifest["months"].values()
+                              for file in month["files"])
+                self._snapshot = Snapshot(
+                    datetime.fromisoformat(manifest["horizon"]), manifest["through_id"],
+                    files, sum(month["rows"] for month in manifest["months"].values())) \
+                    if files else None
+                self._manifest_mtime = mtime
+            return self._snapshot
+
+    def covering(self, since: Optional[datetime]) -> Optional[Snapshot]:
+        """The snapshot to add to call_logs for a range starting at since, if any."""
+        snapshot = self.snapshot()
+        if snapshot is None or (since is not None and _utc(since) >= snapshot.horizon):
+            return None
+        return snapshot
+
+    def export(self, db: Session, today: date = None) -> dict:
+        """Archive the calls older than the hot horizon that are not archived yet."""
+        if not self.directory:
+            raise RuntimeError("ARCHIVE_DIR is not set")
+        if pyarrow is None:
+            raise RuntimeError("Writing the archive needs pyarrow")
+        manifest = self._read_manifest() or {"horizon": None, "through_id": 0, "months": {}}
+        previous = Snapshot(datetime.fromisoformat(manifest["horizon"]), manifest["through_id"],
+                            (), 0) if manifest["horizon"] else None
+        horizon = _month_start(today or datetime.now(timezone.utc).date(), ARCHIVE_HOT_MONTHS - 1)
+        # Raising ARCHIVE_HOT_MONTHS does not bring archived months back
+        if previous is not None and horizon < previous.horizon:
+            horizon = previous.horizon
+        # Calls committed from now on get higher ids, so the next run picks them up
+        through_id = self._committed_through(db)
+
+        # Outer joins: every call older than the horizon counts as archived
+        statement = select(*readmodels.CALL_COLUMNS, LogList.name, CallLog.owner_id,
+                           User.username, User.name, User.role).select_from(CallLog).outerjoin(
+            LogList, LogList.id == CallLog.log_list_id).outerjoin(
+            User, User.id == CallLog.owner_id).where(
+            CallLog.timestamp < horizon, CallLog.id <= through_id)
+        if previous is not None:
+            statement = statement.where(not_(previous.archived()))
+
+        # One pass over call_logs, rows going to a writer per month
+        writers, buffers, written = {}, {}, {}
+        result = db.connection().execution_options(stream_results=True).execute(statement)
+        try:
+            for rows in result.partitions(ARCHIVE_BATCH_ROWS):
+                for row in rows:
+                    timestamp = _utc(row.timestamp)
+                    month = f"{timestamp.year:04d}-{timestamp.month:02d}"
+                    buffer = buffers.setdefault(month, [])
+                    buffer.append((*row[:2], timestamp, *row[3:9], row[9] and row[9].value))
+                    if len(buffer) >= ARCHIVE_BATCH_ROWS:
+                        self._write(writers, month, buffer, through_id)
+                        written[month] = written.get(month, 0) + len(buffer)
+                        buffer.clear()
+            for month, buffer in buffers.items():
+                if buffer:
+                    self._write(writers, month, buffer, through_id)
+                    written[month] = written.get(month, 0) + len(buffer)
+        finally:
+            for writer, _ in writers.values():
+                writer.close()
+        # Files are only read once listed in the manifest
+        for month, (_, path) in writers.items():
+            os.replace(path + ".tmp", path)
+
+        for month, rows in written.items():
+            entry = manifest["months"].setdefault(month, {"files": [], "rows": 0})
+            entry["files"].append(os.path.relpath(writers[month][1], self.directory))
+            entry["rows"] += rows
+        manifest.update(horizon=horizon.isoformat(), through_id=through_id,
+                        updated_at=datetime.now(timezone.utc).isoformat())
+        self._write_manifest(manifest)
+        archived = sum(written.values())
+        archived_rows.labels("exported").inc(archived)
+        logger.info("Archived %d calls before %s", archived, horizon.date())
+        return {"horizon": horizon.isoformat(), "through_id": through_id,
+                "archived": archived, "months": sorted(written)}
+
+    @staticmethod
+    def _committed_through(db: Session) -> int:
+        """The highest call id, once no lower id can still be committed."""
+        if engine.dialect.name == "postgresql":
+            # Ids are taken at insert, not at commit: a transaction still open
+            # can commit an id below ones already visible. SHARE mode waits
+            # for open writes to call_logs to finish, and holds new ones back
+            # only until this transaction ends.
+            db.execute(text(f"SET LOCAL lock_timeout = {ARCHIVE_LOCK_TIMEOUT_MS}"))
+            db.execute(text("LOCK TABLE call_logs IN SHARE MODE"))
+        # SQLite has one writer at a time, and it takes ids above the highest
+        through_id = db.execute(select(func.max(CallLog.id))).scalar() or 0
+        db.commit()
+        return through_id
+
+    def _write(self, writers: dict, month: str, rows: list, through_id: int):
+        if month not in writers:
+            directory = os.path.join(self.directory, "call_logs", f"month={month}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"through-{through_id}.parquet")
+            writers[month] = (parquet.ParquetWriter(path + ".tmp", SCHEMA), path)
+        columns = list(zip(*rows))
+        writers[month][0].write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(column, field.type) for column, field in zip(columns, SCHEMA)],
+            schema=SCHEMA))
+
+    def _write_manifest(self, manifest: dict):
+        path = os.path.join(self.directory, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    def prune(self, db: Session) -> int:
+        """Delete archived calls from call_logs, a batch per transaction; returns how many."""
+        if not ARCHIVE_ALLOW_PRUNE:
+            raise RuntimeError(
+                "Pruning would leave all-time totals counting only call_logs: "
+                "set ARCHIVE_ALLOW_PRUNE=true to accept that")
+        snapshot = self.snapshot() if self.enabled else None
+        if snapshot is None:
+            return 0
+        pruned = 0
+        while True:
+            ids = db.execute(select(CallLog.id).where(snapshot.archived())
+                             .limit(ARCHIVE_BATCH_ROWS)).scalars().all()
+            if not ids:
+                return pruned
+            db.execute(delete(CallLog).where(CallLog.id.in_(ids)))
+            mark_changed(db, "calls")
+            db.commit()
+            pruned += len(ids)
+            archived_rows.labels("pruned").inc(len(ids))
+
+    def status(self) -> dict:
+        manifest = self._read_manifest() if self.directory else None
+        months = (manifest or {}).get("months", {})
+        return {
+            "enabled": self.enabled,
+            "writable": bool(self.directory) and pyarrow is not None,
+            "horizon": (manifest or {}).get("horizon"),
+            "through_id": (manifest or {}).get("through_id"),
+            "updated_at": (manifest or {}).get("updated_at"),
+            "months": [{
+                "month": month,
+                "rows": entry["rows"],
+                "files": len(entry["files"]),
+                "bytes": sum(os.path.getsize(os.path.join(self.directory, file))
+                             for file in entry["files"]),
+            } for month, entry in sorted(months.items())],
+        }
+
+
+store = Archive(ARCHIVE_DIR)
+
+
+def archive_closed_months(db: Session) -> dict:
+    """The scheduled job: export the months that left the hot horizon."""
+    return store.export(db)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive closed months of call_logs to Parquet.")
+    parser.add_argument("--prune", action="store_true",
+                        help="Then delete the archived calls from call_logs")
+    args = parser.parse_args(argv)
+    if not ARCHIVE_DIR:
+        sys.exit("Set ARCHIVE_DIR to the archive's directory")
+
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        try:
+            result = store.export(db)
+        except RuntimeError as e:
+            sys.exit(str(e))
+        print(f"Archived {result['archived']} calls before {result['horizon']}")
+        if args.prune:
+            if not store.enabled:
+                sys.exit("Pruning needs duckdb, to read the archived calls back")
+            try:
+                pruned = store.prune(db)
+            except RuntimeError as e:
+                sys.exit(str(e))
+            print(f"Deleted {pruned} archived calls from call_logs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Fingerprinted, precompressed static assets.
+
+At startup every file under app/static is copied to ASSETS_DIR under a name
+that includes a hash of its content (css/style.css -> css/style.3f9a0c1e2b4d.css),
+next to a gzip and, when the brotli package is installed, a brotli copy.
+Templates link them with {{ asset_url("css/style.css") }}. /assets serves
+them with a year-long immutable Cache-Control, and the precompressed copy
+the browser accepts, so a page load only fetches an asset again after a
+deploy that changed it.
+
+`python -m app.assets` builds them ahead of time, e.g. in an image build.
+With ENVIRONMENT=development, asset_url points at the plain /static files,
+which browsers revalidate on every load.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+
+from starlette.exceptions import HTTPException
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # Assets are then only precompressed with gzip
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+# Built assets are named by content, so workers and restarts can share them
+ASSETS_DIR = os.getenv(
+    "ASSETS_DIR", os.path.join(tempfile.gettempdir(), "transfer_rate_app_assets"))
+ASSETS_URL = "/assets"
+DEVELOPMENT = os.getenv("ENVIRONMENT") == "development"
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Small files gain little from compression
+MIN_COMPRESS_SIZE = 512
+# Dynamic responses (HTML, JSON) are gzipped on the fly from this size
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Content coding -> suffix of the precompressed copy, most preferred first
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+# Path under app/static -> fingerprinted path under ASSETS_DIR
+manifest: dict = {}
+
+
+def _write(path: str, data: bytes, replace: bool = False):
+    # Into a temporary file first, so that a worker never serves a half-written
+    # file another worker is still building
+    if os.path.exists(path) and not replace:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    os.chmod(temporary, 0o644)
+    os.replace(temporary, path)
+
+
+def build(source: str = STATIC_DIR, target: str = ASSETS_DIR) -> dict:
+    """Fingerprint and precompress every file under source into target."""
+    built = {}
+    os.makedirs(target, exist_ok=True)
+    for directory, _, files in os.walk(source):
+        for filename in sorted(files):
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, source).replace(os.sep, "/")
+            with open(path, "rb") as file:
+                data = file.read()
+            stem, extension = os.path.splitext(name)
+            fingerprinted = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+            output = os.path.join(target, fingerprinted)
+            _write(output, data)
+            if len(data) >= MIN_COMPRESS_SIZE:
+                _write(output + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _write(output + ".br", brotli.compress(data, quality=11))
+            built[name] = fingerprinted
+    _write(os.path.join(target, "manifest.json"),
+           json.dumps(built, indent=2, sort_keys=True).encode(), replace=True)
+    manifest.clear()
+    manifest.update(built)
+    return built
+
+
+def asset_url(name: str) -> str:
+    """URL of a file under app/static, fingerprinted outside development."""
+    name = name.lstrip("/")
+    if DEVELOPMENT or name not in manifest:
+        return f"/static/{name}"
+    return f"{ASSETS_URL}/{manifest[name]}"
+
+
+class AssetFiles(StaticFiles):
+    """Serves built assets: long-cached, brotli or gzip copy when accepted."""
+
+    async def get_response(self, path: str, scope) -> Response:
+        accepted = _accepted_encodings(scope)
+        for encoding, suffix in PRECOMPRESSED:
+            if encoding not in accepted:
+                continue
+            try:
+                response = await super().get_response(path + suffix, scope)
+            except HTTPException:
+                continue
+            response.headers["Content-Encoding"] = encoding
+            response.headers["Content-Type"] = _content_type(path)
+            return _cached(response)
+        return _cached(await super().get_response(path, scope))
+
+
+class DynamicGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware for everything but the built assets, which AssetFiles encodes."""
+
+    def __init__(self, app):
+        super().__init__(app, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(ASSETS_URL + "/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+def _accepted_encodings(scope) -> set:
+    """The precompressed codings Accept-Encoding allows: q above 0, or a "*" that does."""
+    for key, value in scope["headers"]:
+        if key == b"accept-encoding":
+            qualities = {}
+            for part in value.decode("latin-1").split(","):
+                coding, *params = part.split(";")
+                quality = 1.0
+                for param in params:
+                    name, _, number = param.partition("=")
+                    if name.strip().lower() == "q":
+                        try:
+                            quality = float(number)
+                        except ValueError:
+                            # Unreadable, so not a coding to rely on
+                            quality = 0.0
+                qualities[coding.strip().lower()] = quality
+            default = qualities.get("*", 0.0)
+            return {encoding for encoding, _ in PRECOMPRESSED
+                    if qualities.get(encoding, default) > 0}
+    return set()
+
+
+def _content_type(path: str) -> str:
+    # What FileResponse would have sent for the uncompressed file
+    media_type = mimetypes.guess_type(path)[0] or "text/plain"
+    return f"{media_type}; charset=utf-8" if media_type.startswith("text/") else media_type
+
+
+def _cached(response: Response) -> Response:
+    if response.status_code in (200, 304):
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+if __name__ == "__main__":
+    for name, built in sorted(build().items()):
+        print(f"{name} -> {os.path.join(ASSETS_DIR, built)}")
@@ -2,23 +2,44 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status, Request
+from fastapi import Depends, HTTPException, status, Request, Form
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
 from app.models import User, UserRole
 from app.schemas import TokenData
+from app import metrics, ratelimit, sessions
+import hmac
+import logging
+import os
 import secrets
+import time
 
-# Security configuration
-# In production, use environment variable
-SECRET_KEY = secrets.token_urlsafe(32)
+logger = logging.getLogger("app.auth")
+
+# Security configuration. SECRET_KEY must be set when several workers or
+# servers run: tokens signed by one are otherwise rejected by the others.
+SECRET_KEY = os.getenv("SECRET_KEY")
+if not SECRET_KEY:
+    logger.warning("SECRET_KEY is not set; using a random key, tokens end with this process")
+    SECRET_KEY = secrets.token_urlsafe(32)
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Access tokens are renewed from the session's refresh token (app/sessions.py),
+# so they can be short-lived without sending anyone back to /login
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+# Bearer token Prometheus scrapes /metrics with; administrators can read it too
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt and login timings, see /metrics
+password_hash_seconds = metrics.registry.histogram(
+    "app_password_hash_seconds", "Time spent in bcrypt.", ("operation",))
+login_seconds = metrics.registry.histogram(
+    "app_login_seconds", "Credential checks, including the user lookup.", ("outcome",))
+
 # Token scheme (optional for API calls)
 security = HTTPBearer(auto_error=False)
 
@@ -35,12 +56,20 @@ def get_db():
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against its hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+    started = time.perf_counter()
+    try:
+        return pwd_context.verify(plain_password, hashed_password)
+    finally:
+        password_hash_seconds.labels("verify").observe(time.perf_counter() - started)
 
 
 def get_password_hash(password: str) -> str:
     """Generate password hash."""
-    return pwd_context.hash(password)
+    started = time.perf_counter()
+    try:
+        return pwd_context.hash(password)
+    finally:
+        password_hash_seconds.labels("hash").observe(time.perf_counter() - started)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -62,22 +91,80 @@ def verify_token(token: str, credentials_exception):
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
+        token_data = TokenData(username=username, session_id=payload.get("sid"))
         return token_data
     except JWTError:
         raise credentials_exception
 
 
+def create_session_tokens(db: Session, user: User) -> tuple[str, str]:
+    """Start a session for a password login; returns (access token, refresh token)."""
+    # Read before create_session() commits, which expires the user
+    user_id, username = user.id, user.username
+    session_id, refresh_token = sessions.create_session(db, user_id)
+    return create_access_token(data={"sub": username, "sid": session_id}), refresh_token
+
+
+def refresh_access_token(db: Session, refresh_token: str) -> Optional[tuple[User, str, Optional[str]]]:
+    """Renew the access token of a session without the password.
+
+    Returns (user, access token, new refresh token or None), or None when the
+    session is over or the user was deactivated.
+    """
+    result = sessions.refresh(db, refresh_token)
+    if result is None:
+        return None
+    session_id, user_id, new_refresh_token = result
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is None or not user.is_active:
+        return None
+    access_token = create_access_token(data={"sub": user.username, "sid": session_id})
+    return user, access_token, new_refresh_token
+
+
+def _user_from_refresh_cookie(request: Request, db: Session) -> Optional[User]:
+    # The access cookie is missing or expired: renew it from the refresh
+    # cookie. SessionCookieMiddleware sets the new cookies on the response.
+    refresh_token = request.cookies.get(sessions.REFRESH_COOKIE)
+    if not refresh_token:
+        return None
+    renewed = refresh_access_token(db, refresh_token)
+    if renewed is None:
+        return None
+    user, access_token, new_refresh_token = renewed
+    request.state.session_cookies = (access_token, new_refresh_token)
+    return user
+
+
+# Runs on every authenticated request. Built once, so each call only binds
+# the username and finds the compiled SQL in SQLAlchemy's cache.
+USER_BY_USERNAME = select(User).where(User.username == bindparam("username")).limit(1)
+
+
+def _user_from_token(token_data: TokenData, db: Session) -> Optional[User]:
+    # Tokens without a session (temporary password-change tokens) and tokens
+    # of revoked sessions are not accepted here
+    if token_data.session_id is None or not sessions.is_active(db, token_data.session_id):
+        return None
+    return db.execute(USER_BY_USERNAME, {"username": token_data.username}).scalars().first()
+
+
 def authenticate_user(db: Session, username: str, password: str):
     """Authenticate user credentials."""
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        return False
-    if not verify_password(password, user.hashed_password):
-        return False
-    if not user.is_active:
-        return False
-    return user
+    started = time.perf_counter()
+    outcome = "failure"
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        if not user:
+            return False
+        if not verify_password(password, user.hashed_password):
+            return False
+        if not user.is_active:
+            return False
+        outcome = "success"
+        return user
+    finally:
+        login_seconds.labels(outcome).observe(time.perf_counter() - started)
 
 
 def get_current_user(
@@ -103,16 +190,36 @@ def get_current_user(
         if cookie_token and cookie_token.startswith("Bearer "):
             token = cookie_token[7:]  # Remove "Bearer " prefix
 
-    if not token:
-        raise credentials_exception
-
-    token_data = verify_token(token, credentials_exception)
-    user = db.query(User).filter(User.username == token_data.username).first()
+    token_data = None
+    if token:
+        try:
+            token_data = verify_token(token, credentials_exception)
+        except HTTPException:
+            if credentials:
+                raise
+
+    if token_data is not None:
+        ratelimit.enforce_route(request, token_data.username)
+        user = _user_from_token(token_data, db)
+    elif not credentials:
+        user = _user_from_refresh_cookie(request, db)
+        if user is not None:
+            ratelimit.enforce_route(request, user.username)
+    else:
+        user = None
     if user is None:
         raise credentials_exception
     return user
 
 
+def limit_login_attempts(request: Request, username: str = Form(...)):
+    """Rate limit logins by client IP and by attempted user name from that IP."""
+    ip = ratelimit.client_ip(request)
+    if not ratelimit.login_ip_exempt(ip):
+        ratelimit.enforce("login_ip", ip)
+    ratelimit.enforce("login_user", f"{username.strip().lower()}@{ip}")
+
+
 def get_current_active_user(current_user: User = Depends(get_current_user)):
     """Get current active user."""
     if not current_user.is_active:
@@ -130,6 +237,19 @@ def get_current_admin_user(current_user: User = Depends(get_current_active_user)
     return current_user
 
 
+def get_metrics_reader(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """Allow METRICS_TOKEN as a bearer token, otherwise require an administrator."""
+    if METRICS_TOKEN and credentials and hmac.compare_digest(
+            credentials.credentials.encode(), METRICS_TOKEN.encode()):
+        return None
+    return get_current_admin_user(get_current_active_user(
+        get_current_user(request, credentials, db)))
+
+
 def generate_temp_password(length: int = 12) -> str:
     """Generate a temporary password for new users."""
     import string
@@ -159,20 +279,29 @@ def get_current_user_web(
         if cookie_token and cookie_token.startswith("Bearer "):
             token = cookie_token[7:]  # Remove "Bearer " prefix
 
-        if not token:
-            # For web pages, redirect to login instead of returning 401
-            from fastapi.responses import RedirectResponse
-            return RedirectResponse(url="/login", status_code=302)
-
-        token_data = verify_token(token, credentials_exception)
-        user = db.query(User).filter(
-            User.username == token_data.username).first()
+        token_data = None
+        if token:
+            try:
+                token_data = verify_token(token, credentials_exception)
+            except HTTPException:
+                pass
+
+        if token_data is not None:
+            ratelimit.enforce_route(request, token_data.username)
+            user = _user_from_token(token_data, db)
+        else:
+            # No access token or an expired one; renew it transparently
+            user = _user_from_refresh_cookie(request, db)
+            if user is not None:
+                ratelimit.enforce_route(request, user.username)
         if user is None or not user.is_active:
             # For web pages, redirect to login instead of returning 401
             from fastapi.responses import RedirectResponse
             return RedirectResponse(url="/login", status_code=302)
 
         return user
+    except ratelimit.RateLimited:
+        raise
     except:
         # For web pages, redirect to login instead of returning 401
         from fastapi.responses import RedirectResponse
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import re
+import time
+
+from starlette.responses import JSONResponse
+
+from app import metrics
+
+# Requests are split into route classes, each with its own concurrency limit
+# and wait queue, so a burst in one class (a year of analytics, a big export)
+# cannot take the threads and connections another class needs. Every request
+# uses one pooled connection, so keep the sum of the limits at or below the
+# connection pool (pool_size + max_overflow in database.py, 30) and the
+# threadpool (40), leaving one connection for the group-commit writer.
+BULKHEADS_ENABLED = os.getenv("BULKHEADS_ENABLED", "true").lower() == "true"
+
+# class: (concurrent requests, queued requests, max queue wait in ms)
+DEFAULT_LIMITS = {
+    "ingestion": (10, 200, 2000),
+    "agent": (8, 100, 3000),
+    "auth": (4, 100, 5000),
+    "admin": (4, 50, 5000),
+    "analytics": (3, 10, 1000),
+}
+
+# First match wins: (method or None for any, path pattern, class). Requests
+# that match nothing (static files, /metrics) are not limited.
+ROUTE_CLASSES = [
+    ("POST", re.compile(r"^/calls/?$"), "ingestion"),
+    ("DELETE", re.compile(r"^/calls/\d+$"), "ingestion"),
+    ("POST", re.compile(r"^/cti/calls$"), "ingestion"),
+    ("GET", re.compile(r"^/admin/analytics/"), "analytics"),
+    ("GET", re.compile(r"^/admin/users/\d+/(details|lists)$"), "analytics"),
+    ("GET", re.compile(r"^/admin/lists/\d+/(details|calls)$"), "analytics"),
+    (None, re.compile(r"^/admin(/|$)"), "admin"),
+    (None, re.compile(r"^/(login|logout|token|change-password|init|init-admin)$"), "auth"),
+    (None, re.compile(r"^/(log-lists/.*)?$"), "agent"),
+]
+
+active_requests = metrics.registry.gauge(
+    "app_bulkhead_active", "Requests running per route class.", ("route_class",))
+queued_requests = metrics.registry.gauge(
+    "app_bulkhead_queued", "Requests waiting for a slot per route class.", ("route_class",))
+queue_wait_seconds = metrics.registry.histogram(
+    "app_bulkhead_queue_wait_seconds", "Time requests waited for a slot.", ("route_class",))
+rejected_requests = metrics.registry.counter(
+    "app_bulkhead_rejected_total", "Requests rejected because their class was saturated.",
+    ("route_class", "reason"))
+
+
+class BulkheadFull(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Bulkhead:
+    """Concurrency limit with a bounded, time-limited wait queue."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, timeout_ms: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout_ms / 1000
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+        self._active = active_requests.labels(name)
+        self._queued = queued_requests.labels(name)
+        self._wait = queue_wait_seconds.labels(name)
+
+    async def acquire(self):
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                rejected_requests.labels(self.name, "queue_full").inc()
+                raise BulkheadFull("queue_full")
+            self.waiting += 1
+            self._queued.inc()
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                rejected_requests.labels(self.name, "timeout").inc()
+                raise BulkheadFull("timeout") from None
+            finally:
+                self.waiting -= 1
+                self._queued.dec()
+                self._wait.observe(time.perf_counter() - started)
+        self._active.inc()
+
+    def release(self):
+        self._active.dec()
+        self._semaphore.release()
+
+
+def _env_limits(name: str, defaults: tuple) -> tuple:
+    prefix = f"BULKHEAD_{name.upper()}_"
+    limit, queue, timeout_ms = defaults
+    return (int(os.getenv(prefix + "LIMIT", limit)),
+            int(os.getenv(prefix + "QUEUE", queue)),
+            float(os.getenv(prefix + "TIMEOUT_MS", timeout_ms)))
+
+
+bulkheads = {name: Bulkhead(name, *_env_limits(name, defaults))
+             for name, defaults in DEFAULT_LIMITS.items()}
+
+
+def route_class(method: str, path: str):
+    for rule_method, pattern, name in ROUTE_CLASSES:
+        if (rule_method is None or rule_method == method) and pattern.match(path):
+            return name
+    return None
+
+
+class BulkheadMiddleware:
+    """Run each request inside its route class's bulkhead.
+
+    A saturated class answers 503 with Retry-After right away (queue full)
+    or after its queue timeout, instead of letting requests pile up.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not BULKHEADS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        bulkhead = bulkheads[name]
+        try:
+            await bulkhead.acquire()
+        except BulkheadFull:
+            response = JSONResponse(
+                {"detail": "Server busy, please retry"}, status_code=503,
+                headers={"Retry-After": "1"})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bulkhead.release()
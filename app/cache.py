@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from sqlalchemy import event
+
+
+class DataVersions:
+    """Per-topic counters bumped whenever the underlying data changes.
+
+    Caches key their entries by the versions of the data they were built from,
+    so a write anywhere in this process invalidates them without having to
+    find the affected entries. Topics are "users", "lists" and "calls".
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, topic: str) -> int:
+        return self._versions.get(topic, 0)
+
+    def bump(self, *topics: str):
+        with self._lock:
+            for topic in topics:
+                self._versions[topic] = self._versions.get(topic, 0) + 1
+
+
+versions = DataVersions()
+
+# Which version topic each table's rows belong to
+TOPICS_BY_TABLE = {
+    "users": "users",
+    "log_lists": "lists",
+    "call_logs": "calls",
+}
+
+
+def _topics_for_mapper(mapper) -> set:
+    if mapper is None:
+        return set()
+    topic = TOPICS_BY_TABLE.get(mapper.persist_selectable.name)
+    return {topic} if topic else set()
+
+
+def mark_changed(session, *topics: str):
+    """Bump topics when session commits, for changes the ORM does not see.
+
+    E.g. rows removed by ON DELETE CASCADE. Like ORM changes, they are
+    bumped once per commit and dropped on rollback.
+    """
+    session.info.setdefault("changed_topics", set()).update(topics)
+
+
+def track_session_changes(session_factory):
+    """Bump data versions after commits that changed rows through the ORM."""
+
+    @event.listens_for(session_factory, "after_flush")
+    def collect_flushed(session, flush_context):
+        changed = session.info.setdefault("changed_topics", set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            topic = TOPICS_BY_TABLE.get(getattr(obj, "__tablename__", None))
+            if topic:
+                changed.add(topic)
+
+    @event.listens_for(session_factory, "do_orm_execute")
+    def collect_bulk(orm_execute_state):
+        # query(...).update()/.delete() skip the flush
+        if orm_execute_state.is_update or orm_execute_state.is_delete or \
+                orm_execute_state.is_insert:
+            changed = orm_execute_state.session.info.setdefault("changed_topics", set())
+            changed |= _topics_for_mapper(orm_execute_state.bind_mapper)
+
+    @event.listens_for(session_factory, "after_commit")
+    def bump_versions(session):
+        changed = session.info.pop("changed_topics", None)
+        if changed:
+            versions.bump(*changed)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def discard_changes(session):
+        session.info.pop("changed_topics", None)
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed TTL."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,84 @@
+"""Request coalescing: concurrent identical reads share one computation.
+
+At shift start many admins open the same dashboard at once, and each request
+used to run the same SQL. The admin dashboard, user details and analytics
+routes in app/main.py instead call their read through a SingleFlight keyed
+by its parameters, from FastAPI's worker threads. COALESCE_ENABLED=false
+turns it off.
+"""
+import os
+import threading
+from concurrent.futures import Future
+
+from app import metrics
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+
+coalesce_calls = metrics.registry.counter(
+    "app_coalesce_calls_total",
+    "Coalesced computations: 'leader' ran it, 'merged' shared a leader's result.",
+    ("flight", "result"))
+coalesce_in_flight = metrics.registry.gauge(
+    "app_coalesce_in_flight", "Computations currently running per flight.", ("flight",))
+
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent identical callers.
+
+    The first caller for a key (the leader) runs the computation; callers
+    that arrive while it is running wait for and return the same result, or
+    raise the same exception. Nothing is kept once the leader finishes, so
+    this never serves stale data. Callers block, so call it from worker
+    threads, not the event loop.
+
+    Results are shared, so callers must not modify them. Exceptions listed
+    in retry_on are the leader's own business (its client went away), so
+    waiting callers run the computation again instead of failing with it.
+    """
+
+    def __init__(self, name: str, retry_on: tuple = ()):
+        self.name = name
+        self.retry_on = retry_on
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._leaders = coalesce_calls.labels(name, "leader")
+        self._merged = coalesce_calls.labels(name, "merged")
+        self._in_flight = coalesce_in_flight.labels(name)
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._merged.inc()
+                return future, False
+            future = self._calls[key] = Future()
+        self._leaders.inc()
+        self._in_flight.inc()
+        return future, True
+
+    def _finish(self, key, future, result=None, exc=None):
+        with self._lock:
+            del self._calls[key]
+        self._in_flight.dec()
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) unless an identical call is in flight."""
+        if not COALESCE_ENABLED:
+            return fn(*args, **kwargs)
+        future, leader = self._join(key)
+        while not leader:
+            try:
+                return future.result()
+            except self.retry_on:
+                future, leader = self._join(key)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            self._finish(key, future, exc=exc)
+            raise
+        self._finish(key, future, result)
+        return result
@@ -1,8 +1,10 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from app.models import User, LogList, CallLog, UserRole
+from sqlalchemy import case, delete, distinct, func, or_, select, update
+from app.models import User, LogList, CallLog, UserRole, UserSession
 from app.schemas import UserCreate, UserUpdate
 from app.auth import get_password_hash, generate_temp_password
+from app import readmodels, sessions
+from app.cache import mark_changed
 from typing import List, Optional
 
 
@@ -41,6 +43,7 @@ def create_user(db: Session, user: UserCreate, created_by_id: int,
         name=user.name,
         hashed_password=hashed_password,
         role=user.role,
+        external_id=user.external_id,
         created_by_id=created_by_id,
         # Force password change if temp password was generated
         must_change_password=is_temp_password
@@ -65,6 +68,8 @@ def update_user(db: Session, user_id: int, user_update: UserUpdate) -> Optional[
 
     for field, value in update_data.items():
         setattr(db_user, field, value)
+    if update_data.get("is_active") is False:
+        sessions.revoke_user_sessions(db, user_id)
 
     db.commit()
     db.refresh(db_user)
@@ -78,6 +83,7 @@ def deactivate_user(db: Session, user_id: int) -> Optional[User]:
         return None
 
     db_user.is_active = False
+    sessions.revoke_user_sessions(db, user_id)
     db.commit()
     db.refresh(db_user)
     return db_user
@@ -126,6 +132,8 @@ def reset_user_password(db: Session, user_id: int) -> tuple[Optional[User], str]
     temp_password = generate_temp_password()
     db_user.hashed_password = get_password_hash(temp_password)
     db_user.must_change_password = True  # Force password change on next login
+    # Log out everywhere; whoever knew the old password stays logged out
+    sessions.revoke_user_sessions(db, user_id)
 
     db.commit()
     db.refresh(db_user)
@@ -163,111 +171,139 @@ def delete_user(db: Session, user_id: int) -> bool:
     # Delete all log lists owned by the user (this will cascade to call logs)
     db.query(LogList).filter(LogList.owner_id == user_id).delete()
 
+    sessions.revoke_user_sessions(db, user_id)
+    db.query(UserSession).filter(UserSession.user_id == user_id).delete()
+
     # Delete the user
     db.delete(db_user)
     db.commit()
     return True
 
 
-def get_user_transfer_rate(db: Session, user_id: int, potential_sale_call_types: set) -> dict:
-    """Calculate transfer rate for a specific user across all their log lists."""
-    # Get all log lists for the user
-    user_log_lists = db.query(LogList).filter(
-        LogList.owner_id == user_id).all()
+def set_users_active(db: Session, user_ids: List[int], is_active: bool) -> int:
+    """Activate or deactivate many users in one statement; returns how many changed."""
+    result = db.execute(
+        update(User)
+        .where(User.id.in_(user_ids), User.is_active.is_not(is_active))
+        .values(is_active=is_active)
+        .execution_options(synchronize_session=False))
+    if not is_active:
+        sessions.revoke_user_sessions(db, *user_ids)
+    db.commit()
+    return result.rowcount
+
+
+def reassign_log_lists(db: Session, from_user_id: int, to_user_id: int) -> int:
+    """Give all of a user's log lists, calls included, to another user.
+
+    Only an active agent (role USER) can take them; raises ValueError otherwise.
+    """
+    # Locked, so the target cannot be deactivated or promoted meanwhile
+    target = db.execute(
+        select(User.id)
+        .where(User.id == to_user_id, User.role == UserRole.USER, User.is_active.is_(True))
+        .with_for_update()).first()
+    if target is None:
+        db.rollback()
+        raise ValueError("Lists can only be reassigned to an active agent")
+    result = db.execute(
+        update(LogList)
+        .where(LogList.owner_id == from_user_id)
+        .values(owner_id=to_user_id)
+        .execution_options(synchronize_session=False))
+    # Calls carry a copy of their list's owner
+    db.execute(
+        update(CallLog)
+        .where(CallLog.owner_id == from_user_id)
+        .values(owner_id=to_user_id)
+        .execution_options(synchronize_session=False))
+    db.commit()
+    return result.rowcount
+
 
-    total_calls = 0
-    potential_calls = 0
+def count_user_data(db: Session, user_id: int) -> tuple[int, int]:
+    """(log lists, call logs) owned by a user, in one query."""
+    return tuple(db.execute(
+        select(func.count(distinct(LogList.id)), func.count(CallLog.id))
+        .select_from(LogList)
+        .outerjoin(CallLog, CallLog.log_list_id == LogList.id)
+        .where(LogList.owner_id == user_id)).one())
 
-    for log_list in user_log_lists:
-        # Get all calls for this log list
-        calls = db.query(CallLog).filter(
-            CallLog.log_list_id == log_list.id).all()
-        total_calls += len(calls)
-        potential_calls += len(
-            [c for c in calls if c.call_type in potential_sale_call_types])
 
-    transfer_rate = (potential_calls / total_calls) * \
-        100 if total_calls > 0 else 0
+def purge_user(db: Session, user_id: int) -> tuple[int, int]:
+    """Delete a user with all their log lists and calls; returns what was deleted.
 
+    One DELETE: the database removes the lists, calls and sessions through
+    ON DELETE CASCADE, without loading them.
+    """
+    counts = count_user_data(db, user_id)
+    db.execute(delete(User).where(User.id == user_id)
+               .execution_options(synchronize_session=False))
+    mark_changed(db, "lists", "calls")
+    db.commit()
+    return counts
+
+
+def get_transfer_rates(db: Session, user_ids: List[int]) -> dict:
+    """Transfer rate stats for several users at once, keyed by user ID.
+
+    Reads call_logs alone: the owner and the potential-sale flag are stored
+    on each call, so the (owner_id, timestamp, is_potential) index covers
+    the aggregate.
+    """
+    list_counts = dict(db.execute(
+        select(LogList.owner_id, func.count(LogList.id))
+        .where(LogList.owner_id.in_(user_ids))
+        .group_by(LogList.owner_id)).all())
+    calls = {owner_id: (total, potential or 0) for owner_id, total, potential in db.execute(
+        select(CallLog.owner_id, func.count(CallLog.id),
+               func.sum(case((CallLog.is_potential, 1), else_=0)))
+        .where(CallLog.owner_id.in_(user_ids))
+        .group_by(CallLog.owner_id))}
+    return {user_id: _transfer_rate(*calls.get(user_id, (0, 0)), list_counts.get(user_id, 0))
+            for user_id in user_ids}
+
+
+def _transfer_rate(total_calls: int, potential_calls: int, log_lists_count: int) -> dict:
     return {
         "total_calls": total_calls,
         "potential_calls": potential_calls,
-        "transfer_rate": round(transfer_rate, 2),
-        "log_lists_count": len(user_log_lists)
+        "transfer_rate": readmodels.transfer_rate(total_calls, potential_calls),
+        "log_lists_count": log_lists_count
     }
 
 
-def get_all_log_lists_with_stats(db: Session, potential_sale_call_types: set) -> List[dict]:
+def get_user_transfer_rate(db: Session, user_id: int) -> dict:
+    """Calculate transfer rate for a specific user across all their log lists."""
+    return get_transfer_rates(db, [user_id])[user_id]
+
+
+def get_all_log_lists_with_stats(db: Session) -> List[dict]:
     """Get all log lists with their statistics for administrator view."""
-    log_lists = db.query(LogList).all()
-    result = []
-
-    for log_list in log_lists:
-        # Get calls for this log list
-        calls = db.query(CallLog).filter(
-            CallLog.log_list_id == log_list.id).all()
-        total_calls = len(calls)
-        potential_calls = len(
-            [c for c in calls if c.call_type in potential_sale_call_types])
-        transfer_rate = (potential_calls / total_calls) * \
-            100 if total_calls > 0 else 0
-
-        # Get owner info
-        owner = db.query(User).filter(User.id == log_list.owner_id).first()
-
-        result.append({
-            "id": log_list.id,
-            "name": log_list.name,
-            "owner_username": owner.username if owner else "Unknown",
-            "owner_name": owner.name if owner else "Unknown",
-            "owner_id": log_list.owner_id,
-            "created_at": log_list.created_at,
-            "total_calls": total_calls,
-            "potential_calls": potential_calls,
-            "transfer_rate": round(transfer_rate, 2),
-            "latest_call": calls[0].timestamp if calls else None
-        })
-
-    return result
-
-
-def get_user_log_lists_with_calls(db: Session, user_id: int, potential_sale_call_types: set) -> List[dict]:
-    """Get all log lists for a specific user with detailed call information."""
-    log_lists = db.query(LogList).filter(LogList.owner_id == user_id).all()
-    result = []
-
-    for log_list in log_lists:
-        # Get all calls for this log list, ordered by most recent first
-        calls = db.query(CallLog).filter(
-            CallLog.log_list_id == log_list.id
-        ).order_by(CallLog.timestamp.desc()).all()
-
-        total_calls = len(calls)
-        potential_calls = len(
-            [c for c in calls if c.call_type in potential_sale_call_types])
-        transfer_rate = (potential_calls / total_calls) * \
-            100 if total_calls > 0 else 0
-
-        # Format calls for frontend
-        calls_data = []
-        for call in calls:
-            calls_data.append({
-                "id": call.id,
-                "call_type": call.call_type,
-                "timestamp": call.timestamp.isoformat() if call.timestamp else None,
-                "is_potential_sale": call.call_type in potential_sale_call_types
-            })
-
-        result.append({
-            "id": log_list.id,
-            "name": log_list.name,
-            "total_calls": total_calls,
-            "potential_calls": potential_calls,
-            "transfer_rate": round(transfer_rate, 2),
-            "calls": calls_data
-        })
-
-    return result
+    return [{
+        "id": stats.id,
+        "name": stats.name,
+        "owner_username": stats.owner_username or "Unknown",
+        "owner_name": stats.owner_name or "Unknown",
+        "owner_id": stats.owner_id,
+        "created_at": stats.created_at,
+        "total_calls": stats.total_calls,
+        "potential_calls": stats.potential_calls,
+        "transfer_rate": stats.transfer_rate,
+        "latest_call": stats.latest_call
+    } for stats in readmodels.list_stats(db)]
+
+
+def get_user_log_list_summaries(db: Session, user_id: int) -> List[dict]:
+    """Get a user's log lists with their statistics, without the calls."""
+    return [{
+        "id": stats.id,
+        "name": stats.name,
+        "total_calls": stats.total_calls,
+        "potential_calls": stats.potential_calls,
+        "transfer_rate": stats.transfer_rate,
+        "latest_call": stats.latest_call.isoformat() if stats.latest_call else None
+    } for stats in readmodels.list_stats(db, user_id)]
 
 
 def update_user_password(db: Session, user_id: int, new_password: str) -> bool:
@@ -278,6 +314,7 @@ def update_user_password(db: Session, user_id: int, new_password: str) -> bool:
 
     db_user.hashed_password = get_password_hash(new_password)
     db_user.must_change_password = False
+    sessions.revoke_user_sessions(db, user_id)
 
     db.commit()
     db.refresh(db_user)
@@ -0,0 +1,298 @@
+"""Call ingestion from the phone system (CTI).
+
+The phone system pushes call dispositions in batches to POST /cti/calls.
+Requests are authenticated with API keys that are derived from
+CTI_SIGNING_SECRET, so verifying them needs no database lookup:
+
+    api secret = base64url(HMAC-SHA256(CTI_SIGNING_SECRET, "cti-key:" + key id))
+
+Each request carries the key id, a unix timestamp and a signature of the
+body made with the api secret:
+
+    X-CTI-Key: pbx-main
+    X-CTI-Timestamp: 1718000000
+    X-CTI-Signature: hex(HMAC-SHA256(api secret, timestamp + "." + body))
+
+Issue the api secret for a key id with:
+
+    python -m app.cti issue-key pbx-main
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+from datetime import timezone
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.orm import Session
+
+from app import metrics
+from app.leaderboard import board
+from app.models import CALL_TYPES, CallLog, LogList, User, UserRole
+from app.schemas import CTICallEvent
+
+try:
+    import msgpack
+except ImportError:  # msgpack bodies are optional, NDJSON always works
+    msgpack = None
+
+CTI_SIGNING_SECRET = os.getenv("CTI_SIGNING_SECRET", "")
+# Key ids that must no longer be accepted, comma-separated
+CTI_REVOKED_KEYS = {k.strip() for k in os.getenv("CTI_REVOKED_KEYS", "").split(",") if k.strip()}
+# Signed requests older (or newer) than this are rejected as replays
+CTI_MAX_CLOCK_SKEW = int(os.getenv("CTI_MAX_CLOCK_SKEW", "300"))
+CTI_MAX_BATCH_EVENTS = int(os.getenv("CTI_MAX_BATCH_EVENTS", "10000"))
+CTI_MAX_BODY_BYTES = int(os.getenv("CTI_MAX_BODY_BYTES", str(5 * 1024 * 1024)))
+
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+MSGPACK_TYPES = {"application/msgpack", "application/x-msgpack"}
+
+events_total = metrics.registry.counter(
+    "app_cti_events_total", "Call events received from the phone system.", ("result",))
+auth_failures = metrics.registry.counter(
+    "app_cti_auth_failures_total", "CTI requests rejected by signature checks.")
+
+
+def derive_api_secret(key_id: str, signing_secret: str = None) -> str:
+    """The api secret of a key id."""
+    signing_secret = signing_secret or CTI_SIGNING_SECRET
+    digest = hmac.new(signing_secret.encode(), f"cti-key:{key_id}".encode(),
+                      hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def sign(api_secret: str, timestamp: str, body: bytes) -> str:
+    """Signature the phone system sends in X-CTI-Signature."""
+    return hmac.new(api_secret.encode(), timestamp.encode() + b"." + body,
+                    hashlib.sha256).hexdigest()
+
+
+def authenticate(headers, body: bytes) -> str:
+    """Check the request signature and return the key id."""
+    if not CTI_SIGNING_SECRET:
+        raise HTTPException(status_code=503, detail="CTI ingestion is not configured")
+
+    def reject(detail):
+        auth_failures.inc()
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+    key_id = headers.get("x-cti-key", "")
+    timestamp = headers.get("x-cti-timestamp", "")
+    signature = headers.get("x-cti-signature", "")
+    if not key_id or not timestamp or not signature:
+        reject("Missing CTI signature headers")
+    if key_id in CTI_REVOKED_KEYS:
+        reject("API key revoked")
+    try:
+        skew = abs(time.time() - int(timestamp))
+    except ValueError:
+        reject("Invalid timestamp")
+    if skew > CTI_MAX_CLOCK_SKEW:
+        reject("Timestamp outside the allowed window")
+
+    expected = sign(derive_api_secret(key_id), timestamp, body)
+    if not hmac.compare_digest(expected, signature):
+        reject("Invalid signature")
+    return key_id
+
+
+def parse_batch(body: bytes, content_type: str):
+    """Decode a batch into (events, errors); events are (index, CTICallEvent)."""
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in MSGPACK_TYPES:
+        if msgpack is None:
+            raise HTTPException(status_code=415, detail="msgpack is not installed on this server")
+        try:
+            records = msgpack.unpackb(body, timestamp=3)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid msgpack body")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="msgpack body must be an array of events")
+    elif media_type in NDJSON_TYPES:
+        records = []
+        for line in body.splitlines():
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    records.append(None)
+    else:
+        raise HTTPException(
+            status_code=415, detail="Send application/x-ndjson or application/msgpack")
+
+    if len(records) > CTI_MAX_BATCH_EVENTS:
+        raise HTTPException(
+            status_code=413, detail=f"At most {CTI_MAX_BATCH_EVENTS} events per batch")
+
+    events = []
+    errors = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append({"index": index, "error": "Not a JSON object"})
+            continue
+        try:
+            event = CTICallEvent.model_validate(record)
+        except ValidationError as exc:
+            error = exc.errors(include_url=False)[0]
+            field = ".".join(str(part) for part in error["loc"])
+            errors.append({"index": index, "error": f"{field}: {error['msg']}"})
+            continue
+        if event.call_type not in CALL_TYPES:
+            errors.append({"index": index, "error": "Invalid call type"})
+            continue
+        events.append((index, event))
+    return events, errors
+
+
+def _insert_ignoring_duplicates(dialect_name: str):
+    """INSERT into call_logs that skips rows whose external_id already exists."""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(CallLog).on_conflict_do_nothing(index_elements=["external_id"])
+
+
+def _resolve_agents(db: Session, events) -> dict:
+    """Map agent usernames and external ids to active agents' user ids."""
+    names = {event.agent for _, event in events}
+    rows = db.execute(
+        select(User.id, User.username, User.external_id)
+        .where(or_(User.username.in_(names), User.external_id.in_(names)),
+               User.role == UserRole.USER, User.is_active.is_(True))
+    ).all()
+    agents = {}
+    for user_id, username, external_id in rows:
+        agents[username] = user_id
+        if external_id:
+            agents[external_id] = user_id
+    return agents
+
+
+def _resolve_lists(db: Session, events, agents: dict) -> dict:
+    """Map (user id, list id or name) to log list ids, creating named lists."""
+    list_ids = {event.list for _, event in events if isinstance(event.list, int)}
+    owner_ids = set(agents.values())
+    lists = {}
+    if list_ids:
+        for list_id, owner_id in db.execute(
+                select(LogList.id, LogList.owner_id).where(LogList.id.in_(list_ids))):
+            lists[(owner_id, list_id)] = list_id
+    names = {event.list for _, event in events if isinstance(event.list, str)}
+    if names:
+        # The oldest list wins if an agent has several with the same name
+        for list_id, owner_id, name in db.execute(
+                select(LogList.id, LogList.owner_id, LogList.name)
+                .where(LogList.owner_id.in_(owner_ids), LogList.name.in_(names))
+                .order_by(LogList.id.desc())):
+            lists[(owner_id, name)] = list_id
+
+    # The phone system may name a campaign before the agent created its list
+    missing = sorted({
+        (agents[event.agent], event.list) for _, event in events
+        if isinstance(event.list, str) and event.agent in agents
+        and (agents[event.agent], event.list) not in lists
+    })
+    if missing:
+        created = db.execute(
+            insert(LogList).returning(LogList.id, LogList.owner_id, LogList.name,
+                                      sort_by_parameter_order=True),
+            [{"owner_id": owner_id, "name": name} for owner_id, name in missing])
+        for list_id, owner_id, name in created:
+            lists[(owner_id, name)] = list_id
+    return lists
+
+
+def ingest(db: Session, events, errors) -> dict:
+    """Bulk-insert a parsed batch, skipping calls that were already stored."""
+    received = len(events) + len(errors)
+    duplicates = 0
+    unique_events = []
+    seen = set()
+    for index, event in events:
+        if event.external_id in seen:
+            duplicates += 1
+            continue
+        seen.add(event.external_id)
+        unique_events.append((index, event))
+
+    rows = []
+    if unique_events:
+        agents = _resolve_agents(db, unique_events)
+        lists = _resolve_lists(db, unique_events, agents)
+        for index, event in unique_events:
+            user_id = agents.get(event.agent)
+            if user_id is None:
+                errors.append({"index": index, "error": "Unknown or inactive agent"})
+                continue
+            list_id = lists.get((user_id, event.list))
+            if list_id is None:
+                errors.append({"index": index, "error": "Log list not found for this agent"})
+                continue
+            row = {"call_type": event.call_type, "log_list_id": list_id,
+                   "owner_id": user_id, "external_id": event.external_id}
+            if event.timestamp is not None:
+                timestamp = event.timestamp
+                if timestamp.tzinfo is None:
+                    timestamp = timestamp.replace(tzinfo=timezone.utc)
+                row["timestamp"] = timestamp
+            rows.append(row)
+
+    inserted = []
+    if rows:
+        # Rows without a timestamp take the server default, which needs a
+        # separate INSERT from rows that bring their own.
+        for group in (
+            [r for r in rows if "timestamp" in r],
+            [r for r in rows if "timestamp" not in r],
+        ):
+            if group:
+                inserted += _insert_calls(db, group)
+        duplicates += len(rows) - len(inserted)
+    db.commit()
+    board.record(inserted)
+
+    events_total.labels("inserted").inc(len(inserted))
+    events_total.labels("duplicate").inc(duplicates)
+    events_total.labels("rejected").inc(len(errors))
+    return {
+        "received": received,
+        "inserted": len(inserted),
+        "duplicates": duplicates,
+        "rejected": len(errors),
+        "errors": sorted(errors, key=lambda e: e["index"]),
+    }
+
+
+def _insert_calls(db: Session, rows) -> list:
+    """Insert calls; returns (id, owner id, timestamp, is potential) of those inserted."""
+    stmt = _insert_ignoring_duplicates(db.get_bind().dialect.name)
+    if stmt is None:
+        # No ON CONFLICT support: skip ids that are already stored
+        existing = set(db.execute(
+            select(CallLog.external_id)
+            .where(CallLog.external_id.in_([r["external_id"] for r in rows]))
+        ).scalars())
+        rows = [r for r in rows if r["external_id"] not in existing]
+        if not rows:
+            return []
+        stmt = insert(CallLog)
+    # RETURNING only yields the rows that were actually inserted
+    return db.execute(stmt.returning(
+        CallLog.id, CallLog.owner_id, CallLog.timestamp, CallLog.is_potential), rows).all()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "issue-key":
+        sys.exit("Usage: python -m app.cti issue-key <key id>")
+    if not CTI_SIGNING_SECRET:
+        sys.exit("CTI_SIGNING_SECRET is not set")
+    print(f"X-CTI-Key:  {sys.argv[2]}")
+    print(f"API secret: {derive_api_secret(sys.argv[2])}")
@@ -1,7 +1,11 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
+from app.instrumentation import InstrumentedQueuePool, install as install_instrumentation
+from app.metrics import instrument_pool
+from app.query_limits import install as install_query_limits
+from app.cache import track_session_changes
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,9 +16,22 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is required")
 
+# Server-side prepared statements. psycopg 3 (postgresql+psycopg://)
+# prepares a statement once it has run this many times on a connection, so
+# the hot queries are parsed and planned once per connection. "off" turns
+# it off, e.g. behind PgBouncer in transaction mode. psycopg2 cannot prepare.
+DB_PREPARE_THRESHOLD = os.getenv("DB_PREPARE_THRESHOLD", "5")
+
+connect_args = {}
+if make_url(DATABASE_URL).get_driver_name() == "psycopg":
+    connect_args["prepare_threshold"] = (
+        None if DB_PREPARE_THRESHOLD.lower() == "off" else int(DB_PREPARE_THRESHOLD))
+
 # Create engine with PostgreSQL settings
 engine = create_engine(
     DATABASE_URL,
+    connect_args=connect_args,
+    poolclass=InstrumentedQueuePool,  # Records connection checkout wait
     pool_pre_ping=True,
     pool_recycle=300,
     pool_size=10,
@@ -22,8 +39,23 @@ engine = create_engine(
     echo=False  # Set to True for SQL query debugging
 )
 
+# Per-statement timing and pool saturation, see app/instrumentation.py
+install_instrumentation(engine)
+instrument_pool(engine)
+# Statement timeouts and cancel-on-disconnect, see app/query_limits.py
+install_query_limits(engine)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _enable_foreign_keys(dbapi_connection, connection_record):
+        # SQLite ignores foreign keys, ON DELETE CASCADE included, unless asked
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Invalidate cached fragments and stats whenever a commit changes data
+track_session_changes(SessionLocal)
+
 Base = declarative_base()
 
 # Function to get database session
@@ -0,0 +1,75 @@
+import asyncio
+import os
+from typing import Optional
+
+from app import metrics
+from app.cache import TTLCache
+
+# Results of calls written with an Idempotency-Key are remembered this long,
+# so retries are answered without touching the database. Older keys are
+# still caught by the unique index on call_logs.idempotency_key.
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_CACHE_TTL = float(os.getenv("IDEMPOTENCY_CACHE_TTL", "600"))
+# Without a key, the same agent logging the same call type into the same list
+# again within this window is treated as a double-click (0 disables)
+CALL_DEDUPE_WINDOW_MS = float(os.getenv("CALL_DEDUPE_WINDOW_MS", "1500"))
+MAX_KEY_LENGTH = 200
+
+duplicates_suppressed = metrics.registry.counter(
+    "app_call_duplicates_suppressed_total",
+    "Call writes answered with an earlier result instead of a new row.", ("reason",))
+
+
+class RecentWrites:
+    """Recent write results by key, including writes still in progress.
+
+    The first request for a key claims it and gets None; it must then
+    resolve() or abandon() the claim. Later requests for the same key get a
+    future with the first request's result. Claims happen on the event loop,
+    so no lock is needed around check-and-claim.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def claim(self, key) -> Optional[asyncio.Future]:
+        existing = self._cache.get(key)
+        if existing is not None:
+            return existing
+        self._cache.set(key, asyncio.get_running_loop().create_future())
+        return None
+
+    def resolve(self, key, result):
+        future = self._cache.get(key)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def abandon(self, key, exc: BaseException):
+        """Forget a failed write; requests waiting on it fail the same way."""
+        future = self._cache.pop(key)
+        if not isinstance(exc, Exception):
+            # Cancelled: the waiters' retry will write the call instead
+            exc = RuntimeError("Original request was cancelled")
+        if future is not None and not future.done():
+            future.set_exception(exc)
+            # Mark the exception as retrieved if nobody was waiting
+            future.exception()
+
+
+idempotent_calls = RecentWrites(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_CACHE_TTL)
+recent_calls = RecentWrites(IDEMPOTENCY_CACHE_SIZE, CALL_DEDUPE_WINDOW_MS / 1000)
+
+
+def call_write_key(user_id: int, idempotency_key: Optional[str], log_list_id: int,
+                   call_type: str):
+    """(registry, key) that identifies duplicates of a call write, or None."""
+    if idempotency_key:
+        return idempotent_calls, scoped_key(user_id, idempotency_key)
+    if CALL_DEDUPE_WINDOW_MS > 0:
+        return recent_calls, (user_id, log_list_id, call_type)
+    return None
+
+
+def scoped_key(user_id: int, idempotency_key: str) -> str:
+    """Stored form of a client key; scoped per user so keys cannot collide."""
+    return f"{user_id}:{idempotency_key}"
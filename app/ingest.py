@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app import metrics
+from app.leaderboard import board
+from app.cache import versions
+from app.database import engine
+from app.idempotency import duplicates_suppressed
+from app.models import CallLog
+
+logger = logging.getLogger("app.ingest")
+
+# Group-commit ingestion for POST /calls/. Off by default: every call is then
+# committed on its own, as before.
+CALL_INGEST_BATCHING = os.getenv("CALL_INGEST_BATCHING", "false").lower() == "true"
+# A batch is written once it has this many rows...
+CALL_INGEST_MAX_BATCH = int(os.getenv("CALL_INGEST_MAX_BATCH", "200"))
+# ...or once its oldest row has waited this long
+CALL_INGEST_FLUSH_MS = float(os.getenv("CALL_INGEST_FLUSH_MS", "5"))
+# Back-pressure: callers wait up to CALL_INGEST_ENQUEUE_TIMEOUT_MS for room in
+# a full queue, then get a 503 so they retry instead of piling up.
+CALL_INGEST_QUEUE_SIZE = int(os.getenv("CALL_INGEST_QUEUE_SIZE", "5000"))
+CALL_INGEST_ENQUEUE_TIMEOUT_MS = float(os.getenv("CALL_INGEST_ENQUEUE_TIMEOUT_MS", "100"))
+
+batch_size = metrics.registry.histogram(
+    "app_ingest_batch_rows", "Rows written per ingestion batch.",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+flush_seconds = metrics.registry.histogram(
+    "app_ingest_flush_seconds", "Time to insert and commit one ingestion batch.")
+ack_seconds = metrics.registry.histogram(
+    "app_ingest_ack_seconds", "Time from enqueueing a call to its batch committing.")
+rejected = metrics.registry.counter(
+    "app_ingest_rejected_total", "Calls rejected because the ingestion queue was full.")
+failed_batches = metrics.registry.counter(
+    "app_ingest_failed_batches_total", "Ingestion batches that could not be committed.")
+
+
+class IngestQueueFull(Exception):
+    """The ingestion queue stayed full for the whole enqueue timeout."""
+
+
+class IngestFailed(Exception):
+    """A queued call could not be written because its log list is gone."""
+
+
+class CallIngestor:
+    """Batches call inserts from many requests into one INSERT and commit.
+
+    Requests put their row on a queue and wait on a future. A single writer
+    task takes everything queued (up to max_batch), writes it with one
+    multi-row INSERT ... RETURNING in a worker thread, and resolves each
+    future with its row's id and timestamp once the transaction commits.
+    """
+
+    def __init__(self, engine, max_batch=CALL_INGEST_MAX_BATCH,
+                 flush_ms=CALL_INGEST_FLUSH_MS, queue_size=CALL_INGEST_QUEUE_SIZE,
+                 enqueue_timeout_ms=CALL_INGEST_ENQUEUE_TIMEOUT_MS):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.flush_interval = flush_ms / 1000
+        self.queue_size = queue_size
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self._queue = None
+        self._task = None
+        self._connection = None
+        metrics.registry.gauge(
+            "app_ingest_queue_depth", "Calls waiting to be written.",
+            callback=lambda: self._queue.qsize() if self._queue is not None else 0)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        # The writer keeps its own connection: requests waiting for their
+        # batch still hold pooled connections, and must not starve it.
+        self._connection = self.engine.connect()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write everything already queued, then stop the writer."""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._connection.close()
+        self._connection = None
+
+    async def submit(self, call_type: str, log_list_id: int, owner_id: int,
+                     idempotency_key: str = None) -> dict:
+        """Queue one call and wait until it is committed."""
+        future = asyncio.get_running_loop().create_future()
+        row = {"call_type": call_type, "log_list_id": log_list_id,
+               "owner_id": owner_id, "idempotency_key": idempotency_key}
+        item = (row, future, time.perf_counter())
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(item), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                rejected.inc()
+                raise IngestQueueFull() from None
+        # Shield the future: a client disconnect must not cancel a row that
+        # is already part of a batch.
+        return await asyncio.shield(future)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            # Give the batch until its oldest row is flush_interval old to fill
+            wait = item[2] + self.flush_interval - time.perf_counter()
+            if wait > 0 and self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(wait)
+            batch = [item]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(loop, batch)
+
+        # Drain rows that were queued behind the stop marker
+        remaining = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                remaining.append(item)
+        for start in range(0, len(remaining), self.max_batch):
+            await self._flush(loop, remaining[start:start + self.max_batch])
+
+    async def _flush(self, loop, batch):
+        started = time.perf_counter()
+        try:
+            rows = await loop.run_in_executor(
+                None, self._insert, [row for row, _, _ in batch])
+        except IntegrityError:
+            # One bad row (e.g. its list was deleted meanwhile) must not fail
+            # the others: fall back to writing them one by one.
+            if len(batch) > 1:
+                for item in batch:
+                    await self._flush(loop, [item])
+                return
+            row, future, _ = batch[0]
+            # Its idempotency key may already be stored by another worker
+            existing = await loop.run_in_executor(None, self._find_existing, row)
+            if existing is not None:
+                duplicates_suppressed.labels("idempotency_key").inc()
+                if not future.done():
+                    future.set_result(existing)
+                return
+            failed_batches.inc()
+            self._fail(batch, IngestFailed("Log list not found"))
+            return
+        except Exception as exc:
+            failed_batches.inc()
+            logger.exception("Failed to write a batch of %d calls", len(batch))
+            self._fail(batch, exc)
+            return
+
+        finished = time.perf_counter()
+        batch_size.observe(len(batch))
+        flush_seconds.observe(finished - started)
+        for (row, future, enqueued_at), (call_id, timestamp) in zip(batch, rows):
+            ack_seconds.observe(finished - enqueued_at)
+            if not future.done():
+                future.set_result(
+                    {"id": call_id, "call_type": row["call_type"], "timestamp": timestamp})
+
+    def _fail(self, batch, exc):
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(exc)
+
+    def _find_existing(self, row):
+        if not row["idempotency_key"]:
+            return None
+        found = self._connection.execute(
+            select(CallLog.id, CallLog.call_type, CallLog.timestamp)
+            .where(CallLog.idempotency_key == row["idempotency_key"])
+        ).first()
+        self._connection.rollback()
+        if found is None:
+            return None
+        return {"id": found.id, "call_type": found.call_type, "timestamp": found.timestamp}
+
+    def _insert(self, rows):
+        stmt = insert(CallLog).returning(
+            CallLog.id, CallLog.timestamp, sort_by_parameter_order=True)
+        # A connection invalidated by a failed batch reconnects on next use
+        with self._connection.begin():
+            result = self._connection.execute(stmt, rows).all()
+        # Core writes bypass the session events that invalidate caches
+        versions.bump("calls")
+        board.record_call_types([(call_id, row["owner_id"], timestamp, row["call_type"])
+                                 for row, (call_id, timestamp) in zip(rows, result)])
+        return result
+
+
+ingestor = CallIngestor(engine)
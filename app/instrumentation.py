@@ -0,0 +1,213 @@
+import heapq
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from app import metrics
+
+logger = logging.getLogger("app.sql")
+
+# Instrumentation configuration
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+REQUEST_STATEMENT_WARNING = int(os.getenv("REQUEST_STATEMENT_WARNING", "50"))
+EXPLAIN_SLOW_QUERIES = os.getenv("EXPLAIN_SLOW_QUERIES", "false").lower() == "true"
+# Per-request SQL headers are on by default in development only
+SQL_DEBUG_HEADERS = os.getenv(
+    "SQL_DEBUG_HEADERS",
+    "true" if os.getenv("ENVIRONMENT") == "development" else "false"
+).lower() == "true"
+SLOWEST_STATEMENTS_KEPT = 5
+
+
+class RequestStats:
+    """SQL activity recorded for a single HTTP request."""
+
+    __slots__ = ("statements", "db_time", "pool_wait", "slowest")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+        # Min-heap of (duration, statement) holding the slowest statements
+        self.slowest = []
+
+    def record_statement(self, duration: float, statement: str):
+        self.statements += 1
+        self.db_time += duration
+        entry = (duration, statement)
+        if len(self.slowest) < SLOWEST_STATEMENTS_KEPT:
+            heapq.heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def slowest_statements(self) -> list:
+        return sorted(self.slowest, reverse=True)
+
+
+# Stats of the request being handled. Starlette copies the context into the
+# threadpool, so sync endpoints and dependencies record into the same object.
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_sql_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    """Get the SQL stats of the request being handled, if any."""
+    return _request_stats.get()
+
+
+# SQL metrics, rendered on /metrics alongside the HTTP metrics
+sql_statements = metrics.registry.counter(
+    "app_sql_statements_total", "SQL statements executed, by route.", ("route",))
+sql_seconds = metrics.registry.counter(
+    "app_sql_seconds_total", "Time spent executing SQL, by route.", ("route",))
+sql_statements_per_request = metrics.registry.histogram(
+    "app_sql_statements_per_request", "SQL statements issued by one request.",
+    ("route",), buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000))
+sql_slow_queries = metrics.registry.counter(
+    "app_sql_slow_queries_total", "Statements slower than SLOW_QUERY_MS.")
+pool_wait_seconds = metrics.registry.histogram(
+    "app_db_pool_wait_seconds", "Time spent waiting for a pooled connection.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            waited = time.perf_counter() - started
+            pool_wait_seconds.observe(waited)
+            stats = _request_stats.get()
+            if stats is not None:
+                stats.pool_wait += waited
+
+
+def _explain(conn, statement: str, parameters):
+    """Log the query plan of a slow SELECT statement."""
+    dialect = conn.dialect.name
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    try:
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = "\n".join(" ".join(str(col) for col in row)
+                             for row in cursor.fetchall())
+        finally:
+            cursor.close()
+        logger.warning("Query plan for slow query:\n%s\n%s", statement, plan)
+    except Exception as e:
+        logger.warning("Could not EXPLAIN slow query: %s", e)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start_time"].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.record_statement(duration, statement)
+
+    if duration * 1000 >= SLOW_QUERY_MS:
+        sql_slow_queries.inc()
+        logger.warning(json.dumps({
+            "event": "slow_query",
+            "duration_ms": round(duration * 1000, 2),
+            "statement": statement,
+        }))
+        if EXPLAIN_SLOW_QUERIES and not executemany and \
+                statement.lstrip().upper().startswith("SELECT"):
+            _explain(conn, statement, parameters)
+
+
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute. A request that was
+    # given up on may have closed the connection under the statement.
+    if context.connection is not None and not context.connection.closed:
+        starts = context.connection.info.get("query_start_time")
+        if starts:
+            starts.pop()
+
+
+def install(engine):
+    """Attach statement timing hooks to an engine."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+class SQLStatsMiddleware:
+    """Record SQL statement count, DB time and pool wait for every request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_with_headers(message):
+            if SQL_DEBUG_HEADERS and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.extend(debug_headers(stats))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _request_stats.reset(token)
+            elapsed = time.perf_counter() - started
+            route = metrics.route_name(scope)
+            sql_statements.labels(route).inc(stats.statements)
+            sql_seconds.labels(route).inc(stats.db_time)
+            sql_statements_per_request.labels(route).observe(stats.statements)
+            log_request(scope["method"], route, elapsed, stats)
+
+
+def debug_headers(stats: RequestStats) -> list:
+    """Response headers describing the request's SQL activity."""
+    slowest = stats.slowest_statements()
+    return [
+        (b"x-sql-statements", str(stats.statements).encode()),
+        (b"x-sql-time-ms", f"{stats.db_time * 1000:.2f}".encode()),
+        (b"x-sql-pool-wait-ms", f"{stats.pool_wait * 1000:.2f}".encode()),
+        (b"x-sql-slowest-ms", f"{slowest[0][0] * 1000:.2f}".encode() if slowest else b"0"),
+    ]
+
+
+def log_request(method: str, route: str, elapsed: float, stats: RequestStats):
+    """Emit a structured log line for the request's SQL activity."""
+    slow = elapsed * 1000 >= SLOW_REQUEST_MS or \
+        stats.statements >= REQUEST_STATEMENT_WARNING
+    level = logging.WARNING if slow else logging.DEBUG
+    if not logger.isEnabledFor(level):
+        return
+    logger.log(level, json.dumps({
+        "event": "request_sql",
+        "method": method,
+        "route": route,
+        "duration_ms": round(elapsed * 1000, 2),
+        "statements": stats.statements,
+        "db_time_ms": round(stats.db_time * 1000, 2),
+        "pool_wait_ms": round(stats.pool_wait * 1000, 2),
+        "slowest": [{"duration_ms": round(d * 1000, 2), "statement": s}
+                    for d, s in stats.slowest_statements()],
+    }))
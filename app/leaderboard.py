@@ -0,0 +1,456 @@
+"""Agent leaderboard: transfer rates kept ranked as calls are logged.
+
+Ranking agents used to mean counting every agent's calls, sorting them all
+and keeping ten. The leaderboard instead keeps each agent's (total,
+potential) call counts, overall and per day for the last 30 days, and for
+every window and minimum-call threshold a sorted ranking of the active
+agents. Writes report the calls they commit (record) or the agents whose
+calls they moved or removed (reload_agents), so the top and bottom K and an
+agent's rank are answered from memory in O(log n).
+
+Windows are "all", "today", "7d" and "30d"; a window of N days spans today
+and the N - 1 days before it, by the database's calendar day (UTC on a
+default install). Agents are ranked by transfer rate, rounded as displayed,
+then by id; tied agents share the best rank among them.
+
+The board lives in the process, like the data versions of app/cache.py:
+with several workers, each only sees the calls written through itself until
+it reloads, which the reload-leaderboard job does in every worker each
+LEADERBOARD_RELOAD_SECONDS, reading call_logs in one snapshot while the
+calls recorded meanwhile wait to be matched against it. check() compares it
+against a full recompute.
+"""
+import bisect
+import os
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from app import metrics, readmodels
+from app.cache import versions
+from app.models import CallLog, POTENTIAL_SALE_CALL_TYPES, User, UserRole
+
+try:
+    from sortedcontainers import SortedList
+except ImportError:  # Rankings are then plain sorted lists, see _SortedKeys
+    SortedList = None
+
+LEADERBOARD_ENABLED = os.getenv("LEADERBOARD_ENABLED", "true").lower() == "true"
+# Seconds between reloads from call_logs, which bring in other workers' calls
+LEADERBOARD_RELOAD_SECONDS = float(os.getenv("LEADERBOARD_RELOAD_SECONDS", "300"))
+# Agents need at least this many calls in a window to be ranked in it; one
+# ranking is kept per threshold. 0, every active agent, is always kept.
+LEADERBOARD_MIN_CALLS = tuple(sorted({0} | {
+    int(threshold) for threshold in os.getenv("LEADERBOARD_MIN_CALLS", "20").split(",")
+    if threshold.strip()}))
+
+# Window name -> days, None for all time
+WINDOWS = {"all": None, "today": 1, "7d": 7, "30d": 30}
+# Days of per-day counts kept for the windows
+HORIZON_DAYS = max(days for days in WINDOWS.values() if days)
+
+leaderboard_updates = metrics.registry.counter(
+    "app_leaderboard_updates_total", "Calls and agents applied to the leaderboard.", ("kind",))
+
+
+class _SortedKeys:
+    """The SortedList methods used here, on a plain list kept sorted."""
+
+    def __init__(self, keys=()):
+        self._keys = sorted(keys)
+
+    def add(self, key):
+        bisect.insort(self._keys, key)
+
+    def remove(self, key):
+        del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def bisect_left(self, key) -> int:
+        return bisect.bisect_left(self._keys, key)
+
+    def __getitem__(self, index):
+        return self._keys[index]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+def _sorted_keys(keys=()):
+    return SortedList(keys) if SortedList is not None else _SortedKeys(keys)
+
+
+def call_day(timestamp) -> date:
+    """The day a call counts for: its UTC date, as the database stores it."""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.date()
+
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def window_start(window: str, day: date) -> Optional[date]:
+    days = WINDOWS[window]
+    return None if days is None else day - timedelta(days=days - 1)
+
+
+def _entry(user_id: int, username: str, total: int, potential: int, rank: int) -> dict:
+    return {
+        "user_id": user_id,
+        "username": username,
+        "transfer_rate": readmodels.transfer_rate(total, potential),
+        "total_calls": total,
+        "potential_calls": potential,
+        "rank": rank,
+    }
+
+
+def _load_agents(db: Session) -> dict:
+    """Active agents: id -> username."""
+    return dict(db.execute(
+        select(User.id, User.username)
+        .where(User.role == UserRole.USER, User.is_active.is_(True))).all())
+
+
+def _load_counts(db: Session, since: date = None, owner_ids: list = None) -> dict:
+    """owner id -> [total, potential], of calls since a day or of all time."""
+    statement = select(
+        CallLog.owner_id, func.count(CallLog.id),
+        func.coalesce(func.sum(case((CallLog.is_potential, 1), else_=0)), 0),
+    ).group_by(CallLog.owner_id)
+    if since is not None:
+        statement = statement.where(
+            CallLog.timestamp >= datetime.combine(since, datetime.min.time()))
+    if owner_ids is not None:
+        statement = statement.where(CallLog.owner_id.in_(owner_ids))
+    return {owner_id: [total, potential] for owner_id, total, potential in db.execute(statement)}
+
+
+def _load_days(db: Session, since: date, owner_ids: list = None) -> dict:
+    """owner id -> {day: [total, potential]} of calls since a day."""
+    day = func.date(CallLog.timestamp)
+    statement = select(
+        CallLog.owner_id, day, func.count(CallLog.id),
+        func.coalesce(func.sum(case((CallLog.is_potential, 1), else_=0)), 0),
+    ).where(CallLog.timestamp >= datetime.combine(since, datetime.min.time())
+            ).group_by(CallLog.owner_id, day)
+    if owner_ids is not None:
+        statement = statement.where(CallLog.owner_id.in_(owner_ids))
+    days = {}
+    for owner_id, call_date, total, potential in db.execute(statement):
+        # SQLite returns the date as a string
+        if isinstance(call_date, str):
+            call_date = date.fromisoformat(call_date)
+        days.setdefault(owner_id, {})[call_date] = [total, potential]
+    return days
+
+
+def _begin_snapshot(db: Session):
+    """Make the session's next reads see the same committed data."""
+    if db.get_bind().dialect.name == "postgresql":
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    else:
+        # pysqlite only opens a transaction before writes; reads outside one
+        # each see the latest commit
+        db.connection().exec_driver_sql("BEGIN")
+
+
+def _visible_calls(db: Session, call_ids) -> dict:
+    """Of the calls the session's transaction sees among call_ids: id ->
+    (owner id, day, is potential), all that a call counts towards."""
+    call_ids, visible = sorted(call_ids), {}
+    for start in range(0, len(call_ids), 500):
+        for call_id, owner_id, timestamp, is_potential in db.execute(
+                select(CallLog.id, CallLog.owner_id, CallLog.timestamp, CallLog.is_potential)
+                .where(CallLog.id.in_(call_ids[start:start + 500]))):
+            visible[call_id] = (owner_id, call_day(timestamp), bool(is_potential))
+    return visible
+
+
+def recompute(db: Session, window: str, min_calls: int, day: date = None) -> list:
+    """The ranking of a window from call_logs, ordered as the leaderboard's."""
+    agents = _load_agents(db)
+    counts = _load_counts(db, window_start(window, day or today()))
+    ranked = sorted(
+        (-readmodels.transfer_rate(*counts.get(user_id, (0, 0))), user_id)
+        for user_id in agents if counts.get(user_id, (0, 0))[0] >= min_calls)
+    entries = []
+    for position, (negative_rate, user_id) in enumerate(ranked):
+        better = entries[-1]["rank"] if entries and -negative_rate == \
+            entries[-1]["transfer_rate"] else position + 1
+        entries.append(_entry(user_id, agents[user_id], *counts.get(user_id, (0, 0)), better))
+    return entries
+
+
+class Leaderboard:
+    """Per-agent call counts with a ranking per window and threshold."""
+
+    def __init__(self, windows: dict = WINDOWS, thresholds: tuple = LEADERBOARD_MIN_CALLS):
+        self.windows = windows
+        self.thresholds = thresholds
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._day = None
+        self._users_version = None
+        # user id -> username, of the agents that are ranked
+        self._agents = {}
+        # owner id -> [total, potential] of all time, and -> {day: [total, potential]}
+        self._totals = {}
+        self._days = {}
+        # window -> owner id -> [total, potential], for windows with a start
+        self._window_counts = {}
+        # (window, min_calls) -> sorted (-rate, user id), and user id -> its key
+        self._rankings = {}
+        self._keys = {}
+        # While load() reads: calls recorded meanwhile, as (call id, owner id,
+        # timestamp, is potential, +1 or -1), and agents reloaded meanwhile
+        self._pending = None
+        self._pending_agents = set()
+
+    def load(self, db: Session):
+        """Read all counts and rank every agent, at startup and then periodically.
+
+        Writers record calls after committing them, so a call recorded while
+        the counts are read may or may not be in them. Such calls are held
+        back and applied afterwards only if the counts' snapshot missed them.
+        Ends the session's transaction.
+        """
+        day = today()
+        users_version = versions.get("users")
+        with self._lock:
+            self._pending, self._pending_agents = [], set()
+        try:
+            _begin_snapshot(db)
+            agents = _load_agents(db)
+            totals = _load_counts(db)
+            days = _load_days(db, day - timedelta(days=HORIZON_DAYS - 1))
+            with self._lock:
+                pending, self._pending = self._pending, None
+                visible = _visible_calls(db, {call[0] for call in pending})
+                self._agents, self._totals, self._days = agents, totals, days
+                self._users_version = users_version
+                # The windows and rankings were of the counts just replaced
+                self._roll(day, force=True)
+                self.loaded = True
+                self._replay(pending, visible)
+                reloaded, self._pending_agents = self._pending_agents, set()
+        finally:
+            with self._lock:
+                self._pending = None
+            db.rollback()
+        leaderboard_updates.labels("load").inc()
+        if reloaded:
+            # Their bulk changes may be newer than the snapshot
+            self.reload_agents(db, reloaded)
+
+    def _replay(self, pending: list, visible: dict):
+        """Apply the calls recorded during a load that its snapshot missed.
+
+        SQLite reuses the ids of deleted calls, so a call is matched on its id
+        and on what it counts towards.
+        """
+        unmatched, inserted, changed = dict(visible), set(), set()
+        # Inserts first: a delete may have been recorded before its insert
+        for call_id, owner_id, timestamp, is_potential, sign in sorted(
+                pending, key=lambda call: -call[4]):
+            counted = (owner_id, call_day(timestamp), bool(is_potential))
+            if sign > 0:
+                # Each call the snapshot has accounts for one insert
+                if unmatched.get(call_id) == counted:
+                    del unmatched[call_id]
+                    continue
+                inserted.add((call_id, counted))
+            elif visible.get(call_id) != counted and (call_id, counted) not in inserted:
+                # Deleted before the snapshot, and not inserted after it
+                continue
+            self._apply(owner_id, timestamp, is_potential, sign)
+            changed.add(owner_id)
+        for owner_id in changed:
+            self._rerank(owner_id)
+
+    def record(self, calls, removed: bool = False):
+        """Count committed calls, (call id, owner id, timestamp, is potential) each.
+
+        removed: the calls were deleted instead.
+        """
+        sign = -1 if removed else 1
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend((*call, sign) for call in calls if call[1] is not None)
+            if not self.loaded:
+                return
+            self._roll(today())
+            changed = set()
+            for call_id, owner_id, timestamp, is_potential in calls:
+                if owner_id is None:
+                    continue
+                self._apply(owner_id, timestamp, is_potential, sign)
+                changed.add(owner_id)
+            for owner_id in changed:
+                self._rerank(owner_id)
+        leaderboard_updates.labels("call").inc(len(calls))
+
+    def _apply(self, owner_id: int, timestamp, is_potential: bool, sign: int):
+        delta = (sign, sign if is_potential else 0)
+        self._add(self._totals, owner_id, delta)
+        call_date = call_day(timestamp)
+        if call_date >= self._day - timedelta(days=HORIZON_DAYS - 1):
+            self._add(self._days.setdefault(owner_id, {}), call_date, delta)
+            for window, counts in self._window_counts.items():
+                if call_date >= window_start(window, self._day):
+                    self._add(counts, owner_id, delta)
+
+    def record_call_types(self, calls, removed: bool = False):
+        """record() for calls given as (call id, owner id, timestamp, call type)."""
+        self.record([(call_id, owner_id, timestamp, call_type in POTENTIAL_SALE_CALL_TYPES)
+                     for call_id, owner_id, timestamp, call_type in calls], removed)
+
+    def reload_agents(self, db: Session, owner_ids):
+        """Recount agents whose calls were moved or removed in bulk."""
+        owner_ids = [owner_id for owner_id in set(owner_ids) if owner_id is not None]
+        with self._lock:
+            if self._pending is not None:
+                # A load is reading; it reloads these agents after its swap
+                self._pending_agents.update(owner_ids)
+            if not self.loaded:
+                return
+        day = today()
+        totals = _load_counts(db, owner_ids=owner_ids)
+        days = _load_days(db, day - timedelta(days=HORIZON_DAYS - 1), owner_ids)
+        with self._lock:
+            for owner_id in owner_ids:
+                self._totals[owner_id] = totals.get(owner_id, [0, 0])
+                self._days[owner_id] = days.get(owner_id, {})
+            # Recomputes the window counts from the days
+            self._roll(day, force=True)
+        leaderboard_updates.labels("agent").inc(len(owner_ids))
+
+    def top(self, db: Session, window: str = "all", k: int = 10,
+            min_calls: int = 0, bottom: bool = False) -> list:
+        """The k best ranked agents of a window, or the k worst with bottom."""
+        with self._lock:
+            ranking = self._ranking(db, window, min_calls)
+            if bottom:
+                keys = ranking[max(len(ranking) - k, 0):][::-1]
+            else:
+                keys = ranking[:k]
+            return [self._describe(window, min_calls, user_id) for _, user_id in keys]
+
+    def rank(self, db: Session, user_id: int, window: str = "all",
+             min_calls: int = 0) -> Optional[dict]:
+        """An agent's standing in a window, None if they are not ranked in it."""
+        with self._lock:
+            self._ranking(db, window, min_calls)
+            if user_id not in self._keys[window, min_calls]:
+                return None
+            return self._describe(window, min_calls, user_id)
+
+    def size(self, db: Session, window: str = "all", min_calls: int = 0) -> int:
+        with self._lock:
+            return len(self._ranking(db, window, min_calls))
+
+    def check(self, db: Session) -> dict:
+        """Compare every ranking with a full recompute from call_logs."""
+        with self._lock:
+            # Brings the agents and the day up to date first
+            self._ranking(db, "all", 0)
+            day = self._day
+            rankings = {(window, min_calls): self.top(db, window, len(self._agents), min_calls)
+                        for window in self.windows for min_calls in self.thresholds}
+        results = {}
+        for (window, min_calls), ranked in rankings.items():
+            expected = recompute(db, window, min_calls, day)
+            differences = [{"leaderboard": got, "recomputed": want}
+                           for got, want in zip(ranked, expected) if got != want]
+            if len(ranked) != len(expected):
+                differences.append({"leaderboard": len(ranked), "recomputed": len(expected)})
+            results[f"{window}/{min_calls}"] = {
+                "agents": len(expected), "differences": differences[:10]}
+        return {"consistent": not any(r["differences"] for r in results.values()),
+                "rankings": results}
+
+    def _ranking(self, db: Session, window: str, min_calls: int):
+        if window not in self.windows or min_calls not in self.thresholds:
+            raise KeyError((window, min_calls))
+        if versions.get("users") != self._users_version:
+            # Agents were added, renamed, (de)activated or deleted
+            self._users_version = versions.get("users")
+            self._agents = _load_agents(db)
+            self._rebuild()
+        self._roll(today())
+        return self._rankings[window, min_calls]
+
+    def _counts(self, window: str, owner_id: int) -> list:
+        counts = self._totals if self.windows[window] is None else self._window_counts[window]
+        return counts.get(owner_id, [0, 0])
+
+    def _describe(self, window: str, min_calls: int, user_id: int) -> dict:
+        ranking = self._rankings[window, min_calls]
+        negative_rate, _ = self._keys[window, min_calls][user_id]
+        # Tied agents share the rank of the first of them
+        rank = ranking.bisect_left((negative_rate, float("-inf"))) + 1
+        return _entry(user_id, self._agents[user_id], *self._counts(window, user_id), rank)
+
+    @staticmethod
+    def _add(counts: dict, key, delta: tuple):
+        current = counts.setdefault(key, [0, 0])
+        current[0] += delta[0]
+        current[1] += delta[1]
+
+    def _roll(self, day: date, force: bool = False):
+        """Move the windows to a new day: drop old days, recount the windows."""
+        if day == self._day and not force:
+            return
+        self._day = day
+        horizon = day - timedelta(days=HORIZON_DAYS - 1)
+        self._window_counts = {window: {} for window, days in self.windows.items() if days}
+        for owner_id, days in self._days.items():
+            for call_date in [d for d in days if d < horizon]:
+                del days[call_date]
+            for window, counts in self._window_counts.items():
+                start = window_start(window, day)
+                for call_date, (total, potential) in days.items():
+                    if call_date >= start:
+                        self._add(counts, owner_id, (total, potential))
+        self._rebuild()
+
+    def _rebuild(self):
+        self._rankings = {}
+        self._keys = {}
+        for window in self.windows:
+            for min_calls in self.thresholds:
+                keys = {}
+                for user_id in self._agents:
+                    key = self._key(window, min_calls, user_id)
+                    if key is not None:
+                        keys[user_id] = key
+                self._keys[window, min_calls] = keys
+                self._rankings[window, min_calls] = _sorted_keys(keys.values())
+
+    def _key(self, window: str, min_calls: int, user_id: int) -> Optional[tuple]:
+        total, potential = self._counts(window, user_id)
+        if total < min_calls:
+            return None
+        return -readmodels.transfer_rate(total, potential), user_id
+
+    def _rerank(self, user_id: int):
+        if user_id not in self._agents:
+            return
+        for (window, min_calls), keys in self._keys.items():
+            ranking = self._rankings[window, min_calls]
+            old = keys.pop(user_id, None)
+            if old is not None:
+                ranking.remove(old)
+            new = self._key(window, min_calls, user_id)
+            if new is not None:
+                keys[user_id] = new
+                ranking.add(new)
+
+
+board = Leaderboard()
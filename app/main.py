@@ -1,42 +1,106 @@
-from fastapi import FastAPI, Depends, Request, status, HTTPException, Path, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+import asyncio
+import base64
+from contextlib import asynccontextmanager
+from fastapi import (
+    FastAPI, Depends, Request, Response, status, HTTPException, Path, Form, Header,
+    File, UploadFile
+)
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, insert, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from datetime import datetime, timedelta, timezone
-from app import models, crud, auth
+from datetime import date, datetime, timedelta, timezone
+from app import (
+    models, crud, auth, instrumentation, metrics, migrations, cti, ratelimit, sessions,
+    provisioning, readmodels, payloads, assets, leaderboard, archive
+)
+from app.scheduler import scheduler
+from app.profiling import profiler, ProfilingMiddleware
+from app.bulkheads import BulkheadMiddleware
+from app.coalesce import SingleFlight
+from app.query_limits import QueryLimitMiddleware, QueryCancelled, StatementTimeout
+from app.ingest import ingestor, IngestQueueFull, IngestFailed, CALL_INGEST_BATCHING
+from app.idempotency import (
+    call_write_key, scoped_key, duplicates_suppressed, MAX_KEY_LENGTH
+)
+from app.templating import create_templates, precompile
 from app.database import SessionLocal, engine
-from app.models import CallLog, LogList, User, UserRole
+from app.models import (
+    CallLog, LogList, User, UserRole, CALL_TYPES, POTENTIAL_SALE_CALL_TYPES
+)
 from app.schemas import (
     CallLogCreate, LogListCreate, LogListRead,
-    UserCreate, UserUpdate, UserResponse, Token,
-    LogListWithOwner
+    UserCreate, UserUpdate, UserResponse, Token, RefreshRequest, BulkUserIds, ListReassignment,
+    LogListWithOwner, ProfilingConfig
 )
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup()
+    if CALL_INGEST_BATCHING:
+        await ingestor.start()
+    await scheduler.start()
+    try:
+        yield
+    finally:
+        await scheduler.stop()
+        # Commit calls that are still queued before the process exits
+        await ingestor.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Per-route-class concurrency limits, see app/bulkheads.py
+app.add_middleware(BulkheadMiddleware)
+# Statement timeouts per route class; admin reads stop when the client leaves
+app.add_middleware(QueryLimitMiddleware)
+# Per-request SQL statement counts, DB time and pool wait
+app.add_middleware(instrumentation.SQLStatsMiddleware)
+# Request rate and latency per route
+app.add_middleware(metrics.MetricsMiddleware)
+# Opt-in sampling profiler, see /admin/profiling
+app.add_middleware(ProfilingMiddleware, fastapi_app=app)
+# Cookies renewed by the auth dependencies, see app/sessions.py
+app.add_middleware(sessions.SessionCookieMiddleware)
+# Pages and JSON; built assets are already compressed, see app/assets.py
+app.add_middleware(assets.DynamicGZipMiddleware)
 
 # Mount static files (css, js)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
+# Fingerprinted copies, cached for good by browsers
+assets.build()
+app.mount(assets.ASSETS_URL, assets.AssetFiles(directory=assets.ASSETS_DIR), name="assets")
 
-# Setup Jinja2 templates folder
-templates = Jinja2Templates(directory="app/templates")
+# Setup Jinja2 templates with bytecode and fragment caching
+templates = create_templates()
 
-# Dependency to get DB session
 
+# Statements stopped by app/query_limits.py
+@app.exception_handler(StatementTimeout)
+def statement_timeout_handler(request: Request, exc: StatementTimeout):
+    return JSONResponse(status_code=503, content={
+        "detail": "The query took too long. Try a shorter date range or narrower filters."})
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+
+@app.exception_handler(QueryCancelled)
+def query_cancelled_handler(request: Request, exc: QueryCancelled):
+    # The client is gone; nginx's "client closed request" status, for the logs
+    return Response(status_code=499)
+
+
+# Dependency to get DB session. The same callable as the auth dependencies
+# use, so FastAPI hands both one shared session (and one pooled connection)
+# per request instead of two.
+get_db = auth.get_db
 
 
 # Authentication endpoints
-@app.post("/token", response_model=Token)
+@app.post("/token", response_model=Token, dependencies=[Depends(auth.limit_login_attempts)])
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
@@ -54,8 +118,34 @@ async def login_for_access_token(
             detail="User account is deactivated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = auth.create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    access_token, refresh_token = auth.create_session_tokens(db, user)
+    return {"access_token": access_token, "token_type": "bearer",
+            "refresh_token": refresh_token}
+
+
+@app.post("/token/refresh", response_model=Token)
+def refresh_access_token(
+    response: Response,
+    request: Request,
+    body: Optional[RefreshRequest] = None,
+    db: Session = Depends(get_db)
+):
+    """Renew an access token from a refresh token (JSON body or cookie)."""
+    from_cookie = body is None or not body.refresh_token
+    refresh_token = request.cookies.get(sessions.REFRESH_COOKIE) if from_cookie \
+        else body.refresh_token
+    renewed = auth.refresh_access_token(db, refresh_token) if refresh_token else None
+    if renewed is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session expired, please log in again",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user, access_token, new_refresh_token = renewed
+    if from_cookie:
+        sessions.set_session_cookies(response, access_token, new_refresh_token)
+    return {"access_token": access_token, "token_type": "bearer",
+            "refresh_token": new_refresh_token}
 
 
 @app.get("/login", response_class=HTMLResponse)
@@ -63,7 +153,7 @@ def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 
-@app.post("/login")
+@app.post("/login", dependencies=[Depends(auth.limit_login_attempts)])
 async def login_submit(
     request: Request,
     username: str = Form(...),
@@ -87,27 +177,31 @@ async def login_submit(
                             value=f"Bearer {temp_token}", httponly=True)
         return response
 
-    # Create token and redirect based on user role
-    access_token = auth.create_access_token(data={"sub": user.username})
-
     # Redirect administrators to administrator dashboard, regular users to main dashboard
+    # (decided first: creating the session commits, which expires the user)
     if user.role == UserRole.ADMIN:
         redirect_url = "/admin/dashboard"
     else:
         redirect_url = "/"
 
+    # Create session tokens
+    access_token, refresh_token = auth.create_session_tokens(db, user)
+
     response = RedirectResponse(
         url=redirect_url, status_code=status.HTTP_302_FOUND)
-    response.set_cookie(key="access_token",
-                        value=f"Bearer {access_token}", httponly=True)
+    sessions.set_session_cookies(response, access_token, refresh_token)
     return response
 
 
 @app.get("/logout")
-def logout():
+def logout(request: Request, db: Session = Depends(get_db)):
+    refresh_token = request.cookies.get(sessions.REFRESH_COOKIE)
+    if refresh_token:
+        sessions.revoke_token(db, refresh_token)
+        db.commit()
     response = RedirectResponse(
         url="/login", status_code=status.HTTP_302_FOUND)
-    response.delete_cookie(key="access_token")
+    sessions.clear_session_cookies(response)
     return response
 
 
@@ -167,11 +261,11 @@ async def change_password_submit(
             "error": "Password must be at least 6 characters long"
         })
 
-    # Update password and clear temporary flag
+    # Update password and clear temporary flag (this ends other sessions)
     crud.update_user_password(db, user.id, new_password)
 
-    # Create regular access token and redirect to appropriate dashboard
-    access_token = auth.create_access_token(data={"sub": user.username})
+    # Start a regular session and redirect to appropriate dashboard
+    access_token, refresh_token = auth.create_session_tokens(db, user)
 
     if user.role == UserRole.ADMIN:
         redirect_url = "/admin/dashboard"
@@ -179,16 +273,21 @@ async def change_password_submit(
         redirect_url = "/"
 
     response = RedirectResponse(url=redirect_url, status_code=302)
-    response.set_cookie(key="access_token",
-                        value=f"Bearer {access_token}", httponly=True)
+    sessions.set_session_cookies(response, access_token, refresh_token)
     response.delete_cookie(key="temp_access_token")
     return response
 
 
-# Define your potential sale call types
-POTENTIAL_SALE_CALL_TYPES = {
-    "AOD", "APPOINTMENT", "T2", "HPA", "AFCT2", "AFCAPPOINTMENT", "NON-MED"
-}
+# Call-insert throughput, see /metrics
+calls_inserted = metrics.registry.counter(
+    "app_calls_inserted_total", "Call logs inserted.")
+
+# Identical admin reads that arrive together (a team opening the dashboard at
+# shift start) share one computation instead of each running the same SQL.
+# If the leader's client disconnects, the waiting requests compute it again.
+dashboard_flight = SingleFlight("dashboard", retry_on=(QueryCancelled,))
+user_details_flight = SingleFlight("user_details", retry_on=(QueryCancelled,))
+analytics_flight = SingleFlight("analytics", retry_on=(QueryCancelled,))
 
 
 # User Management Endpoints (Administrator only)
@@ -197,7 +296,7 @@ def get_users(
     current_user: User = Depends(auth.get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    return crud.get_users(db)
+    return readmodels.users(db)
 
 
 @app.post("/admin/users", response_model=UserResponse)
@@ -231,6 +330,54 @@ def create_user(
     return response
 
 
+@app.post("/admin/users/bulk")
+def bulk_create_users(
+    file: UploadFile = File(...),
+    current_user: User = Depends(auth.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Create every user of a CSV at once, see app/provisioning.py.
+
+    Responds with a CSV of the new users' temporary passwords.
+    """
+    try:
+        text = file.file.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="The CSV must be UTF-8 encoded")
+    created = provisioning.provision(db, provisioning.parse_csv(text), current_user.id)
+    filename = f"credentials-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.csv"
+    return Response(
+        content=provisioning.credentials_csv(created),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                 "Cache-Control": "no-store"})
+
+
+# Bulk status changes; declared before /admin/users/{user_id}/... so "bulk"
+# is not taken for a user id
+@app.post("/admin/users/bulk/deactivate")
+def bulk_deactivate_users(
+    data: BulkUserIds,
+    current_user: User = Depends(auth.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    if current_user.id in data.user_ids:
+        raise HTTPException(
+            status_code=400,
+            detail="Cannot deactivate your own account"
+        )
+    return {"updated": crud.set_users_active(db, sorted(set(data.user_ids)), False)}
+
+
+@app.post("/admin/users/bulk/activate")
+def bulk_activate_users(
+    data: BulkUserIds,
+    current_user: User = Depends(auth.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    return {"updated": crud.set_users_active(db, sorted(set(data.user_ids)), True)}
+
+
 @app.put("/admin/users/{user_id}", response_model=UserResponse)
 def update_user(
     user_id: int,
@@ -313,17 +460,29 @@ def admin_dashboard(
     if current_user.role != UserRole.ADMIN:
         return RedirectResponse(url="/", status_code=302)
 
-    # Get users with their transfer rate data
-    users = crud.get_users(db)
+    stats = dashboard_flight.do("admin_dashboard", admin_dashboard_stats, db)
+    return templates.TemplateResponse("admin_dashboard.html", {
+        "request": request,
+        "current_user": current_user,
+        **stats
+    })
+
+
+def admin_dashboard_stats(db: Session) -> dict:
+    """Template data for the admin dashboard; the same for every admin."""
+    # Get users with their transfer rate data; the table shows all of them
+    users = readmodels.users(db, limit=None)
     users_with_stats = []
     total_calls = 0
     total_transfers = 0
     transfer_rates = []
+    user_ids = [user.id for user in users]
+    # From call_logs, not the leaderboard, whose counts may lag other workers'
+    rates = crud.get_transfer_rates(db, user_ids)
 
     for user in users:
         if user.role == UserRole.USER:  # Only calculate for regular users
-            user_stats = crud.get_user_transfer_rate(
-                db, user.id, POTENTIAL_SALE_CALL_TYPES)
+            user_stats = rates[user.id]
             users_with_stats.append({
                 "user": user,
                 "transfer_rate": user_stats["transfer_rate"],
@@ -368,40 +527,33 @@ def admin_dashboard(
     top_performers = len([rate for rate in transfer_rates if rate >= 70])
 
     # Get recent call logs for the logs tab
-    recent_logs = db.query(models.CallLog).join(models.LogList).join(
-        models.User).order_by(models.CallLog.timestamp.desc()).limit(100).all()
-    recent_logs_data = []
-    for log in recent_logs:
-        log_list = db.query(models.LogList).filter(
-            models.LogList.id == log.log_list_id).first()
-        user = db.query(models.User).filter(
-            models.User.id == log_list.owner_id).first()
-
-        # Calculate user's transfer rate
-        user_stats = crud.get_user_transfer_rate(
-            db, user.id, POTENTIAL_SALE_CALL_TYPES)
-        transfer_rate = user_stats.get("transfer_rate") if user_stats else None
-
-        recent_logs_data.append({
-            "call_log": log,
-            "list_name": log_list.name,
-            "username": user.username,
-            "user_name": user.name,
-            "user_id": user.id,
-            "user_role": user.role.value,
-            "transfer_rate": transfer_rate
-        })
+    recent_logs = readmodels.fetch(db, readmodels.owned_calls().order_by(
+        models.CallLog.timestamp.desc()).limit(100), readmodels.OwnedCallRow)
+    missing = list({log.owner_id for log in recent_logs} - rates.keys())
+    if missing:
+        rates.update(crud.get_transfer_rates(db, missing))
+
+    # The admin tables are filled in by admin.js from these columns
+    users_table = payloads.as_columns({
+        "id": [row["user"].id for row in users_with_stats],
+        "username": [row["user"].username for row in users_with_stats],
+        "name": [row["user"].name for row in users_with_stats],
+        "role": [row["user"].role.value for row in users_with_stats],
+        "is_active": [row["user"].is_active for row in users_with_stats],
+        "created_at": [row["user"].created_at for row in users_with_stats],
+        "transfer_rate": [row["transfer_rate"] for row in users_with_stats],
+        "total_calls": [row["total_calls"] for row in users_with_stats],
+        "potential_calls": [row["potential_calls"] for row in users_with_stats],
+        "log_lists_count": [row["log_lists_count"] for row in users_with_stats]
+    })
 
     # Get all log lists with statistics
-    log_lists_with_stats = crud.get_all_log_lists_with_stats(
-        db, POTENTIAL_SALE_CALL_TYPES)
+    log_lists_with_stats = crud.get_all_log_lists_with_stats(db)
 
-    return templates.TemplateResponse("admin_dashboard.html", {
-        "request": request,
+    return {
         "users": users,
         "users_with_stats": users_with_stats,
         "log_lists_with_stats": log_lists_with_stats,
-        "current_user": current_user,
         "total_users": total_users,
         "active_users": active_users,
         "new_users_month": new_users_month,
@@ -410,8 +562,9 @@ def admin_dashboard(
         "total_calls": total_calls,
         "total_transfers": total_transfers,
         "system_avg_rate": system_avg_rate,
-        "recent_logs": recent_logs_data
-    })
+        "users_table": users_table,
+        "recent_logs_table": payloads.as_columns(call_log_columns(recent_logs, rates))
+    }
 
 # Endpoint to serve the dashboard page with call data
 
@@ -434,14 +587,14 @@ def read_dashboard(
         return RedirectResponse(url="/admin/dashboard", status_code=302)
 
     # Get log lists for regular users only
-    log_lists = db.query(LogList).filter(
-        LogList.owner_id == current_user.id).all()
+    log_lists = readmodels.log_lists(db, current_user.id)
 
     if not log_lists:
         # Regular user has no lists - they need to create one
         return templates.TemplateResponse("index.html", {
             "request": request,
             "calls": [],
+            "calls_key": (0, 0, None),
             "transfer_rate": 0,
             "potential_types": list(POTENTIAL_SALE_CALL_TYPES),
             "log_lists": [],
@@ -454,26 +607,25 @@ def read_dashboard(
         log_list_id = log_lists[0].id
 
     # Verify user has access to the selected log list
-    selected_list = db.query(LogList).filter(LogList.id == log_list_id).first()
-    if not selected_list:
-        raise HTTPException(status_code=404, detail="Log list not found")
-
-    if current_user.role != UserRole.ADMIN and selected_list.owner_id != current_user.id:
+    if not any(log_list.id == log_list_id for log_list in log_lists):
+        if not db.query(LogList.id).filter(LogList.id == log_list_id).first():
+            raise HTTPException(status_code=404, detail="Log list not found")
         raise HTTPException(
             status_code=403, detail="Access denied to this log list")
 
-    calls = db.query(CallLog).filter(CallLog.log_list_id ==
-                                     log_list_id).order_by(CallLog.timestamp.desc()).all()
-    total_calls = len(calls)
-    potential_calls = len(
-        [c for c in calls if c.call_type in POTENTIAL_SALE_CALL_TYPES])
-    transfer_rate = (potential_calls / total_calls) * \
-        100 if total_calls > 0 else 0
+    calls = readmodels.list_calls(db, log_list_id)
+    potential_calls = sum(1 for call in calls if call.is_potential)
 
     return templates.TemplateResponse("index.html", {
         "request": request,
         "calls": calls,
-        "transfer_rate": round(transfer_rate, 2),
+        # With this worker's data version of calls, keys the cached call table.
+        # This catches other workers' writes too: an insert raises the count or
+        # the highest id, or, when SQLite reuses a deleted highest id, the
+        # latest time; a delete lowers the count.
+        "calls_key": (len(calls), max((call.id for call in calls), default=0),
+                      max((call.timestamp for call in calls), default=None)),
+        "transfer_rate": readmodels.transfer_rate(len(calls), potential_calls),
         "potential_types": list(POTENTIAL_SALE_CALL_TYPES),
         "log_lists": log_lists,
         "current_log_list_id": log_list_id,
@@ -507,17 +659,20 @@ def get_log_lists(
     db: Session = Depends(get_db)
 ):
     if current_user.role == UserRole.ADMIN:
-        return db.query(LogList).all()
+        return readmodels.log_lists(db)
     else:
-        return db.query(LogList).filter(LogList.owner_id == current_user.id).all()
+        return readmodels.log_lists(db, current_user.id)
 
 
-@app.post("/calls/", status_code=status.HTTP_201_CREATED)
-def log_call(
-    call: CallLogCreate,
-    current_user: User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
-):
+# Statements of the call logging path, built once; SQLAlchemy caches their
+# compiled form, so each request only binds parameters
+LIST_OWNER = select(LogList.owner_id).where(LogList.id == bindparam("log_list_id"))
+INSERT_CALL = insert(CallLog).returning(CallLog.id, CallLog.call_type, CallLog.timestamp)
+
+
+def check_call_target(call: CallLogCreate, current_user: User, db: Session,
+                      release_connection: bool = False):
+    """Validate a call and the user's access to the log list it goes into."""
     # Administrators should not log calls - they use administrator dashboard only
     if current_user.role == UserRole.ADMIN:
         raise HTTPException(
@@ -525,26 +680,110 @@ def log_call(
             detail="Administrators cannot log calls. Use the administrator dashboard to manage users and view data."
         )
 
-    if call.call_type not in (POTENTIAL_SALE_CALL_TYPES | {
-        "CUSTOMER SERVICE", "INVALID", "PROVIDER", "BROKER", "U65",
-        "LOYALTY", "CALLBLUE", "SEMINAR"
-    }):
+    if call.call_type not in CALL_TYPES:
         raise HTTPException(status_code=400, detail="Invalid call type")
 
-    log_list = db.query(LogList).filter(LogList.id == call.log_list_id).first()
-    if not log_list:
+    owner_id = db.execute(LIST_OWNER, {"log_list_id": call.log_list_id}).scalar()
+    if owner_id is None:
         raise HTTPException(status_code=404, detail="Log list not found")
 
     # Check if user has access to this log list (only regular users now)
-    if log_list.owner_id != current_user.id:
+    if owner_id != current_user.id:
         raise HTTPException(
             status_code=403, detail="Access denied to this log list")
 
-    new_call = CallLog(call_type=call.call_type, log_list_id=call.log_list_id)
-    db.add(new_call)
-    db.commit()
-    db.refresh(new_call)
-    return {"id": new_call.id, "call_type": new_call.call_type, "timestamp": new_call.timestamp}
+    if release_connection:
+        # Don't hold a pooled connection while waiting for the batch writer
+        db.close()
+
+
+def call_result(call_log: CallLog) -> dict:
+    return {"id": call_log.id, "call_type": call_log.call_type, "timestamp": call_log.timestamp}
+
+
+def insert_call(call: CallLogCreate, current_user: User, db: Session,
+                idempotency_key: Optional[str] = None) -> dict:
+    check_call_target(call, current_user, db)
+    # One INSERT ... RETURNING instead of an ORM flush and a refresh
+    try:
+        new_call = db.execute(INSERT_CALL, {
+            "call_type": call.call_type,
+            "log_list_id": call.log_list_id,
+            "owner_id": current_user.id,
+            "idempotency_key": idempotency_key,
+        }).one()
+        db.commit()
+    except IntegrityError:
+        # Another worker already stored this key: answer with its call
+        db.rollback()
+        existing = None
+        if idempotency_key:
+            existing = db.query(CallLog).filter(
+                CallLog.idempotency_key == idempotency_key).first()
+        if existing is None:
+            raise
+        duplicates_suppressed.labels("idempotency_key").inc()
+        return call_result(existing)
+    calls_inserted.inc()
+    leaderboard.board.record_call_types(
+        [(new_call.id, current_user.id, new_call.timestamp, call.call_type)])
+    return call_result(new_call)
+
+
+async def write_call(call: CallLogCreate, current_user: User, db: Session,
+                     idempotency_key: Optional[str]) -> dict:
+    if not ingestor.running:
+        return await run_in_threadpool(insert_call, call, current_user, db, idempotency_key)
+
+    # Group commit: the call is written with others in one batch, see app/ingest.py
+    await run_in_threadpool(check_call_target, call, current_user, db, True)
+    try:
+        new_call = await ingestor.submit(call.call_type, call.log_list_id, current_user.id,
+                                         idempotency_key)
+    except IngestQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many calls are being logged right now, please retry",
+            headers={"Retry-After": "1"}
+        )
+    except IngestFailed:
+        raise HTTPException(status_code=404, detail="Log list not found")
+    calls_inserted.inc()
+    return new_call
+
+
+@app.post("/calls/", status_code=status.HTTP_201_CREATED)
+async def log_call(
+    call: CallLogCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    client_key = idempotency_key or call.idempotency_key
+    if client_key and len(client_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency key too long")
+
+    # Retries and double-clicks get the first request's call, see app/idempotency.py
+    dedupe = call_write_key(current_user.id, client_key, call.log_list_id, call.call_type)
+    if dedupe is None:
+        return await write_call(call, current_user, db, None)
+    recent, write_key = dedupe
+    earlier = recent.claim(write_key)
+    if earlier is not None:
+        new_call = await asyncio.shield(earlier)
+        duplicates_suppressed.labels("idempotency_key" if client_key else "window").inc()
+        response.headers["Idempotent-Replayed"] = "true"
+        return new_call
+
+    stored_key = scoped_key(current_user.id, client_key) if client_key else None
+    try:
+        new_call = await write_call(call, current_user, db, stored_key)
+    except BaseException as exc:
+        recent.abandon(write_key, exc)
+        raise
+    recent.resolve(write_key, new_call)
+    return new_call
 
 
 @app.delete("/calls/{call_id}", status_code=204)
@@ -562,8 +801,10 @@ def delete_call(
     if current_user.role != UserRole.ADMIN and log_list.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
 
+    removed = (call.id, call.owner_id, call.timestamp, call.is_potential)
     db.delete(call)
     db.commit()
+    leaderboard.board.record([removed], removed=True)
     return
 
 
@@ -585,8 +826,10 @@ def delete_log_list(
     db.query(CallLog).filter(CallLog.log_list_id == log_list_id).delete()
 
     # Delete the log list
+    owner_id = log_list.owner_id
     db.delete(log_list)
     db.commit()
+    leaderboard.board.reload_agents(db, [owner_id])
     return
 
 
@@ -623,10 +866,55 @@ def init_page(request: Request, db: Session = Depends(get_db)):
     return templates.TemplateResponse("init_admin.html", {"request": request})
 
 
-# Startup event to ensure tables are created
-@app.on_event("startup")
-def startup_event():
-    models.Base.metadata.create_all(bind=engine)
+# Phone system (CTI) call ingestion, authenticated with signed API keys
+# instead of user sessions, see app/cti.py
+@app.post("/cti/calls")
+async def cti_ingest_calls(request: Request, db: Session = Depends(get_db)):
+    if int(request.headers.get("content-length") or 0) > cti.CTI_MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="Batch too large")
+    body = await request.body()
+    if len(body) > cti.CTI_MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="Batch too large")
+    key_id = cti.authenticate(request.headers, body)
+    ratelimit.enforce("cti", key_id)
+
+    def parse_and_ingest():
+        events, errors = cti.parse_batch(body, request.headers.get("content-type", ""))
+        return cti.ingest(db, events, errors)
+
+    return await run_in_threadpool(parse_and_ingest)
+
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics(
+    reader: Optional[User] = Depends(auth.get_metrics_reader)
+):
+    return metrics.render_prometheus()
+
+
+# Run by the lifespan before the app serves requests
+def startup():
+    if migrations.MIGRATE_ON_STARTUP:
+        migrations.upgrade(engine)
+    else:
+        migrations.check(engine)
+    metrics.start_multiprocess_flusher()
+    if leaderboard.LEADERBOARD_ENABLED:
+        with SessionLocal() as db:
+            leaderboard.board.load(db)
+    precompile(templates)
+
+
+# Periodic jobs, run by one worker at a time, see app/scheduler.py
+scheduler.add("purge-expired-sessions", sessions.purge_expired, every=3600, jitter=300)
+if leaderboard.LEADERBOARD_ENABLED:
+    # Each worker's board only sees its own writes; this catches up with the rest
+    scheduler.add("reload-leaderboard", leaderboard.board.load,
+                  every=leaderboard.LEADERBOARD_RELOAD_SECONDS, jitter=30, every_worker=True)
+if archive.ARCHIVE_DIR:
+    scheduler.add("archive-closed-months", archive.archive_closed_months,
+                  cron="30 3 1 * *", jitter=600)
 
 
 @app.delete("/admin/users/{user_id}", status_code=204)
@@ -646,18 +934,12 @@ def delete_user(
         raise HTTPException(status_code=404, detail="User not found")
 
     # Check if user has any log lists with data
-    user_log_lists = db.query(LogList).filter(
-        LogList.owner_id == user_id).all()
-    total_calls = 0
-    for log_list in user_log_lists:
-        call_count = db.query(CallLog).filter(
-            CallLog.log_list_id == log_list.id).count()
-        total_calls += call_count
+    _, total_calls = crud.count_user_data(db, user_id)
 
     if total_calls > 0:
         raise HTTPException(
             status_code=400,
-            detail=f"Cannot delete user with {total_calls} call log entries. Please transfer or delete the data first."
+            detail=f"Cannot delete user with {total_calls} call log entries. Please reassign or purge the data first."
         )
 
     success = crud.delete_user(db, user_id)
@@ -665,24 +947,80 @@ def delete_user(
         raise HTTPException(status_code=404, detail="User not found")
 
 
+@app.delete("/admin/users/{user_id}/purge")
+def purge_user(
+    user_id: int,
+    current_user: User = Depends(auth.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Delete a user together with all their log lists and calls."""
+    if user_id == current_user.id:
+        raise HTTPException(
+            status_code=400,
+            detail="Cannot delete your own account"
+        )
+
+    if not crud.get_user(db, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    lists, calls = crud.purge_user(db, user_id)
+    leaderboard.board.reload_agents(db, [user_id])
+    return {"deleted_lists": lists, "deleted_calls": calls}
+
+
+@app.post("/admin/users/{user_id}/reassign-lists")
+def reassign_user_lists(
+    user_id: int,
+    data: ListReassignment,
+    current_user: User = Depends(auth.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Move all of a user's log lists and their calls to another user."""
+    if data.to_user_id == user_id:
+        raise HTTPException(
+            status_code=400,
+            detail="Lists are already owned by this user"
+        )
+    target = crud.get_user(db, data.to_user_id)
+    if not crud.get_user(db, user_id) or not target:
+        raise HTTPException(status_code=404, detail="User not found")
+    if target.role != UserRole.USER or not target.is_active:
+        raise HTTPException(
+            status_code=400,
+            detail="Lists can only be reassigned to an active agent"
+        )
+
+    try:
+        moved = crud.reassign_log_lists(db, user_id, data.to_user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    leaderboard.board.reload_agents(db, [user_id, data.to_user_id])
+    return {"moved": moved}
+
+
 @app.get("/admin/users/{user_id}/details")
 def get_user_details(
     user_id: int,
     current_user: User = Depends(auth.get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Get detailed information about a user including their log lists and calls."""
+    """Get a user with their stats and log list summaries.
+
+    The calls of a list are paged in with /admin/lists/{list_id}/calls.
+    """
+    return user_details_flight.do(user_id, user_details, db, user_id)
+
+
+def user_details(db: Session, user_id: int) -> dict:
     user = crud.get_user(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Get user's log lists with call details
-    user_log_lists = crud.get_user_log_lists_with_calls(
-        db, user_id, POTENTIAL_SALE_CALL_TYPES)
+    # Get user's log lists, their calls are paged in on demand
+    user_log_lists = crud.get_user_log_list_summaries(db, user_id)
 
     # Calculate overall stats
-    user_stats = crud.get_user_transfer_rate(
-        db, user_id, POTENTIAL_SALE_CALL_TYPES)
+    user_stats = crud.get_user_transfer_rate(db, user_id)
 
     return {
         "user": {
@@ -700,39 +1038,97 @@ def get_user_details(
 
 # Analytics endpoints for admin dashboard
 
+LEADERBOARD_FIELDS = ("user_id", "username", "transfer_rate", "total_calls",
+                      "potential_calls", "rank")
+
+
+def ranking(db: Session, window: str, k: int, min_calls: int, bottom: bool = False) -> list:
+    """Top (or bottom) k agents of a window, from the leaderboard once it is loaded."""
+    if leaderboard.board.loaded:
+        return leaderboard.board.top(db, window, k, min_calls, bottom)
+    ranked = leaderboard.recompute(db, window, min_calls)
+    return (ranked[::-1] if bottom else ranked)[:k]
+
+
+@app.get("/admin/analytics/leaderboard")
+def get_leaderboard(
+    request: Request,
+    window: str = "all",
+    k: int = 10,
+    min_calls: int = 0,
+    user_id: Optional[int] = None,
+    current_user: User = Depends(auth.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Best and worst agents by transfer rate, and one agent's rank (?format=columnar)."""
+    if window not in leaderboard.WINDOWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"window must be one of {', '.join(leaderboard.WINDOWS)}"
+        )
+    if min_calls not in leaderboard.LEADERBOARD_MIN_CALLS:
+        raise HTTPException(
+            status_code=400,
+            detail="min_calls must be one of "
+                   f"{', '.join(map(str, leaderboard.LEADERBOARD_MIN_CALLS))} (LEADERBOARD_MIN_CALLS)"
+        )
+    if not 1 <= k <= 100:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 100")
+
+    if leaderboard.board.loaded:
+        agents = leaderboard.board.size(db, window, min_calls)
+        agent = leaderboard.board.rank(db, user_id, window, min_calls) if user_id else None
+    else:
+        ranked = leaderboard.recompute(db, window, min_calls)
+        agents = len(ranked)
+        agent = next((entry for entry in ranked if entry["user_id"] == user_id), None)
+
+    def columns(entries: list) -> dict:
+        return {name: [entry[name] for entry in entries] for name in LEADERBOARD_FIELDS}
+
+    return payloads.render(request, {
+        "top": columns(ranking(db, window, k, min_calls)),
+        "bottom": columns(ranking(db, window, k, min_calls, bottom=True)),
+        "agent": agent,
+        "agents": agents,
+        "window": window,
+        "min_calls": min_calls
+    }, ("top", "bottom"))
+
+
+@app.get("/admin/analytics/leaderboard/check")
+def check_leaderboard(
+    current_user: User = Depends(auth.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Compare the leaderboard's rankings with a full recompute from call_logs."""
+    if not leaderboard.board.loaded:
+        raise HTTPException(status_code=409, detail="The leaderboard is disabled")
+    return leaderboard.board.check(db)
+
+
 @app.get("/admin/analytics/performance")
 def get_performance_analytics(
+    request: Request,
     days: int = 30,
     call_type: str = "all",
     current_user: User = Depends(auth.get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Get performance analytics data for charts."""
+    """Get performance analytics data for charts (?format=columnar, see app/payloads.py)."""
+    result = analytics_flight.do(("performance", days, call_type),
+                                 performance_analytics, db, days, call_type)
+    return payloads.render(request, result, ("top_performers", "call_distribution"))
+
+
+def performance_analytics(db: Session, days: int, call_type: str) -> dict:
     from sqlalchemy import func
 
     # Calculate date range (using naive datetime for database compatibility)
     cutoff_date = datetime.now() - timedelta(days=days)
 
-    # Get users - show all active users
-    users = crud.get_users(db)
-    user_performance = []
-
-    for user in users:
-        if user.role == UserRole.USER and user.is_active:
-            stats = crud.get_user_transfer_rate(
-                db, user.id, POTENTIAL_SALE_CALL_TYPES)
-            if stats["transfer_rate"] is not None:
-                user_performance.append({
-                    "username": user.username,
-                    "transfer_rate": stats["transfer_rate"],
-                    "total_calls": stats["total_calls"],
-                    "potential_calls": stats["potential_calls"]
-                })
-
-    # Sort by transfer rate and show top 10
-    user_performance = sorted(
-        user_performance, key=lambda x: x["transfer_rate"], reverse=True)
-    top_performers = user_performance[:10]  # Show top 10 performers
+    # Top 10 active agents by transfer rate, see app/leaderboard.py
+    top_performers = ranking(db, "all", 10, 0)
 
     # Get call type distribution
     call_query = db.query(
@@ -745,21 +1141,32 @@ def get_performance_analytics(
     # Apply call type filter if specified
     if call_type != "all":
         if call_type == "potential":
-            call_query = call_query.filter(
-                models.CallLog.call_type.in_(POTENTIAL_SALE_CALL_TYPES)
-            )
+            call_query = call_query.filter(models.CallLog.is_potential.is_(True))
         else:
             call_query = call_query.filter(
                 models.CallLog.call_type == call_type)
 
-    call_type_stats = call_query.group_by(models.CallLog.call_type).all()
+    # Calls before the archive's horizon are counted from it, see app/archive.py
+    cold = archive.store.covering(cutoff_date)
+    if cold is not None:
+        call_query = call_query.filter(cold.hot())
 
-    call_distribution = [{"type": stat.call_type,
-                          "count": stat.count} for stat in call_type_stats]
+    distribution = {stat.call_type: stat.count
+                    for stat in call_query.group_by(models.CallLog.call_type).all()}
+    if cold is not None:
+        for name, count in cold.call_type_counts(
+                since=cutoff_date, **archive.analytics_filters(call_type)).items():
+            distribution[name] = distribution.get(name, 0) + count
 
     return {
-        "top_performers": top_performers,
-        "call_distribution": call_distribution,
+        "top_performers": {
+            name: [performer[name] for performer in top_performers]
+            for name in ("username", "transfer_rate", "total_calls", "potential_calls")
+        },
+        "call_distribution": {
+            "type": list(distribution),
+            "count": list(distribution.values())
+        },
         "filters_applied": {
             "days": days,
             "call_type": call_type
@@ -774,12 +1181,19 @@ def get_performance_analytics(
 
 @app.get("/admin/analytics/trends")
 def get_trend_analytics(
+    request: Request,
     days: int = 30,
     call_type: str = "all",
     current_user: User = Depends(auth.get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Get trend data for time-series charts."""
+    """Get trend data for time-series charts (?format=columnar, see app/payloads.py)."""
+    result = analytics_flight.do(("trends", days, call_type),
+                                 trend_analytics, db, days, call_type)
+    return payloads.render(request, result, ("trends",))
+
+
+def trend_analytics(db: Session, days: int, call_type: str) -> dict:
     from sqlalchemy import func, extract
 
     cutoff_date = datetime.now() - timedelta(days=days)
@@ -791,7 +1205,7 @@ def get_trend_analytics(
         func.count(models.CallLog.id).label('total_calls'),
         func.sum(
             case(
-                (models.CallLog.call_type.in_(POTENTIAL_SALE_CALL_TYPES), 1),
+                (models.CallLog.is_potential, 1),
                 else_=0
             )
         ).label('potential_calls')
@@ -802,45 +1216,75 @@ def get_trend_analytics(
     # Apply call type filter if specified
     if call_type != "all":
         if call_type == "potential":
-            query = query.filter(
-                models.CallLog.call_type.in_(POTENTIAL_SALE_CALL_TYPES)
-            )
+            query = query.filter(models.CallLog.is_potential.is_(True))
         else:
             query = query.filter(models.CallLog.call_type == call_type)
 
-    daily_calls = query.group_by(
-        func.date(models.CallLog.timestamp)
-    ).order_by(
-        func.date(models.CallLog.timestamp)
-    ).all()
-
-    trend_data = []
-    for day in daily_calls:
-        transfer_rate = (day.potential_calls / day.total_calls *
-                         100) if day.total_calls > 0 else 0
-        trend_data.append({
-            "date": day.date.isoformat(),
-            "total_calls": day.total_calls,
-            "potential_calls": day.potential_calls,
-            "transfer_rate": round(transfer_rate, 2)
-        })
+    # Calls before the archive's horizon are counted from it, see app/archive.py
+    cold = archive.store.covering(cutoff_date)
+    if cold is not None:
+        query = query.filter(cold.hot())
+
+    daily_calls = {
+        # SQLite returns DATE() results as strings
+        date.fromisoformat(day.date) if isinstance(day.date, str) else day.date:
+            (day.total_calls, day.potential_calls)
+        for day in query.group_by(
+            func.date(models.CallLog.timestamp)
+        ).order_by(
+            func.date(models.CallLog.timestamp)
+        ).all()
+    }
+    if cold is not None:
+        for day, (total, potential) in cold.daily_counts(
+                since=cutoff_date, **archive.analytics_filters(call_type)).items():
+            hot_total, hot_potential = daily_calls.get(day, (0, 0))
+            daily_calls[day] = (hot_total + total, hot_potential + potential)
+        daily_calls = dict(sorted(daily_calls.items()))
+
+    trends = {
+        "date": list(daily_calls),
+        "total_calls": [total for total, _ in daily_calls.values()],
+        "potential_calls": [potential for _, potential in daily_calls.values()],
+        "transfer_rate": [readmodels.transfer_rate(total, potential)
+                          for total, potential in daily_calls.values()]
+    }
+    total_days = len(daily_calls)
 
     return {
-        "trends": trend_data,
+        "trends": trends,
         "filters_applied": {
             "days": days,
             "call_type": call_type
         },
         "summary": {
-            "total_days": len(trend_data),
-            "avg_daily_calls": sum(d["total_calls"] for d in trend_data) / len(trend_data) if trend_data else 0,
-            "avg_transfer_rate": sum(d["transfer_rate"] for d in trend_data) / len(trend_data) if trend_data else 0
+            "total_days": total_days,
+            "avg_daily_calls": sum(trends["total_calls"]) / total_days if total_days else 0,
+            "avg_transfer_rate": sum(trends["transfer_rate"]) / total_days if total_days else 0
         }
     }
 
 
+def call_log_columns(logs: list, rates: dict) -> dict:
+    """Table of OwnedCallRows for the admin logs panel, with their owners' transfer rates."""
+    return {
+        "id": [log.id for log in logs],
+        "timestamp": [log.timestamp for log in logs],
+        "call_type": [log.call_type for log in logs],
+        "user.id": [log.owner_id for log in logs],
+        "user.username": [log.owner_username for log in logs],
+        "user.name": [log.owner_name for log in logs],
+        "user.role": [log.owner_role.value for log in logs],
+        "user.transfer_rate": [rates[log.owner_id]["transfer_rate"] for log in logs],
+        "log_list.id": [log.log_list_id for log in logs],
+        "log_list.name": [log.list_name for log in logs],
+        "is_potential_sale": [bool(log.is_potential) for log in logs]
+    }
+
+
 @app.get("/admin/analytics/call-logs")
 def get_filtered_call_logs(
+    request: Request,
     user_id: Optional[int] = None,
     call_type: Optional[str] = None,
     date_from: Optional[str] = None,
@@ -851,15 +1295,18 @@ def get_filtered_call_logs(
     current_user: User = Depends(auth.get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Get filtered call logs for the admin logs panel."""
-    query = db.query(models.CallLog).join(models.LogList).join(models.User)
+    """Get filtered call logs for the admin logs panel (?format=columnar, see app/payloads.py)."""
+    from sqlalchemy import func, select
+
+    query = readmodels.owned_calls()
+    from_date = to_date = None
 
     # Apply filters
     if user_id:
-        query = query.filter(models.User.id == user_id)
+        query = query.where(models.CallLog.owner_id == user_id)
 
     if call_type:
-        query = query.filter(models.CallLog.call_type == call_type)
+        query = query.where(models.CallLog.call_type == call_type)
 
     if date_from:
         try:
@@ -868,10 +1315,10 @@ def get_filtered_call_logs(
             # Convert to naive datetime for database compatibility
             from_date = from_date.replace(
                 tzinfo=None) if from_date.tzinfo else from_date
-            query = query.filter(models.CallLog.timestamp >= from_date)
+            query = query.where(models.CallLog.timestamp >= from_date)
         except ValueError:
             # If parsing fails, ignore the filter
-            pass
+            from_date = None
 
     if date_to:
         try:
@@ -879,61 +1326,42 @@ def get_filtered_call_logs(
             # Convert to naive datetime for database compatibility
             to_date = to_date.replace(
                 tzinfo=None) if to_date.tzinfo else to_date
-            query = query.filter(models.CallLog.timestamp <= to_date)
+            query = query.where(models.CallLog.timestamp <= to_date)
         except ValueError:
             # If parsing fails, ignore the filter
-            pass
+            to_date = None
 
     # Apply search filter
     if search:
         search_term = f"%{search}%"
-        query = query.filter(
+        query = query.where(
             models.User.username.ilike(search_term) |
             models.User.name.ilike(search_term) |
             models.LogList.name.ilike(search_term) |
             models.CallLog.call_type.ilike(search_term)
         )
 
-    # Get total count for pagination
-    total_count = query.count()
-
-    # Apply pagination and ordering
-    logs = query.order_by(models.CallLog.timestamp.desc()
-                          ).offset(offset).limit(limit).all()
-
-    # Format response
-    log_data = []
-    for log in logs:
-        log_list = db.query(models.LogList).filter(
-            models.LogList.id == log.log_list_id).first()
-        user = db.query(models.User).filter(
-            models.User.id == log_list.owner_id).first()
-
-        # Calculate user's transfer rate
-        user_stats = crud.get_user_transfer_rate(
-            db, user.id, POTENTIAL_SALE_CALL_TYPES)
-        transfer_rate = user_stats.get("transfer_rate") if user_stats else None
-
-        log_data.append({
-            "id": log.id,
-            "timestamp": log.timestamp.isoformat() if log.timestamp else None,
-            "call_type": log.call_type,
-            "user": {
-                "id": user.id,
-                "username": user.username,
-                "name": user.name,
-                "role": user.role.value,
-                "transfer_rate": transfer_rate
-            },
-            "log_list": {
-                "id": log_list.id,
-                "name": log_list.name
-            },
-            "is_potential_sale": log.call_type in POTENTIAL_SALE_CALL_TYPES
-        })
+    # Calls before the archive's horizon are read from it, see app/archive.py
+    cold = archive.store.covering(from_date)
+    if cold is not None:
+        total_count, logs = archive.page_calls(db, query, cold, {
+            "since": from_date, "until": to_date, "call_type": call_type,
+            "owner_id": user_id, "search": search, "owned": True}, offset, limit)
+    else:
+        # Get total count for pagination
+        total_count = db.execute(
+            select(func.count()).select_from(query.subquery())).scalar()
 
-    return {
-        "logs": log_data,
+        # Apply pagination and ordering
+        logs = readmodels.fetch(db, query.order_by(models.CallLog.timestamp.desc()
+                                                   ).offset(offset).limit(limit),
+                                readmodels.OwnedCallRow)
+
+    # Transfer rates of the agents on this page, in one query
+    rates = crud.get_transfer_rates(db, list({log.owner_id for log in logs}))
+
+    return payloads.render(request, {
+        "logs": call_log_columns(logs, rates),
         "pagination": {
             "total": total_count,
             "limit": limit,
@@ -947,7 +1375,84 @@ def get_filtered_call_logs(
             "date_to": date_to,
             "search": search
         }
-    }
+    }, ("logs",))
+
+# Sampling profiler endpoints (administrator only)
+
+@app.get("/admin/profiling")
+def get_profiling_status(
+    current_user: User = Depends(auth.get_current_admin_user)
+):
+    """Get profiler configuration and sample counts."""
+    return profiler.status()
+
+
+@app.put("/admin/profiling")
+def configure_profiling(
+    config: ProfilingConfig,
+    current_user: User = Depends(auth.get_current_admin_user)
+):
+    """Change the sample rate, route filter or sampling interval."""
+    profiler.configure(config.sample_rate, config.routes, config.interval_ms)
+    return profiler.status()
+
+
+@app.delete("/admin/profiling", status_code=204)
+def reset_profiling(
+    current_user: User = Depends(auth.get_current_admin_user)
+):
+    """Discard collected samples."""
+    profiler.reset()
+
+
+@app.get("/admin/profiling/collapsed", response_class=PlainTextResponse)
+def get_profile_collapsed(
+    current_user: User = Depends(auth.get_current_admin_user)
+):
+    """Collected stacks in collapsed format, for flamegraph tools."""
+    return profiler.collapsed()
+
+
+@app.get("/admin/profiling/speedscope")
+def get_profile_speedscope(
+    current_user: User = Depends(auth.get_current_admin_user)
+):
+    """Collected stacks as a speedscope JSON file."""
+    return JSONResponse(profiler.speedscope(), headers={
+        "Content-Disposition": "attachment; filename=profile.speedscope.json"
+    })
+
+
+@app.get("/admin/archive")
+def get_archive_status(
+    current_user: User = Depends(auth.get_current_admin_user)
+):
+    """The call archive's horizon and archived months."""
+    return archive.store.status()
+
+
+@app.get("/admin/jobs")
+def list_jobs(
+    current_user: User = Depends(auth.get_current_admin_user)
+):
+    """Scheduled jobs with their schedule and last run."""
+    return scheduler.status()
+
+
+@app.post("/admin/jobs/{name}/run", status_code=202)
+def run_job(
+    name: str,
+    current_user: User = Depends(auth.get_current_admin_user)
+):
+    """Start a scheduled job now, outside its schedule; GET /admin/jobs shows how it went."""
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # In the scheduler's thread: a long job must not hold an admin slot or
+    # run under the request's statement timeout
+    if not scheduler.trigger(name):
+        raise HTTPException(status_code=409, detail="The job is already running in this worker")
+    return next(job for job in scheduler.status() if job["name"] == name)
+
 
 # Redirect /admin to /admin/dashboard
 
@@ -971,33 +1476,18 @@ def get_user_lists(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Get user's lists
-    lists = db.query(models.LogList).filter(
-        models.LogList.owner_id == user_id).all()
-
-    # Calculate statistics for each list
+    # Get user's lists with their call counts, in one query
     list_data = []
-    for log_list in lists:
-        # Get call count for this list
-        call_count = db.query(models.CallLog).filter(
-            models.CallLog.log_list_id == log_list.id
-        ).count()
-
-        # Get last call date
-        last_call = db.query(models.CallLog).filter(
-            models.CallLog.log_list_id == log_list.id
-        ).order_by(models.CallLog.timestamp.desc()).first()
-
+    for stats in readmodels.list_stats(db, user_id):
         list_data.append({
-            "id": log_list.id,
-            "name": log_list.name,
-            "call_count": call_count,
-            "last_call_date": last_call.timestamp.isoformat() if last_call else None
+            "id": stats.id,
+            "name": stats.name,
+            "call_count": stats.total_calls,
+            "last_call_date": stats.latest_call.isoformat() if stats.latest_call else None
         })
 
     # Get user's overall statistics
-    user_stats = crud.get_user_transfer_rate(
-        db, user_id, POTENTIAL_SALE_CALL_TYPES)
+    user_stats = crud.get_user_transfer_rate(db, user_id)
 
     return {
         "id": user.id,
@@ -1011,15 +1501,51 @@ def get_user_lists(
     }
 
 
-@app.get("/admin/lists/{list_id}/details")
-def get_list_details(
-    list_id: int,
-    user_id: Optional[int] = None,
-    current_user: User = Depends(auth.get_current_admin_user),
-    db: Session = Depends(get_db)
-):
-    """Get detailed information about a specific list."""
-    # Get the list
+# Calls per page of the list details modal
+LIST_CALLS_PAGE_SIZE = 50
+LIST_CALLS_MAX_PAGE_SIZE = 500
+
+
+def encode_list_cursor(key: tuple) -> Optional[str]:
+    """Opaque next_cursor for the (timestamp, id) key of a page's last call."""
+    if key is None:
+        return None
+    timestamp, call_id = key
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    return base64.urlsafe_b64encode(f"{timestamp}|{call_id}".encode()).decode()
+
+
+def decode_list_cursor(cursor: str) -> tuple:
+    """The key of a next_cursor, its timestamp kept as text to bind as stored."""
+    try:
+        timestamp, call_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        datetime.fromisoformat(timestamp)
+        return timestamp, int(call_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def list_calls_page(db: Session, list_id: int, limit: int, cursor: Optional[str] = None) -> dict:
+    if not 1 <= limit <= LIST_CALLS_MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"limit must be between 1 and {LIST_CALLS_MAX_PAGE_SIZE}"
+        )
+    before = decode_list_cursor(cursor) if cursor else None
+    calls, next_key = readmodels.list_calls_page(db, list_id, limit, before)
+    return {
+        "calls": [{
+            "id": call.id,
+            "timestamp": call.timestamp.isoformat() if call.timestamp else None,
+            "call_type": call.call_type,
+            "is_potential_sale": bool(call.is_potential)
+        } for call in calls],
+        "next_cursor": encode_list_cursor(next_key)
+    }
+
+
+def get_accessible_list(db: Session, list_id: int, user_id: Optional[int]):
     log_list = db.query(models.LogList).filter(
         models.LogList.id == list_id).first()
     if not log_list:
@@ -1028,39 +1554,49 @@ def get_list_details(
     # Verify access if user_id is provided
     if user_id and log_list.owner_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied")
+    return log_list
 
-    # Get calls for this list (last 50 calls)
-    calls = db.query(models.CallLog).filter(
-        models.CallLog.log_list_id == list_id
-    ).order_by(models.CallLog.timestamp.desc()).limit(50).all()
-
-    # Format call data
-    call_data = []
-    potential_calls = 0
 
-    for call in calls:
-        is_potential = call.call_type in POTENTIAL_SALE_CALL_TYPES
-        if is_potential:
-            potential_calls += 1
+@app.get("/admin/lists/{list_id}/details")
+def get_list_details(
+    list_id: int,
+    user_id: Optional[int] = None,
+    current_user: User = Depends(auth.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Get a list's statistics and its most recent calls.
 
-        call_data.append({
-            "id": call.id,
-            "timestamp": call.timestamp.isoformat() if call.timestamp else None,
-            "call_type": call.call_type,
-            "is_potential_sale": is_potential
-        })
+    Older calls are paged in with /admin/lists/{list_id}/calls?cursor=<next_cursor>.
+    """
+    log_list = get_accessible_list(db, list_id, user_id)
 
-    # Calculate transfer rate for this list
-    total_calls = len(calls)
-    transfer_rate = (potential_calls / total_calls *
-                     100) if total_calls > 0 else 0
+    # Counted over all of the list's calls, not just the first page
+    stats = readmodels.list_stats(db, log_list_id=list_id)[0]
 
     return {
         "id": log_list.id,
         "name": log_list.name,
         "owner_id": log_list.owner_id,
-        "calls": call_data,
-        "total_calls": total_calls,
-        "potential_calls": potential_calls,
-        "transfer_rate": round(transfer_rate, 2)
+        **list_calls_page(db, list_id, LIST_CALLS_PAGE_SIZE),
+        "total_calls": stats.total_calls,
+        "potential_calls": stats.potential_calls,
+        "transfer_rate": stats.transfer_rate
     }
+
+
+@app.get("/admin/lists/{list_id}/calls")
+def get_list_calls(
+    list_id: int,
+    user_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = LIST_CALLS_PAGE_SIZE,
+    current_user: User = Depends(auth.get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Get a page of a list's calls, most recent first.
+
+    Pass the next_cursor of the previous page for the next one; it is null
+    after the last page.
+    """
+    get_accessible_list(db, list_id, user_id)
+    return list_calls_page(db, list_id, limit, cursor)
@@ -0,0 +1,466 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots of exited workers are then kept as they are
+    fcntl = None
+
+# Multi-worker aggregation: when set, every worker periodically writes a
+# snapshot of its metrics into this directory and /metrics sums them all.
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# A snapshot this old is of an exited worker even if its pid is in use again
+RETIRE_AFTER_SECONDS = max(600, 10 * METRICS_FLUSH_SECONDS)
+
+# Latency buckets in seconds, from sub-millisecond up to slow dashboards
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# Updates are deliberately lock-free: a lock costs several times more than
+# the update itself, and under the GIL an increment is only lost if a thread
+# switch lands inside a single "+=", which is rare enough for monitoring.
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Get the child for a set of label values (positional, in order)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(
+                    tuple(str(v) for v in values), self._new_child())
+                self._children[values] = child
+        return child
+
+    def samples(self) -> dict:
+        """Snapshot as {label values: value}, used for rendering and merging."""
+        with self._lock:
+            children = {tuple(str(v) for v in k): c for k, c in self._children.items()}
+        return {k: self._sample(c) for k, c in children.items()}
+
+    def _sample(self, child):
+        return child.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """Gauge set directly, or computed at scrape time from a callback."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def samples(self) -> dict:
+        if self.callback is not None:
+            try:
+                self._default.set(self.callback())
+            except Exception:
+                pass
+        return super().samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _sample(self, child):
+        return {"counts": list(child.counts), "sum": child.sum}
+
+
+class Registry:
+    """Holds every metric of the process and renders them for Prometheus."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> dict:
+        """Serializable state of every metric."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            m.name: {
+                "kind": m.kind,
+                "documentation": m.documentation,
+                "labelnames": list(m.labelnames),
+                "buckets": list(getattr(m, "buckets", ())),
+                "samples": [[list(k), v] for k, v in m.samples().items()],
+            }
+            for m in metrics
+        }
+
+
+registry = Registry()
+
+
+def _merge(target: dict, snapshot: dict):
+    """Sum one worker's snapshot into an aggregate snapshot."""
+    for name, metric in snapshot.items():
+        merged = target.setdefault(name, {**metric, "samples": {}})
+        samples = merged["samples"]
+        for labels, value in metric["samples"]:
+            key = tuple(labels)
+            current = samples.get(key)
+            if current is None:
+                samples[key] = value if not isinstance(value, dict) else \
+                    {"counts": list(value["counts"]), "sum": value["sum"]}
+            elif isinstance(value, dict):
+                current["counts"] = [a + b for a, b in zip(current["counts"], value["counts"])]
+                current["sum"] += value["sum"]
+            else:
+                samples[key] = current + value
+
+
+# (pid, snapshot file name) of this process
+_instance = None
+
+
+def _snapshot_path() -> str:
+    global _instance
+    pid = os.getpid()
+    if _instance is None or _instance[0] != pid:
+        # The start time keeps a worker that got an exited worker's pid from
+        # overwriting its snapshot, which would turn counters back
+        _instance = (pid, f"metrics-{pid}-{time.time_ns()}.json")
+    return os.path.join(METRICS_MULTIPROC_DIR, _instance[1])
+
+
+def _retired_path() -> str:
+    return os.path.join(METRICS_MULTIPROC_DIR, "retired.json")
+
+
+def _write_json(path: str, data: dict):
+    # Into a temporary file first, so readers never see half of it
+    fd, tmp_path = tempfile.mkstemp(dir=METRICS_MULTIPROC_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot():
+    """Write this worker's snapshot for the other workers to aggregate."""
+    if not METRICS_MULTIPROC_DIR:
+        return
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    _write_json(_snapshot_path(), {"written_at": time.time(), "metrics": registry.snapshot()})
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+
+def start_multiprocess_flusher():
+    """Start the background snapshot writer when multi-worker mode is on."""
+    if METRICS_MULTIPROC_DIR:
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def collect() -> dict:
+    """Aggregate snapshot of this process, plus all workers in multi-worker mode."""
+    if not METRICS_MULTIPROC_DIR:
+        aggregate = {}
+        _merge(aggregate, registry.snapshot())
+        return aggregate
+
+    write_snapshot()
+    aggregate, exited = {}, []
+    now = time.time()
+    stale_before = now - 3 * METRICS_FLUSH_SECONDS
+    # Held while reading too, so a snapshot is never missed between being
+    # retired by another worker and showing up in retired.json
+    with _retire_lock():
+        retired = (_read_json(_retired_path()) or {}).get("metrics", {})
+        _merge(aggregate, retired)
+        for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "metrics-*.json")):
+            data = _read_json(path)
+            if data is None:
+                continue
+            metrics = data["metrics"]
+            if data["written_at"] < stale_before:
+                # Counters of exited workers still count, their gauges do not
+                metrics = {n: m for n, m in metrics.items() if m["kind"] != "gauge"}
+                if _exited(path, data["written_at"], now):
+                    exited.append((path, metrics))
+            _merge(aggregate, metrics)
+        if exited:
+            _retire(retired, exited)
+    return aggregate
+
+
+@contextmanager
+def _retire_lock():
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(METRICS_MULTIPROC_DIR, "retired.lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _exited(path: str, written_at: float, now: float) -> bool:
+    """Whether the worker that wrote a stale snapshot is gone."""
+    if fcntl is None:
+        return False
+    if written_at < now - RETIRE_AFTER_SECONDS:
+        return True
+    try:
+        pid = int(os.path.basename(path)[len("metrics-"):-len(".json")].split("-")[0])
+        os.kill(pid, 0)
+    except ValueError:
+        return False
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        # Alive, as another user
+        pass
+    return False
+
+
+def _retire(retired: dict, exited: list):
+    """Add exited workers' counters to retired.json and remove their snapshots."""
+    combined = {}
+    _merge(combined, retired)
+    for _, metrics in exited:
+        _merge(combined, metrics)
+    _write_json(_retired_path(), {"metrics": {
+        name: {**metric, "samples": [[list(labels), value]
+                                     for labels, value in metric["samples"].items()]}
+        for name, metric in combined.items()}})
+    for path, _ in exited:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() \
+        else str(int(value))
+
+
+def render_prometheus() -> str:
+    """Render all metrics in Prometheus text exposition format."""
+    lines = []
+    for name, metric in sorted(collect().items()):
+        lines.append(f"# HELP {name} {metric['documentation']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labelnames = metric["labelnames"]
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            bounds = list(metric["buckets"]) + [float("inf")]
+            for bound, count in zip(bounds, value["counts"]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{name}_bucket{_format_labels(labelnames, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(value['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labelnames, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# HTTP metrics
+http_requests = registry.counter(
+    "app_http_requests_total", "HTTP requests handled.",
+    ("method", "route", "status"))
+http_request_duration = registry.histogram(
+    "app_http_request_duration_seconds", "HTTP request latency.",
+    ("method", "route"))
+http_requests_in_progress = registry.gauge(
+    "app_http_requests_in_progress", "HTTP requests currently being handled.")
+
+
+def route_name(scope) -> str:
+    """Route template of a handled request, e.g. /admin/users/{user_id}."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Count requests and time them per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_progress.dec()
+            route = route_name(scope)
+            method = scope["method"]
+            http_requests.labels(method, route, status_code).inc()
+            http_request_duration.labels(method, route).observe(elapsed)
+
+
+def instrument_pool(engine):
+    """Expose connection pool saturation of an engine."""
+    from sqlalchemy import event
+
+    pool = engine.pool
+    checkouts = registry.counter(
+        "app_db_pool_checkouts_total", "Connections checked out of the pool.")
+    connects = registry.counter(
+        "app_db_pool_connections_opened_total", "New database connections opened.")
+    registry.gauge("app_db_pool_size", "Configured pool size.",
+                   callback=pool.size)
+    registry.gauge("app_db_pool_checked_out", "Connections currently checked out.",
+                   callback=pool.checkedout)
+    # QueuePool.overflow() starts at -pool_size, only overflow above zero is real
+    registry.gauge("app_db_pool_overflow", "Connections open beyond pool_size.",
+                   callback=lambda: max(0, pool.overflow()))
+
+    event.listen(engine, "checkout", lambda *args: checkouts.inc())
+    event.listen(engine, "connect", lambda *args: connects.inc())
@@ -0,0 +1,273 @@
+"""Schema changes for databases created by older versions.
+
+Run them as a deploy step, before starting the new version's workers:
+
+    python -m app.migrations            # apply pending steps
+    python -m app.migrations --check    # list them; exit 1 if any
+
+With MIGRATE_ON_STARTUP (the default) each worker also applies them at
+startup. Otherwise workers only check, and refuse to start on an out of
+date schema. Either way the steps run under one cross-process lock and
+skip what is already done, so concurrent runs are safe.
+
+On Postgres, indexes are built CONCURRENTLY and foreign keys are added
+NOT VALID and then validated, so that writes to call_logs carry on
+meanwhile.
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.schema import CreateTable
+
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() == "true"
+
+# create_all() only creates missing tables. Columns added to existing tables
+# are listed here and added by upgrade(), oldest first. Only additive changes
+# belong here: nullable columns and indexes that create_all() would have made.
+COLUMNS = [
+    ("users", "external_id", "VARCHAR"),
+    ("call_logs", "external_id", "VARCHAR"),
+    ("call_logs", "idempotency_key", "VARCHAR"),
+    ("call_logs", "owner_id", "INTEGER"),
+    ("call_logs", "is_potential", "BOOLEAN"),
+]
+
+INDEXES = [
+    ("ix_users_external_id", "users", "external_id", True),
+    ("ix_call_logs_external_id", "call_logs", "external_id", True),
+    ("ix_call_logs_idempotency_key", "call_logs", "idempotency_key", True),
+    ("ix_call_logs_owner_id_timestamp", "call_logs", "owner_id, timestamp, is_potential", False),
+    ("ix_call_logs_log_list_id_timestamp", "call_logs", "log_list_id, timestamp, id, is_potential", False),
+]
+
+# Rows per transaction when filling in call_logs.owner_id and is_potential
+BACKFILL_BATCH = 10000
+
+# Foreign keys whose ON DELETE action was added later, parents first:
+# (table, column, referred table, action). They must match the models.
+FOREIGN_KEYS = [
+    ("users", "created_by_id", "users", "SET NULL"),
+    ("log_lists", "owner_id", "users", "CASCADE"),
+    ("call_logs", "log_list_id", "log_lists", "CASCADE"),
+]
+
+
+def upgrade(engine):
+    """Create missing tables and bring older ones up to the current models.
+
+    Concurrent callers take the same lock, so one migrates while the others
+    wait, then find nothing left to do.
+    """
+    from app.models import Base
+    from app.scheduler import locks_for
+
+    with locks_for(engine).hold("schema-migrations", wait=True):
+        Base.metadata.create_all(engine)
+        # Planned under the lock, so steps another worker finished are skipped
+        _upgrade(engine, _plan(engine))
+
+
+def pending(engine) -> list:
+    """The steps upgrade() would take, as short descriptions."""
+    plan = _plan(engine)
+    return ([f"create table {table}" for table in plan["tables"]]
+            + [f"add column {table}.{column}" for table, column, _ in plan["columns"]]
+            + (["backfill call_logs.owner_id and is_potential"] if plan["backfill"] else [])
+            + [f"create index {name}" for name, *_ in plan["indexes"]]
+            + [f"set ON DELETE {action} on {table}.{column}"
+               for table, column, _, action, _ in plan["foreign_keys"]]
+            + [f"validate {name} on {table}" for table, name in plan["unvalidated"]])
+
+
+def check(engine):
+    """Raise RuntimeError if the schema needs migrating."""
+    steps = pending(engine)
+    if steps:
+        raise RuntimeError(
+            f"The database schema is out of date ({'; '.join(steps)}): "
+            "run python -m app.migrations")
+
+
+def _plan(engine) -> dict:
+    from app.models import Base
+
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    columns = [(table, column, ddl) for table, column, ddl in COLUMNS if table in tables
+               and column not in {c["name"] for c in inspector.get_columns(table)}]
+    indexes = {table: _valid_indexes(engine, inspector, table)
+               for table in {table for _, table, _, _ in INDEXES} if table in tables}
+    stale = []
+    for table, column, referred, action in FOREIGN_KEYS:
+        if table not in tables:
+            continue
+        current, name = _on_delete(inspector, table, column, referred)
+        if current != action:
+            stale.append((table, column, referred, action, name))
+    return {
+        "tables": [table for table in Base.metadata.tables if table not in tables],
+        "columns": columns,
+        # The owner index is created once the backfill has finished, so its
+        # absence means rows may still need one
+        "backfill": "call_logs" in tables
+                    and "ix_call_logs_owner_id_timestamp" not in indexes["call_logs"],
+        "indexes": [index for index in INDEXES
+                    if index[1] in tables and index[0] not in indexes[index[1]]],
+        "foreign_keys": stale,
+        "unvalidated": _unvalidated_foreign_keys(engine),
+    }
+
+
+def _upgrade(engine, plan):
+    postgres = engine.dialect.name == "postgresql"
+    if plan["columns"]:
+        with engine.begin() as conn:
+            for table, column, ddl in plan["columns"]:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    if plan["backfill"]:
+        _backfill_call_owners(engine)
+    if plan["indexes"] and postgres:
+        # CONCURRENTLY cannot run in a transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for name, table, column, unique in plan["indexes"]:
+                kind = "UNIQUE INDEX" if unique else "INDEX"
+                # A concurrent build that failed leaves an invalid index behind
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                conn.execute(text(f"CREATE {kind} CONCURRENTLY {name} ON {table} ({column})"))
+    elif plan["indexes"]:
+        with engine.begin() as conn:
+            for name, table, column, unique in plan["indexes"]:
+                kind = "UNIQUE INDEX" if unique else "INDEX"
+                conn.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({column})"))
+
+    stale = plan["foreign_keys"]
+    if stale and not postgres:
+        _rebuild_sqlite_tables(engine, [table for table, *_ in stale])
+    elif stale:
+        # NOT VALID skips checking the existing rows, so the table is only
+        # locked for the swap itself
+        with engine.begin() as conn:
+            for table, column, referred, action, name in stale:
+                if name:
+                    conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+                conn.execute(text(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fkey "
+                    f"FOREIGN KEY ({column}) REFERENCES {referred} (id) "
+                    f"ON DELETE {action} NOT VALID"))
+    if postgres:
+        # Validating checks the rows under a lock that lets writes through
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for table, name in _unvalidated_foreign_keys(engine):
+                conn.execute(text(f'ALTER TABLE {table} VALIDATE CONSTRAINT "{name}"'))
+
+
+def _valid_indexes(engine, inspector, table) -> set:
+    names = {index["name"] for index in inspector.get_indexes(table)}
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            names -= set(conn.execute(text(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE NOT i.indisvalid")).scalars())
+    return names
+
+
+def _unvalidated_foreign_keys(engine) -> list:
+    """(table, constraint) of our foreign keys left NOT VALID, on Postgres."""
+    if engine.dialect.name != "postgresql":
+        return []
+    names = {f"{table}_{column}_fkey": table for table, column, _, _ in FOREIGN_KEYS}
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT conname FROM pg_constraint WHERE contype = 'f' AND NOT convalidated"))
+        return [(names[name], name) for name in rows.scalars() if name in names]
+
+
+def _backfill_call_owners(engine):
+    """Fill in call_logs.owner_id and is_potential for rows older than them."""
+    from app.models import POTENTIAL_SALE_CALL_TYPES
+
+    update = text(
+        "UPDATE call_logs SET "
+        "owner_id = (SELECT owner_id FROM log_lists WHERE log_lists.id = call_logs.log_list_id), "
+        "is_potential = call_type IN :potential "
+        "WHERE id > :low AND id <= :high AND (owner_id IS NULL OR is_potential IS NULL)"
+    ).bindparams(bindparam("potential", expanding=True))
+    with engine.connect() as conn:
+        low, high = conn.execute(text(
+            "SELECT min(id), max(id) FROM call_logs "
+            "WHERE owner_id IS NULL OR is_potential IS NULL")).one()
+        conn.commit()
+        if low is None:
+            return
+        # Batches by id range, so each one commits quickly and rows of
+        # deleted lists, which keep a NULL owner, cannot stall the loop
+        for start in range(low - 1, high, BACKFILL_BATCH):
+            conn.execute(update, {"potential": sorted(POTENTIAL_SALE_CALL_TYPES),
+                                  "low": start, "high": start + BACKFILL_BATCH})
+            conn.commit()
+
+
+def _on_delete(inspector, table, column, referred):
+    """(ON DELETE action or None, constraint name) of a foreign key."""
+    for fk in inspector.get_foreign_keys(table):
+        if fk["constrained_columns"] == [column] and fk["referred_table"] == referred:
+            action = (fk.get("options") or {}).get("ondelete")
+            return (action.upper() if action else None), fk.get("name")
+    return None, None
+
+
+def _rebuild_sqlite_tables(engine, tables):
+    # SQLite cannot change a constraint: create each table anew from the
+    # model, copy the rows over and swap it in, with foreign keys off
+    # meanwhile (https://www.sqlite.org/lang_altertable.html#otheralter)
+    from app.models import Base
+
+    with engine.connect() as conn:
+        # Outside a transaction, where SQLite ignores this pragma
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        try:
+            for name in dict.fromkeys(tables):
+                table = Base.metadata.tables[name]
+                existing = {c["name"] for c in inspect(conn).get_columns(name)}
+                columns = ", ".join(f'"{c.name}"' for c in table.columns if c.name in existing)
+                ddl = str(CreateTable(table).compile(dialect=conn.dialect)).strip()
+                conn.exec_driver_sql(f"DROP TABLE IF EXISTS {name}__new")
+                conn.exec_driver_sql(ddl.replace(
+                    f"CREATE TABLE {name} ", f"CREATE TABLE {name}__new ", 1))
+                conn.exec_driver_sql(
+                    f"INSERT INTO {name}__new ({columns}) SELECT {columns} FROM {name}")
+                conn.exec_driver_sql(f"DROP TABLE {name}")
+                conn.exec_driver_sql(f"ALTER TABLE {name}__new RENAME TO {name}")
+                for index in table.indexes:
+                    index.create(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+            conn.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bring the database schema up to date.")
+    parser.add_argument("--check", action="store_true",
+                        help="Only list the pending steps; exit 1 if there are any")
+    args = parser.parse_args(argv)
+
+    from app.database import engine
+
+    steps = pending(engine)
+    for step in steps:
+        print(step)
+    if args.check:
+        sys.exit(1 if steps else 0)
+    if steps:
+        upgrade(engine)
+    print("The database schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,23 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey, Boolean, Enum
+from sqlalchemy import (
+    Column, Integer, String, DateTime, Float, func, ForeignKey, Boolean, Enum, Index
+)
 from sqlalchemy.orm import relationship
 from app.database import Base
 import enum
 
 
+# Define your potential sale call types
+POTENTIAL_SALE_CALL_TYPES = {
+    "AOD", "APPOINTMENT", "T2", "HPA", "AFCT2", "AFCAPPOINTMENT", "NON-MED"
+}
+
+# Every call type an agent or the phone system may log
+CALL_TYPES = POTENTIAL_SALE_CALL_TYPES | {
+    "CUSTOMER SERVICE", "INVALID", "PROVIDER", "BROKER", "U65",
+    "LOYALTY", "CALLBLUE", "SEMINAR"
+}
+
+
 class UserRole(enum.Enum):
     ADMIN = "ADMIN"
     USER = "USER"
@@ -20,7 +34,9 @@ class User(Base):
     is_active = Column(Boolean, default=True, nullable=False)
     must_change_password = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    created_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_by_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    # Agent id in the phone system (CTI), see app/cti.py
+    external_id = Column(String, unique=True, index=True, nullable=True)
 
     # Relationships
     log_lists = relationship("LogList", back_populates="owner")
@@ -31,19 +47,72 @@ class LogList(Base):
     __tablename__ = "log_lists"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
-    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Deleting a user deletes their lists, and with them their calls, in the
+    # database; see crud.purge_user and migrations.FOREIGN_KEYS
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     call_logs = relationship(
         "CallLog", back_populates="log_list", cascade="all, delete-orphan")
     owner = relationship("User", back_populates="log_lists")
 
 
+def _is_potential(context) -> bool:
+    return context.get_current_parameters()["call_type"] in POTENTIAL_SALE_CALL_TYPES
+
+
 class CallLog(Base):
     __tablename__ = "call_logs"
+    __table_args__ = (
+        # Per-agent stats and call lists, answered from the index alone
+        Index("ix_call_logs_owner_id_timestamp", "owner_id", "timestamp", "is_potential"),
+        # A list's calls a page at a time, see readmodels.list_calls_page
+        Index("ix_call_logs_log_list_id_timestamp", "log_list_id", "timestamp", "id",
+              "is_potential"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     call_type = Column(String, nullable=False)
     timestamp = Column(DateTime(timezone=True),
                        server_default=func.now(), nullable=False)
-    log_list_id = Column(Integer, ForeignKey("log_lists.id"), nullable=False)
+    log_list_id = Column(Integer, ForeignKey("log_lists.id", ondelete="CASCADE"), nullable=False)
+    # Call id in the phone system; unique so pushed calls are stored once
+    external_id = Column(String, unique=True, index=True, nullable=True)
+    # "<user id>:<Idempotency-Key>" of the request that logged the call
+    idempotency_key = Column(String, unique=True, index=True, nullable=True)
+    # Copies of the list's owner and of whether call_type is a potential sale,
+    # so per-agent stats need no join. Writers set owner_id, is_potential
+    # defaults from call_type; crud.reassign_log_lists keeps owner_id in step.
+    owner_id = Column(Integer, nullable=True)
+    is_potential = Column(Boolean, nullable=True, default=_is_potential)
     log_list = relationship("LogList", back_populates="call_logs")
+
+
+class UserSession(Base):
+    """A login session; the browser holds its refresh token, see app/sessions.py."""
+    __tablename__ = "user_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"),
+                     index=True, nullable=False)
+    # SHA-256 of the current refresh token, and of the one it replaced
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    previous_token_hash = Column(String(64), index=True, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    rotated_at = Column(DateTime(timezone=True), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class ScheduledJob(Base):
+    """The last run of a periodic job, shared by all workers; see app/scheduler.py."""
+    __tablename__ = "scheduled_jobs"
+
+    name = Column(String, primary_key=True)
+    # The scheduled time the job last ran for; workers skip a time already run
+    last_scheduled_at = Column(DateTime(timezone=True), nullable=True)
+    last_started_at = Column(DateTime(timezone=True), nullable=True)
+    last_duration = Column(Float, nullable=True)
+    # "ok" or "failed", and the error of a failed run
+    last_status = Column(String, nullable=True)
+    last_error = Column(String, nullable=True)
+    runs = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,104 @@
+"""JSON responses of the analytics endpoints, as rows or as columns.
+
+The analytics computations return their tables as columns: a dict of
+equally long lists, one per field. Dotted field names ("user.id") stand
+for nested objects. By default they are sent as they always were: a list
+of one object per row, with ISO 8601 dates. A client that asks for
+?format=columnar, or sends Accept: application/vnd.transfer.columnar+json,
+gets the columns as they are, with dates and timestamps as Unix seconds.
+Field names then appear once per table instead of once per row, which makes
+the payload several times smaller and faster to encode and to parse.
+
+Both forms are encoded with orjson when it is installed.
+"""
+import json
+from datetime import date, datetime, timezone
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Falls back to the json module, only slower
+    orjson = None
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.transfer.columnar+json"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson when available.
+
+    Content must already be JSON types: FastAPI's jsonable_encoder, the
+    slow part of the default path, is skipped.
+    """
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":")).encode("utf-8")
+
+
+def wants_columnar(request: Request) -> bool:
+    requested = request.query_params.get("format")
+    if requested:
+        return requested == "columnar"
+    return COLUMNAR_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def _epoch(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        # Naive timestamps are stored in UTC
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp())
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _is_time(values: list) -> bool:
+    sample = next((value for value in values if value is not None), None)
+    return isinstance(sample, (date, datetime))
+
+
+def as_columns(columns: dict) -> dict:
+    """Columns in their columnar JSON form, dates and timestamps as Unix seconds."""
+    return {name: [_epoch(value) for value in values] if _is_time(values) else values
+            for name, values in columns.items()}
+
+
+def _as_rows(columns: dict) -> list:
+    names = list(columns)
+    values = [[_iso(value) for value in column] if _is_time(column) else column
+              for column in columns.values()]
+    if not any("." in name for name in names):
+        return [dict(zip(names, row)) for row in zip(*values)]
+    paths = [name.split(".") for name in names]
+    rows = []
+    for row in zip(*values):
+        item = {}
+        for path, value in zip(paths, row):
+            target = item
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+        rows.append(item)
+    return rows
+
+
+def render(request: Request, payload: dict, tables: tuple) -> FastJSONResponse:
+    """Respond with payload, its tables (keys of column dicts) in the requested form."""
+    columnar = wants_columnar(request)
+    body = dict(payload)
+    for name in tables:
+        body[name] = as_columns(payload[name]) if columnar else _as_rows(payload[name])
+    if columnar:
+        body["format"] = "columnar"
+    return FastJSONResponse(
+        body, media_type=COLUMNAR_MEDIA_TYPE if columnar else None,
+        headers={"Vary": "Accept"})
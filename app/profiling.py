@@ -0,0 +1,245 @@
+import os
+import random
+import sys
+import threading
+import time
+from itertools import count
+
+from starlette.routing import Match
+
+# Sampling profiler configuration. Off unless PROFILE_SAMPLE_RATE > 0, and
+# adjustable at runtime through /admin/profiling.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ROUTES = os.getenv("PROFILE_ROUTES", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Safety limits so the profiler can stay on in production
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "4"))
+PROFILE_MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", "10000"))
+PROFILE_MAX_DEPTH = 128
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _frame_label(code) -> tuple:
+    """(name, file, line) describing a code object."""
+    filename = code.co_filename
+    if filename.startswith(_APP_ROOT):
+        filename = os.path.relpath(filename, _APP_ROOT)
+    else:
+        # Trim site-packages paths down to the package
+        marker = "site-packages" + os.sep
+        if marker in filename:
+            filename = filename.split(marker, 1)[1]
+    return (getattr(code, "co_qualname", code.co_name), filename, code.co_firstlineno)
+
+
+class Profiler:
+    """Statistical profiler that samples the stacks of selected requests.
+
+    A request is selected with probability sample_rate (optionally only for
+    some routes). While at least one selected request is running, a
+    background thread snapshots every thread's stack each interval and keeps
+    those running a selected route's endpoint, aggregated per route.
+    """
+
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, routes=PROFILE_ROUTES,
+                 interval_ms=PROFILE_INTERVAL_MS):
+        self.sample_rate = 0.0
+        self.routes = set()
+        self.interval = 0.005
+        self.configure(sample_rate, routes, interval_ms)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._ids = count()
+        # request id -> (endpoint code object, route path)
+        self._active = {}
+        self._thread = None
+        self._labels = {}
+        # (route, stack of frame labels) -> sample count
+        self.stacks = {}
+        self.samples = 0
+        self.dropped = 0
+        self.requests_profiled = 0
+        self.started_at = time.time()
+
+    def configure(self, sample_rate=None, routes=None, interval_ms=None):
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        if routes is not None:
+            if isinstance(routes, str):
+                routes = routes.split(",")
+            self.routes = {r.strip() for r in routes if r.strip()}
+        if interval_ms is not None:
+            # Below 1ms the sampler itself becomes the hot spot
+            self.interval = max(1.0, float(interval_ms)) / 1000
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def status(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "routes": sorted(self.routes),
+            "interval_ms": self.interval * 1000,
+            "requests_profiled": self.requests_profiled,
+            "samples": self.samples,
+            "dropped_samples": self.dropped,
+            "unique_stacks": len(self.stacks),
+            "in_flight": len(self._active),
+            "since": self.started_at,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.stacks = {}
+            self.samples = 0
+            self.dropped = 0
+            self.requests_profiled = 0
+            self.started_at = time.time()
+
+    def begin(self, code, route: str):
+        """Start sampling a request; returns a handle for end(), or None."""
+        with self._lock:
+            if len(self._active) >= PROFILE_MAX_CONCURRENT:
+                return None
+            request_id = next(self._ids)
+            self._active[request_id] = (code, route)
+            self.requests_profiled += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+        return request_id
+
+    def end(self, request_id):
+        with self._lock:
+            self._active.pop(request_id, None)
+
+    def _label(self, code) -> tuple:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = _frame_label(code)
+        return label
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._wakeup.wait()
+                targets = {code: route for code, route in self._active.values()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self._sample(frame, targets)
+            time.sleep(self.interval)
+
+    def _sample(self, frame, targets):
+        codes = []
+        route = None
+        while frame is not None and len(codes) < PROFILE_MAX_DEPTH:
+            codes.append(frame.f_code)
+            route = targets.get(frame.f_code)
+            if route is not None:
+                break
+            frame = frame.f_back
+        if route is None:
+            return
+        key = (route, tuple(self._label(code) for code in reversed(codes)))
+        with self._lock:
+            if key in self.stacks:
+                self.stacks[key] += 1
+            elif len(self.stacks) < PROFILE_MAX_STACKS:
+                self.stacks[key] = 1
+            else:
+                self.dropped += 1
+                return
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Stacks in collapsed format (flamegraph.pl, inferno, speedscope)."""
+        with self._lock:
+            stacks = list(self.stacks.items())
+        lines = []
+        for (route, frames), samples in sorted(stacks):
+            names = [route] + [f"{name} ({filename}:{line})" for name, filename, line in frames]
+            lines.append(";".join(n.replace(";", ":") for n in names) + f" {samples}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> dict:
+        """Stacks as a speedscope file, one sampled profile per route."""
+        with self._lock:
+            stacks = list(self.stacks.items())
+        frame_index = {}
+        frames = []
+        profiles = {}
+        interval_ms = self.interval * 1000
+        for (route, stack), samples in sorted(stacks):
+            indices = []
+            for label in stack:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    name, filename, line = label
+                    frames.append({"name": name, "file": filename, "line": line})
+                indices.append(frame_index[label])
+            profile = profiles.setdefault(route, {
+                "type": "sampled",
+                "name": route,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": 0,
+                "samples": [],
+                "weights": [],
+            })
+            profile["samples"].append(indices)
+            profile["weights"].append(samples * interval_ms)
+            profile["endValue"] += samples * interval_ms
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values()),
+            "name": "transfer_rate_app",
+            "exporter": "app.profiling",
+        }
+
+
+profiler = Profiler()
+
+
+def _match_route(app, scope):
+    """Find the route (and its endpoint) a request will be dispatched to."""
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+class ProfilingMiddleware:
+    """Select requests for the sampling profiler."""
+
+    def __init__(self, app, fastapi_app):
+        self.app = app
+        self.fastapi_app = fastapi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.enabled or \
+                random.random() >= profiler.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        route = _match_route(self.fastapi_app, scope)
+        endpoint = getattr(route, "endpoint", None)
+        code = getattr(endpoint, "__code__", None)
+        if code is None or (profiler.routes and route.path not in profiler.routes):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = profiler.begin(code, route.path)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if request_id is not None:
+                profiler.end(request_id)
@@ -0,0 +1,231 @@
+"""Bulk user provisioning from a CSV file.
+
+The CSV starts with a header row. username and name are required, role
+(ADMIN or USER, default USER) and external_id are optional:
+
+    username,name,role,external_id
+    jdoe,Jane Doe,USER,4711
+
+Every user gets a temporary password that must be changed at the first
+login. bcrypt dominates the cost, so the passwords are hashed across a pool
+of processes; the whole file is then inserted in one transaction, so either
+every user is created or none is. Upload the file to POST /admin/users/bulk,
+or run:
+
+    python -m app.provisioning agents.csv --created-by admin -o credentials.csv
+"""
+import argparse
+import csv
+import io
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import auth, metrics
+from app.models import User, UserRole
+
+# Hashing processes; defaults to one per core
+PROVISION_WORKERS = int(os.getenv("PROVISION_WORKERS", "0")) or os.cpu_count() or 1
+PROVISION_MAX_ROWS = int(os.getenv("PROVISION_MAX_ROWS", "5000"))
+# Below this many users, starting processes costs more than it saves
+PARALLEL_HASH_MIN_ROWS = 8
+
+# Forking the app would copy the locks its threads (scheduler, metrics
+# flusher, connection pool) hold, locked forever in the child. Hashing
+# processes fork from a server started clean instead, which imports this
+# module once for all of them; spawn where there is no forkserver.
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _mp_context = multiprocessing.get_context("forkserver")
+    _mp_context.set_forkserver_preload([__name__])
+else:
+    _mp_context = multiprocessing.get_context("spawn")
+
+COLUMNS = ("username", "name", "role", "external_id")
+
+users_provisioned = metrics.registry.counter(
+    "app_users_provisioned_total", "Users created by bulk provisioning.")
+provision_seconds = metrics.registry.histogram(
+    "app_provision_seconds", "Time spent per bulk provisioning step.", ("step",))
+
+
+def _reject(status_code: int, detail):
+    raise HTTPException(status_code=status_code, detail=detail)
+
+
+def parse_csv(text: str) -> list:
+    """Validate a provisioning CSV; returns one dict per user.
+
+    Every problem in the file is reported at once, by line number.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    header = [name.strip().lower() for name in reader.fieldnames or []]
+    missing = [name for name in ("username", "name") if name not in header]
+    if missing:
+        _reject(status.HTTP_400_BAD_REQUEST,
+                f"CSV header must include: {', '.join(missing)}")
+    reader.fieldnames = header
+
+    rows, errors = [], []
+    usernames, external_ids = set(), set()
+    for record in reader:
+        line = reader.line_num
+        if len(rows) + len(errors) >= PROVISION_MAX_ROWS:
+            _reject(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    f"At most {PROVISION_MAX_ROWS} users per file")
+        values = {name: (record.get(name) or "").strip() for name in COLUMNS}
+        if not any(values.values()):
+            continue
+        if not values["username"] or not values["name"]:
+            errors.append(f"line {line}: username and name are required")
+            continue
+        try:
+            role = UserRole(values["role"].upper() or UserRole.USER.value)
+        except ValueError:
+            errors.append(f"line {line}: role must be ADMIN or USER")
+            continue
+        if values["username"] in usernames:
+            errors.append(f"line {line}: duplicate username {values['username']}")
+            continue
+        if values["external_id"] and values["external_id"] in external_ids:
+            errors.append(f"line {line}: duplicate external_id {values['external_id']}")
+            continue
+        usernames.add(values["username"])
+        if values["external_id"]:
+            external_ids.add(values["external_id"])
+        rows.append({"username": values["username"], "name": values["name"],
+                     "role": role, "external_id": values["external_id"] or None})
+    if errors:
+        _reject(status.HTTP_400_BAD_REQUEST, errors)
+    if not rows:
+        _reject(status.HTTP_400_BAD_REQUEST, "The CSV has no users")
+    return rows
+
+
+def _hash_password(password: str) -> str:
+    # Runs in the worker processes; the metrics in auth.get_password_hash
+    # would be recorded there and lost
+    return auth.pwd_context.hash(password)
+
+
+def hash_passwords(passwords: list, workers: int = None) -> list:
+    """bcrypt-hash passwords across a process pool, keeping their order."""
+    workers = min(workers or PROVISION_WORKERS, len(passwords))
+    if workers <= 1 or len(passwords) < PARALLEL_HASH_MIN_ROWS:
+        return [_hash_password(password) for password in passwords]
+    chunksize = max(1, math.ceil(len(passwords) / (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context) as pool:
+        return list(pool.map(_hash_password, passwords, chunksize=chunksize))
+
+
+def _conflicts(db: Session, rows: list) -> list:
+    usernames = [row["username"] for row in rows]
+    external_ids = [row["external_id"] for row in rows if row["external_id"]]
+    condition = User.username.in_(usernames)
+    if external_ids:
+        condition = or_(condition, User.external_id.in_(external_ids))
+    taken = db.execute(select(User.username, User.external_id).where(condition)).all()
+    wanted_usernames, wanted_ids = set(usernames), set(external_ids)
+    return sorted(
+        [f"username {username} already exists" for username, _ in taken
+         if username in wanted_usernames]
+        + [f"external_id {external_id} already exists" for _, external_id in taken
+           if external_id in wanted_ids])
+
+
+def provision(db: Session, rows: list, created_by_id: int = None) -> list:
+    """Create all users of a parsed CSV; returns (row, temporary password) pairs."""
+    started = time.perf_counter()
+    conflicts = _conflicts(db, rows)
+    if conflicts:
+        _reject(status.HTTP_409_CONFLICT, conflicts)
+    # Hand the connection back to the pool while hashing
+    db.commit()
+    provision_seconds.labels("check").observe(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    passwords = [auth.generate_temp_password() for _ in rows]
+    hashes = hash_passwords(passwords)
+    provision_seconds.labels("hash").observe(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    try:
+        db.execute(insert(User), [{
+            "username": row["username"],
+            "name": row["name"],
+            "role": row["role"],
+            "external_id": row["external_id"],
+            "hashed_password": hashed,
+            "created_by_id": created_by_id,
+            "must_change_password": True,
+        } for row, hashed in zip(rows, hashes)])
+        db.commit()
+    except IntegrityError:
+        # Someone took a username or external_id since the check
+        db.rollback()
+        _reject(status.HTTP_409_CONFLICT, _conflicts(db, rows) or
+                ["A username or external_id already exists"])
+    provision_seconds.labels("insert").observe(time.perf_counter() - started)
+    users_provisioned.inc(len(rows))
+    return list(zip(rows, passwords))
+
+
+def credentials_csv(created: list) -> str:
+    """The credentials file handed to the site: one line per new user."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["username", "name", "role", "external_id", "temp_password"])
+    for row, password in created:
+        writer.writerow([row["username"], row["name"], row["role"].value,
+                         row["external_id"] or "", password])
+    return out.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create users from a CSV file.")
+    parser.add_argument("csv_file", help="CSV with username,name[,role][,external_id]")
+    parser.add_argument("--created-by", help="Username of the administrator to record")
+    parser.add_argument("-o", "--output", help="Write credentials here instead of stdout")
+    args = parser.parse_args(argv)
+
+    from app.database import SessionLocal
+
+    with open(args.csv_file, encoding="utf-8-sig", newline="") as f:
+        text = f.read()
+    db = SessionLocal()
+    try:
+        created_by_id = None
+        if args.created_by:
+            created_by_id = db.execute(select(User.id).where(
+                User.username == args.created_by)).scalar()
+            if created_by_id is None:
+                sys.exit(f"Unknown user: {args.created_by}")
+        started = time.perf_counter()
+        created = provision(db, parse_csv(text), created_by_id)
+    except HTTPException as e:
+        details = e.detail if isinstance(e.detail, list) else [e.detail]
+        sys.exit("\n".join(str(detail) for detail in details))
+    finally:
+        db.close()
+
+    credentials = credentials_csv(created)
+    if args.output:
+        # Temporary passwords: readable by the owner only
+        fd = os.open(args.output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", newline="") as f:
+            f.write(credentials)
+    else:
+        sys.stdout.write(credentials)
+    print(f"Created {len(created)} users in {time.perf_counter() - started:.1f} s "
+          f"using {PROVISION_WORKERS} processes", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from app import metrics
+from app.bulkheads import DEFAULT_LIMITS, route_class
+
+logger = logging.getLogger("app.sql")
+
+# Longest a single SQL statement may run, per route class (see bulkheads.py),
+# in ms; 0 disables. Postgres enforces it with SET LOCAL statement_timeout,
+# SQLite through a progress handler. Override with STATEMENT_TIMEOUT_<CLASS>_MS.
+DEFAULT_STATEMENT_TIMEOUTS = {
+    "ingestion": 2000,
+    "agent": 5000,
+    "auth": 5000,
+    "admin": 15000,
+    "analytics": 10000,
+}
+# GET requests of these classes stop their SQL when the client disconnects
+CANCEL_ON_DISCONNECT = {
+    name.strip() for name in os.getenv("CANCEL_ON_DISCONNECT", "admin,analytics").split(",")
+    if name.strip()
+}
+# SQLite calls the progress handler every this many VM instructions
+SQLITE_PROGRESS_STEPS = 1000
+
+STATEMENT_TIMEOUTS = {
+    name: float(os.getenv(f"STATEMENT_TIMEOUT_{name.upper()}_MS",
+                          DEFAULT_STATEMENT_TIMEOUTS.get(name, 0)))
+    for name in DEFAULT_LIMITS
+}
+
+stopped_statements = metrics.registry.counter(
+    "app_sql_stopped_total",
+    "Statements stopped by a statement timeout or a client disconnect.",
+    ("route_class", "reason"))
+
+
+class QueryCancelled(Exception):
+    """The client disconnected, so the request's SQL was stopped."""
+
+
+class StatementTimeout(Exception):
+    """A statement ran longer than its route class allows."""
+
+
+class QueryControl:
+    """Statement timeout and cancellation state of one request."""
+
+    def __init__(self, name: str, timeout_ms: float):
+        self.route_class = name
+        self.timeout_ms = int(timeout_ms)
+        self.cancelled = False
+        self.timed_out = False
+        self.deadline = None
+        self._executing = None
+        self._lock = threading.Lock()
+
+    def statement_started(self, dbapi_connection):
+        with self._lock:
+            self._executing = dbapi_connection
+        self.timed_out = False
+        if self.timeout_ms:
+            self.deadline = time.perf_counter() + self.timeout_ms / 1000
+
+    def statement_finished(self):
+        with self._lock:
+            self._executing = None
+
+    def cancel(self):
+        """Stop the running statement and refuse any further ones."""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            # SQLite notices the flag in its progress handler; psycopg
+            # connections can cancel the server-side query from any thread
+            cancel = getattr(self._executing, "cancel", None)
+            if cancel is not None:
+                try:
+                    cancel()
+                except Exception as e:
+                    logger.warning("Could not cancel query: %s", e)
+
+
+# Control of the request being handled, copied into the threadpool like the
+# SQL stats in instrumentation.py
+_query_control: ContextVar[Optional[QueryControl]] = ContextVar(
+    "request_query_control", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    control = _query_control.get()
+    if control is None:
+        return
+    if control.cancelled:
+        stopped_statements.labels(control.route_class, "disconnect").inc()
+        raise QueryCancelled("Client disconnected")
+    if control.timeout_ms and conn.dialect.name == "postgresql" and \
+            conn.info.get("statement_timeout_ms") != control.timeout_ms:
+        # SET LOCAL lasts until the transaction ends, see _forget_timeout
+        cursor.execute(f"SET LOCAL statement_timeout = {control.timeout_ms}")
+        conn.info["statement_timeout_ms"] = control.timeout_ms
+    control.statement_started(conn.connection.dbapi_connection)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    control = _query_control.get()
+    if control is not None:
+        control.statement_finished()
+
+
+def _handle_error(context):
+    control = _query_control.get()
+    if control is None:
+        return None
+    control.statement_finished()
+    if control.cancelled:
+        stopped_statements.labels(control.route_class, "disconnect").inc()
+        return QueryCancelled("Client disconnected")
+    orig = context.original_exception
+    code = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+    # 57014 is query_canceled, which is what statement_timeout raises
+    if control.timed_out or code == "57014":
+        stopped_statements.labels(control.route_class, "timeout").inc()
+        return StatementTimeout(
+            f"Statement exceeded {control.timeout_ms} ms for {control.route_class} requests")
+    return None
+
+
+def _forget_timeout(conn, *args):
+    # A connection closed or invalidated by the error is not reused as is;
+    # its pool record is cleared on checkin
+    if not conn.closed and not conn.invalidated:
+        conn.info.pop("statement_timeout_ms", None)
+    control = _query_control.get()
+    if control is not None:
+        # Or SQLite's progress handler could interrupt the COMMIT itself
+        control.deadline = None
+
+
+def _forget_timeout_on_checkin(dbapi_connection, connection_record):
+    connection_record.info.pop("statement_timeout_ms", None)
+
+
+def _sqlite_progress():
+    control = _query_control.get()
+    if control is None:
+        return 0
+    if control.cancelled:
+        return 1
+    if control.deadline is not None and time.perf_counter() > control.deadline:
+        control.timed_out = True
+        return 1
+    return 0
+
+
+def _on_connect(dbapi_connection, connection_record):
+    if hasattr(dbapi_connection, "set_progress_handler"):
+        dbapi_connection.set_progress_handler(_sqlite_progress, SQLITE_PROGRESS_STEPS)
+
+
+def install(engine):
+    """Attach statement timeout and cancellation hooks to an engine."""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    # First, so a cancelled request raises before other hooks start timing
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute, insert=True)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    event.listen(engine, "commit", _forget_timeout)
+    event.listen(engine, "rollback", _forget_timeout)
+    event.listen(engine.pool, "checkin", _forget_timeout_on_checkin)
+    event.listen(engine, "connect", _on_connect)
+
+
+class QueryLimitMiddleware:
+    """Apply the route class's statement timeout, and cancel on disconnect.
+
+    For cancellable requests the middleware reads the ASGI receive channel
+    itself, so it sees http.disconnect while the endpoint is still running,
+    and passes messages on to the app.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], scope["path"])
+        timeout_ms = STATEMENT_TIMEOUTS.get(name, 0)
+        cancellable = name in CANCEL_ON_DISCONNECT and scope["method"] == "GET"
+        if not timeout_ms and not cancellable:
+            await self.app(scope, receive, send)
+            return
+
+        control = QueryControl(name, timeout_ms)
+        token = _query_control.set(control)
+        try:
+            if cancellable:
+                await self._call_cancellable(control, scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            _query_control.reset(token)
+
+    async def _call_cancellable(self, control, scope, receive, send):
+        messages = asyncio.Queue()
+        disconnected = False
+
+        async def watch():
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    disconnected = True
+                    control.cancel()
+                    return
+
+        async def receive_from_watcher():
+            if disconnected and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        watcher = asyncio.create_task(watch())
+        try:
+            await self.app(scope, receive_from_watcher, send)
+        except asyncio.CancelledError:
+            # The server or an in-process client gave up on the request;
+            # the endpoint's worker thread would otherwise run on
+            control.cancel()
+            raise
+        finally:
+            watcher.cancel()
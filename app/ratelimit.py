@@ -0,0 +1,211 @@
+import ipaddress
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, status
+
+from app import metrics
+
+try:
+    import redis
+except ImportError:  # Only needed for RATE_LIMIT_REDIS_URL
+    redis = None
+
+logger = logging.getLogger("app.ratelimit")
+
+# Token buckets per (budget, identity): a bucket holds up to `burst` requests
+# and refills at `rate` per second. Identities are user names for logged-in
+# requests, the client IP, and the attempted user name with the client IP, for
+# logins and the key id for the phone system. Checks run in the auth dependencies, before any SQL.
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "true").lower() == "true"
+# Share buckets between workers and servers; without it every worker
+# enforces the budgets on its own
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+# Use the first X-Forwarded-For address as the client IP (behind a proxy only)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Networks whose logins skip the login_ip budget, e.g. the NAT address a whole
+# office logs in through; comma-separated, such as 203.0.113.7,10.0.0.0/8
+RATE_LIMIT_LOGIN_IP_EXEMPT = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.getenv("RATE_LIMIT_LOGIN_IP_EXEMPT", "").split(",") if network.strip()]
+
+# budget: (requests per second, burst)
+DEFAULT_BUDGETS = {
+    # A whole floor behind one NAT address logs in at shift start
+    "login_ip": (5, 50),
+    # Five attempts per user name from one client, then one every 10 s; each
+    # one costs a bcrypt. Per client, so nobody else can lock an agent out.
+    "login_user": (0.1, 5),
+    "call_logs": (2, 10),
+    "analytics": (2, 20),
+    "admin": (10, 50),
+    "ingestion": (10, 40),
+    "agent": (10, 50),
+    # Batches per CTI key
+    "cti": (50, 200),
+}
+
+# First match wins: (method or None for any, path pattern, budget). Used for
+# requests of logged-in users; logins and the CTI webhook pick their budgets
+# explicitly.
+ROUTE_BUDGETS = [
+    ("GET", re.compile(r"^/admin/analytics/call-logs$"), "call_logs"),
+    ("GET", re.compile(r"^/admin/analytics/"), "analytics"),
+    (None, re.compile(r"^/admin(/|$)"), "admin"),
+    ("POST", re.compile(r"^/calls/?$"), "ingestion"),
+    ("DELETE", re.compile(r"^/calls/\d+$"), "ingestion"),
+    (None, re.compile(r"^/(log-lists/.*)?$"), "agent"),
+]
+
+rate_limited = metrics.registry.counter(
+    "app_rate_limited_total", "Requests rejected by a rate limit.", ("budget",))
+backend_errors = metrics.registry.counter(
+    "app_rate_limit_backend_errors_total",
+    "Rate limit checks that failed open because the shared backend was unavailable.")
+
+
+def _env_budget(name: str, defaults: tuple) -> tuple:
+    prefix = f"RATE_LIMIT_{name.upper()}_"
+    rate, burst = defaults
+    return (float(os.getenv(prefix + "RATE", rate)),
+            float(os.getenv(prefix + "BURST", burst)))
+
+
+budgets = {name: _env_budget(name, defaults) for name, defaults in DEFAULT_BUDGETS.items()}
+
+
+class RateLimited(HTTPException):
+    def __init__(self, budget: str, retry_after: float):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please slow down",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+        self.budget = budget
+
+
+class MemoryBackend:
+    """Buckets in this process, least recently used ones evicted first.
+
+    An evicted bucket comes back full, which only ever errs on the lenient
+    side.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Take cost tokens; returns 0, or seconds until they would be available."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._buckets.get(key)
+            if state is None:
+                tokens = burst
+            else:
+                tokens = min(burst, state[0] + (now - state[1]) * rate)
+                self._buckets.move_to_end(key)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# Same algorithm as MemoryBackend.take, atomic in Redis and on Redis's clock
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    """Buckets shared by all workers through Redis. Fails open when Redis is down."""
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the redis package is not installed")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        try:
+            return float(self._take(keys=[f"ratelimit:{key}"], args=[rate, burst, cost]))
+        except redis.RedisError as e:
+            backend_errors.inc()
+            logger.warning("Rate limit backend unavailable, allowing request: %s", e)
+            return 0.0
+
+
+backend = RedisBackend(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL \
+    else MemoryBackend(RATE_LIMIT_MAX_KEYS)
+
+
+def enforce(budget: str, identity: str, cost: float = 1.0):
+    """Spend from identity's bucket for budget, or raise RateLimited (429)."""
+    if not RATE_LIMITS_ENABLED:
+        return
+    rate, burst = budgets[budget]
+    wait = backend.take(f"{budget}:{identity}", rate, burst, cost)
+    if wait > 0:
+        rate_limited.labels(budget).inc()
+        raise RateLimited(budget, wait)
+
+
+def route_budget(method: str, path: str):
+    for rule_method, pattern, name in ROUTE_BUDGETS:
+        if (rule_method is None or rule_method == method) and pattern.match(path):
+            return name
+    return None
+
+
+def enforce_route(request, identity: str):
+    """Apply the budget of the request's route, if it has one."""
+    budget = route_budget(request.method, request.url.path)
+    if budget is not None:
+        enforce(budget, identity)
+
+
+def login_ip_exempt(ip: str) -> bool:
+    """Whether logins from ip skip the login_ip budget."""
+    if not RATE_LIMIT_LOGIN_IP_EXEMPT:
+        return False
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in RATE_LIMIT_LOGIN_IP_EXEMPT)
+
+
+def client_ip(request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
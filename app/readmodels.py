@@ -0,0 +1,184 @@
+"""Read models: what the read endpoints show, loaded with Core selects.
+
+Loading ORM instances costs identity-map bookkeeping, instance state and
+attribute instrumentation for every row, only for the endpoints to copy a few
+fields out of them. The queries here select just the columns needed and
+return slotted dataclasses, whose fields are the selected columns in order.
+Jinja templates and response models read them like the ORM objects.
+
+Nothing here is attached to a session, so rows can be cached and shared
+between requests. Writes still go through the models.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import String, bindparam, case, func, select, tuple_, type_coerce
+from sqlalchemy.orm import Session
+
+from app.models import CallLog, LogList, User, UserRole
+
+
+@dataclass(slots=True)
+class UserRow:
+    id: int
+    username: str
+    name: str
+    role: UserRole
+    is_active: bool
+    created_at: datetime
+    created_by_id: Optional[int]
+    external_id: Optional[str]
+
+
+@dataclass(slots=True)
+class ListRow:
+    id: int
+    name: str
+    owner_id: int
+    owner: Optional[UserRow] = None
+
+
+@dataclass(slots=True)
+class CallRow:
+    id: int
+    call_type: str
+    timestamp: datetime
+    is_potential: bool
+    log_list_id: int
+
+
+@dataclass(slots=True)
+class OwnedCallRow:
+    id: int
+    call_type: str
+    timestamp: datetime
+    is_potential: bool
+    log_list_id: int
+    list_name: str
+    owner_id: int
+    owner_username: str
+    owner_name: str
+    owner_role: UserRole
+
+
+@dataclass(slots=True)
+class ListStats:
+    id: int
+    name: str
+    owner_id: int
+    owner_username: Optional[str]
+    owner_name: Optional[str]
+    created_at: datetime
+    total_calls: int
+    potential_calls: int
+    latest_call: Optional[datetime]
+
+    @property
+    def transfer_rate(self) -> float:
+        return transfer_rate(self.total_calls, self.potential_calls)
+
+
+USER_COLUMNS = (User.id, User.username, User.name, User.role, User.is_active,
+                User.created_at, User.created_by_id, User.external_id)
+CALL_COLUMNS = (CallLog.id, CallLog.call_type, CallLog.timestamp,
+                CallLog.is_potential, CallLog.log_list_id)
+
+# Statements the user dashboard runs on every page view, built once with
+# named parameters: SQLAlchemy then finds their compiled form in its cache
+# without rebuilding or re-hashing the select each time
+LISTS_WITH_OWNERS = select(LogList.id, LogList.name, LogList.owner_id, *USER_COLUMNS).join(
+    User, User.id == LogList.owner_id).order_by(LogList.id)
+OWNER_LISTS = LISTS_WITH_OWNERS.where(LogList.owner_id == bindparam("owner_id"))
+LIST_CALLS = select(*CALL_COLUMNS).where(
+    CallLog.log_list_id == bindparam("log_list_id")).order_by(CallLog.timestamp.desc())
+LIST_CALLS_PAGE = LIST_CALLS.limit(bindparam("limit"))
+# The admin list modal pages through a list's calls by (timestamp, id) rather
+# than by offset, so the hundredth page costs what the first does. The key's
+# timestamp is the stored value, bound back as it is: SQLite compares text,
+# and rows written by CURRENT_TIMESTAMP and by SQLAlchemy store different
+# formats, so a datetime rendered anew would not sort as ORDER BY does.
+LIST_CALLS_FIRST = select(*CALL_COLUMNS, type_coerce(CallLog.timestamp, String)).where(
+    CallLog.log_list_id == bindparam("log_list_id")).order_by(
+    CallLog.timestamp.desc(), CallLog.id.desc()).limit(bindparam("limit"))
+LIST_CALLS_BEFORE = LIST_CALLS_FIRST.where(tuple_(CallLog.timestamp, CallLog.id) < tuple_(
+    bindparam("before_timestamp", type_=String),
+    bindparam("before_id", type_=CallLog.id.type)))
+
+
+def transfer_rate(total_calls: int, potential_calls: int) -> float:
+    return round(potential_calls / total_calls * 100, 2) if total_calls > 0 else 0
+
+
+def fetch(db: Session, statement, row_type, params: dict = None) -> list:
+    """Run a select and build one row_type per result row."""
+    # On the session's connection: these are plain Core selects, the ORM
+    # execution layer would only add overhead
+    return [row_type(*row) for row in db.connection().execute(statement, params)]
+
+
+def users(db: Session, skip: int = 0, limit: Optional[int] = 100) -> list:
+    return fetch(db, select(*USER_COLUMNS).order_by(User.id).offset(skip).limit(limit), UserRow)
+
+
+def log_lists(db: Session, owner_id: int = None) -> list:
+    """Log lists with their owners, of one user or all."""
+    if owner_id is None:
+        rows = db.connection().execute(LISTS_WITH_OWNERS)
+    else:
+        rows = db.connection().execute(OWNER_LISTS, {"owner_id": owner_id})
+    return [ListRow(list_id, name, list_owner_id, UserRow(*owner))
+            for list_id, name, list_owner_id, *owner in rows]
+
+
+def list_calls(db: Session, log_list_id: int, limit: int = None) -> list:
+    """A list's calls, most recent first."""
+    if limit is None:
+        return fetch(db, LIST_CALLS, CallRow, {"log_list_id": log_list_id})
+    return fetch(db, LIST_CALLS_PAGE, CallRow, {"log_list_id": log_list_id, "limit": limit})
+
+
+def list_calls_page(db: Session, log_list_id: int, limit: int,
+                    before: tuple = None) -> tuple[list, Optional[tuple]]:
+    """Up to limit of a list's calls older than before, most recent first.
+
+    before is a (timestamp, id) key as returned for the previous page: the
+    key of its last call, or None once there are no older calls. Its
+    timestamp is as the database returns the stored value: text on SQLite,
+    a datetime on Postgres.
+    """
+    params = {"log_list_id": log_list_id, "limit": limit + 1}
+    if before is None:
+        rows = db.connection().execute(LIST_CALLS_FIRST, params).all()
+    else:
+        params["before_timestamp"], params["before_id"] = before
+        rows = db.connection().execute(LIST_CALLS_BEFORE, params).all()
+    calls = [CallRow(*row[:-1]) for row in rows[:limit]]
+    if len(rows) <= limit:
+        return calls, None
+    return calls, (rows[limit - 1][-1], calls[-1].id)
+
+
+def owned_calls():
+    """Select of OwnedCallRow columns, for callers to filter and page."""
+    return select(*CALL_COLUMNS, LogList.name, CallLog.owner_id, User.username,
+                  User.name, User.role).select_from(CallLog).join(
+        LogList, LogList.id == CallLog.log_list_id).join(User, User.id == CallLog.owner_id)
+
+
+def list_stats(db: Session, owner_id: int = None, log_list_id: int = None) -> list:
+    """Call counts and latest call per log list, in one grouped query."""
+    statement = select(
+        LogList.id, LogList.name, LogList.owner_id, User.username, User.name,
+        LogList.created_at, func.count(CallLog.id),
+        func.coalesce(func.sum(case((CallLog.is_potential, 1), else_=0)), 0),
+        func.max(CallLog.timestamp),
+    ).select_from(LogList).outerjoin(User, User.id == LogList.owner_id).outerjoin(
+        CallLog, CallLog.log_list_id == LogList.id).group_by(
+        LogList.id, LogList.name, LogList.owner_id, User.username, User.name,
+        LogList.created_at).order_by(LogList.id)
+    if owner_id is not None:
+        statement = statement.where(LogList.owner_id == owner_id)
+    if log_list_id is not None:
+        statement = statement.where(LogList.id == log_list_id)
+    return fetch(db, statement, ListStats)
@@ -0,0 +1,424 @@
+"""Periodic background jobs, run by one worker at a time.
+
+Jobs are registered with a schedule, every N seconds or a cron expression
+(minute hour day-of-month month day-of-week, in UTC), and started with the
+app's lifespan. Every worker runs the same timers. When one fires, the worker
+takes the job's lock and runs it, unless another worker holds that lock or
+has already run that scheduled time, which the scheduled_jobs table records.
+A job therefore runs once per scheduled time, whatever the number of workers.
+Jobs added with every_worker=True, which refresh state kept in the process,
+instead run in each worker on every scheduled time and take no lock.
+
+Locks are Postgres advisory locks, so they also hold between hosts. On other
+databases they are file locks in SCHEDULER_LOCK_DIR, which only keep apart
+workers on the same host.
+
+Jitter delays each run by a random part of the given seconds, so that jobs
+due at the same time, and the workers racing for them, spread out. A job is
+a function taking a database session; it runs in a worker thread.
+"""
+import asyncio
+import calendar
+import hashlib
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from app import metrics
+from app.database import SessionLocal, engine
+from app.models import ScheduledJob
+
+try:
+    import fcntl
+except ImportError:  # Windows: jobs are then only kept apart within a process
+    fcntl = None
+
+logger = logging.getLogger("app.scheduler")
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_LOCK_DIR = os.getenv(
+    "SCHEDULER_LOCK_DIR", os.path.join(tempfile.gettempdir(), "transfer_rate_app_locks"))
+
+job_runs = metrics.registry.counter(
+    "app_job_runs_total",
+    "Scheduled job runs: ok, failed, or skipped because another worker ran it.",
+    ("job", "result"))
+job_seconds = metrics.registry.histogram(
+    "app_job_duration_seconds", "Time scheduled jobs took to run.", ("job",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300))
+job_lag_seconds = metrics.registry.histogram(
+    "app_job_lag_seconds", "Time from a job's scheduled time to its start.", ("job",),
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite returns naive datetimes; everything here is UTC
+    return value.replace(tzinfo=timezone.utc) if value and value.tzinfo is None else value
+
+
+class Every:
+    """Every N seconds, at multiples of N since the epoch, so workers agree."""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("The interval must be positive")
+        self.seconds = seconds
+
+    def next(self, after: datetime) -> datetime:
+        ticks = int(after.timestamp() // self.seconds) + 1
+        return datetime.fromtimestamp(ticks * self.seconds, timezone.utc)
+
+    def __str__(self) -> str:
+        return f"every {self.seconds:g}s"
+
+
+class Cron:
+    """A five-field cron expression: *, numbers, ranges, lists and /steps."""
+
+    # (lowest, highest) of each field
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(field, *bounds) for field, bounds in zip(fields, self.FIELDS))
+        # 0 and 7 are both Sunday
+        self.weekdays = {day % 7 for day in weekdays}
+        # As in cron: restricted day of month and day of week match either
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, lowest: int, highest: int) -> set:
+        values = set()
+        for part in field.split(","):
+            span, _, step = part.partition("/")
+            if span == "*":
+                start, end = lowest, highest
+            elif "-" in span:
+                start, end = (int(value) for value in span.split("-"))
+            else:
+                start = end = int(span)
+                if step:
+                    end = highest
+            if not lowest <= start <= end <= highest:
+                raise ValueError(f"Cron field out of range: {field!r}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next(self, after: datetime) -> datetime:
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Skip whole months, days and hours that cannot match
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                days = calendar.monthrange(moment.year, moment.month)[1] - moment.day + 1
+                moment = (moment + timedelta(days=days)).replace(hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+    def __str__(self) -> str:
+        return f"cron {self.expression}"
+
+
+class AdvisoryLocks:
+    """Postgres session-level advisory locks, one per job or other named task."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    @staticmethod
+    def key(name: str) -> int:
+        # Advisory lock keys are signed 64-bit integers
+        return int.from_bytes(hashlib.sha256(f"job:{name}".encode()).digest()[:8], "big",
+                              signed=True)
+
+    @contextmanager
+    def hold(self, name: str, wait: bool = False):
+        """Yield whether this process got the job's lock; held until the block ends.
+
+        wait: block until the lock is free instead of giving up at once.
+        """
+        key = self.key(name)
+        # Autocommit: no transaction stays open while the job runs
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if wait:
+                conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": key})
+                acquired = True
+            else:
+                acquired = conn.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"), {"key": key}).scalar()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    try:
+                        conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                    except Exception:
+                        # Closing the connection releases the lock too
+                        conn.invalidate()
+
+
+class FileLocks:
+    """flock()ed files, one per job and database, for databases without advisory locks."""
+
+    def __init__(self, engine, directory: str = SCHEDULER_LOCK_DIR):
+        self.directory = directory
+        # Apps on other databases may share the directory
+        self.database = hashlib.sha256(str(engine.url).encode()).hexdigest()[:12]
+        self._local = {}
+        self._local_lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, name: str, wait: bool = False):
+        """Yield whether this process got the job's lock; held until the block ends.
+
+        wait: block until the lock is free instead of giving up at once.
+        """
+        with self._local_lock:
+            local = self._local.setdefault(name, threading.Lock())
+        if not local.acquire(blocking=wait):
+            yield False
+            return
+        try:
+            if fcntl is None:
+                yield True
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{name}.{self.database}.lock")
+            with open(path, "a") as file:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+        finally:
+            local.release()
+
+
+def locks_for(engine):
+    """Advisory locks on Postgres, file locks elsewhere."""
+    return AdvisoryLocks(engine) if engine.dialect.name == "postgresql" else FileLocks(engine)
+
+
+class Job:
+    def __init__(self, name: str, function: Callable, schedule, jitter: float,
+                 every_worker: bool = False):
+        self.name = name
+        self.function = function
+        self.schedule = schedule
+        self.jitter = jitter
+        self.every_worker = every_worker
+        # When this worker's timer fires next
+        self.next_run: Optional[datetime] = None
+        self.running = False
+        # A run on demand was started here and has not finished
+        self.triggered = False
+
+
+class Scheduler:
+    """Runs registered jobs on their schedules, one worker per scheduled time."""
+
+    def __init__(self, engine, session_factory=SessionLocal):
+        self.engine = engine
+        self.session_factory = session_factory
+        self.locks = locks_for(engine)
+        self.jobs = {}
+        self._tasks = []
+        self._trigger_lock = threading.Lock()
+
+    def add(self, name: str, function: Callable, every: float = None,
+            cron: str = None, jitter: float = 0, every_worker: bool = False):
+        """Register function(db) to run every N seconds or on a cron expression.
+
+        every_worker: run it in each worker, not in one of them.
+        """
+        if (every is None) == (cron is None):
+            raise ValueError("A job needs either every or cron")
+        if name in self.jobs:
+            raise ValueError(f"Job {name!r} is already registered")
+        schedule = Every(every) if every is not None else Cron(cron)
+        self.jobs[name] = Job(name, function, schedule, jitter, every_worker)
+
+    def job(self, name: str, **schedule):
+        """Decorator form of add()."""
+        def register(function):
+            self.add(name, function, **schedule)
+            return function
+        return register
+
+    async def start(self):
+        if not SCHEDULER_ENABLED:
+            return
+        self._tasks = [asyncio.create_task(self._loop(job), name=f"job:{job.name}")
+                       for job in self.jobs.values()]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _loop(self, job: Job):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = job.schedule.next(_now())
+            job.next_run = scheduled
+            delay = (scheduled - _now()).total_seconds() + random.uniform(0, job.jitter)
+            await asyncio.sleep(max(delay, 0))
+            try:
+                await loop.run_in_executor(None, self.run, job.name, scheduled)
+            except Exception:
+                # The job's own errors are recorded by run(); this is e.g. the
+                # database being unreachable for the lock
+                logger.exception("Could not run job %s", job.name)
+
+    def run(self, name: str, scheduled: Optional[datetime] = None) -> Optional[dict]:
+        """Run a job now if no other worker is running it.
+
+        scheduled: the time it is run for; skipped if a worker already ran
+        it. None for a run on demand. Returns the run's record, None if it
+        was skipped.
+        """
+        job = self.jobs[name]
+        if job.every_worker:
+            return self._execute(job, scheduled)
+        with self.locks.hold(name) as acquired:
+            if not acquired:
+                job_runs.labels(name, "skipped").inc()
+                return None
+            if scheduled is not None:
+                with self.engine.connect() as conn:
+                    last = conn.execute(select(ScheduledJob.last_scheduled_at).where(
+                        ScheduledJob.name == name)).scalar()
+                if last is not None and _aware(last) >= scheduled:
+                    job_runs.labels(name, "skipped").inc()
+                    return None
+                job_lag_seconds.labels(name).observe((_now() - scheduled).total_seconds())
+            return self._execute(job, scheduled)
+
+    def trigger(self, name: str) -> bool:
+        """Start a run on demand in its own thread; False if one is already going here.
+
+        The thread starts with a fresh context, so a request that triggers a
+        job does not pass on its statement timeout. run() records the outcome.
+        """
+        job = self.jobs[name]
+        with self._trigger_lock:
+            if job.running or job.triggered:
+                return False
+            job.triggered = True
+
+        def run():
+            try:
+                if self.run(name) is None:
+                    logger.info("Job %s not run on demand: another worker is running it", name)
+            except Exception:
+                logger.exception("Could not run job %s", name)
+            finally:
+                job.triggered = False
+
+        threading.Thread(target=run, name=f"job:{name}").start()
+        return True
+
+    def _execute(self, job: Job, scheduled: Optional[datetime]) -> dict:
+        started_at = _now()
+        started = time.perf_counter()
+        job.running = True
+        error = None
+        try:
+            with self.session_factory() as db:
+                result = job.function(db)
+        except Exception as exc:
+            logger.exception("Job %s failed", job.name)
+            error = f"{type(exc).__name__}: {exc}"
+            result = None
+        finally:
+            job.running = False
+        duration = time.perf_counter() - started
+        job_seconds.labels(job.name).observe(duration)
+        job_runs.labels(job.name, "failed" if error else "ok").inc()
+        if error is None:
+            logger.info("Job %s finished in %.3fs: %s", job.name, duration, result)
+
+        record = {
+            "last_started_at": started_at,
+            "last_duration": duration,
+            "last_status": "failed" if error else "ok",
+            "last_error": error,
+        }
+        if scheduled is not None:
+            record["last_scheduled_at"] = scheduled
+        try:
+            self._record(job.name, record)
+        except IntegrityError:
+            # Jobs of every worker have no lock: another worker inserted the row first
+            self._record(job.name, record)
+        return {"name": job.name, **record, "result": result}
+
+    def _record(self, name: str, record: dict):
+        with self.engine.begin() as conn:
+            updated = conn.execute(update(ScheduledJob).where(ScheduledJob.name == name)
+                                   .values(runs=ScheduledJob.runs + 1, **record)).rowcount
+            if not updated:
+                conn.execute(insert(ScheduledJob).values(name=name, runs=1, **record))
+
+    def status(self) -> list:
+        """Registered jobs with their schedule and last run, from any worker."""
+        with self.engine.connect() as conn:
+            rows = {row.name: row for row in conn.execute(select(ScheduledJob))}
+        jobs = []
+        for job in self.jobs.values():
+            row = rows.get(job.name)
+            jobs.append({
+                "name": job.name,
+                "schedule": str(job.schedule),
+                "jitter": job.jitter,
+                "every_worker": job.every_worker,
+                "next_run": job.next_run,
+                "running_here": job.running or job.triggered,
+                "runs": row.runs if row else 0,
+                "last_scheduled_at": _aware(row.last_scheduled_at) if row else None,
+                "last_started_at": _aware(row.last_started_at) if row else None,
+                "last_duration": row.last_duration if row else None,
+                "last_status": row.last_status if row else None,
+                "last_error": row.last_error if row else None,
+            })
+        return jobs
+
+
+scheduler = Scheduler(engine)
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Union
 from app.models import UserRole
 
 # User schemas
@@ -11,6 +11,7 @@ class UserCreate(BaseModel):
     name: str
     password: str
     role: UserRole = UserRole.USER
+    external_id: Optional[str] = None
 
 
 class UserUpdate(BaseModel):
@@ -18,6 +19,7 @@ class UserUpdate(BaseModel):
     name: Optional[str] = None
     role: Optional[UserRole] = None
     is_active: Optional[bool] = None
+    external_id: Optional[str] = None
 
 
 class UserResponse(BaseModel):
@@ -28,6 +30,7 @@ class UserResponse(BaseModel):
     is_active: bool
     created_at: datetime
     created_by_id: Optional[int] = None
+    external_id: Optional[str] = None
     # Only used when creating/resetting password
     temp_password: Optional[str] = None
 
@@ -40,13 +43,27 @@ class UserLogin(BaseModel):
     password: str
 
 
+class BulkUserIds(BaseModel):
+    user_ids: List[int] = Field(min_length=1, max_length=5000)
+
+
+class ListReassignment(BaseModel):
+    to_user_id: int
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+    session_id: Optional[int] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: Optional[str] = None
 
 # LogList schemas
 
@@ -80,6 +97,8 @@ class LogListWithOwner(BaseModel):
 class CallLogCreate(BaseModel):
     call_type: str
     log_list_id: int
+    # Client-generated id (e.g. a UUID); same as the Idempotency-Key header
+    idempotency_key: Optional[str] = None
 
 
 class CallLogRead(BaseModel):
@@ -89,3 +108,26 @@ class CallLogRead(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# Profiling schemas
+
+
+class ProfilingConfig(BaseModel):
+    sample_rate: Optional[float] = None
+    routes: Optional[List[str]] = None
+    interval_ms: Optional[float] = None
+
+
+# CTI (phone system) schemas
+
+
+class CTICallEvent(BaseModel):
+    # Username or external id of the agent who took the call
+    agent: str
+    # Log list id, or the name of one of the agent's lists
+    list: Union[int, str]
+    call_type: str
+    timestamp: Optional[datetime] = None
+    # Call id in the phone system, used to drop duplicate deliveries
+    external_id: str
@@ -0,0 +1,216 @@
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.orm import Session
+from starlette.responses import Response
+
+from app import metrics
+from app.cache import TTLCache
+from app.models import UserSession
+
+# Access tokens are short-lived. The browser also holds a refresh token
+# (httponly cookie) that renews them without the password, so staying logged
+# in costs a SHA-256 and one UPDATE instead of a bcrypt. Each use replaces
+# the refresh token. A session ends after this long without use, and in any
+# case after SESSION_MAX_DAYS.
+REFRESH_TOKEN_IDLE_HOURS = float(os.getenv("REFRESH_TOKEN_IDLE_HOURS", "12"))
+SESSION_MAX_DAYS = float(os.getenv("SESSION_MAX_DAYS", "7"))
+# The token a refresh replaced keeps working this long, for requests that
+# were already in flight with it. Later use means it was copied: the session
+# is revoked.
+REFRESH_REUSE_GRACE_SECONDS = 30
+# How long a worker trusts its cached "session still active" answer, i.e.
+# how soon a revocation made elsewhere takes effect
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "30"))
+# Ended sessions are kept this long, then deleted by the purge job
+SESSION_RETENTION_DAYS = float(os.getenv("SESSION_RETENTION_DAYS", "30"))
+
+REFRESH_COOKIE = "refresh_token"
+
+session_events = metrics.registry.counter(
+    "app_sessions_total", "Login session events.", ("event",))
+
+_active_sessions = TTLCache(maxsize=100_000, ttl=SESSION_CACHE_TTL)
+
+
+def hash_token(token: str) -> str:
+    # Refresh tokens are random 256-bit values, so a fast hash is enough
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite returns naive datetimes; everything here is UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _expiry(created_at: datetime, now: datetime) -> datetime:
+    return min(now + timedelta(hours=REFRESH_TOKEN_IDLE_HOURS),
+               _aware(created_at) + timedelta(days=SESSION_MAX_DAYS))
+
+
+def create_session(db: Session, user_id: int) -> tuple[int, str]:
+    """Start a session after a password login; returns (session id, refresh token)."""
+    token = secrets.token_urlsafe(32)
+    now = _now()
+    session = UserSession(user_id=user_id, token_hash=hash_token(token),
+                          created_at=now, expires_at=_expiry(now, now))
+    db.add(session)
+    # The id comes back with the INSERT; read after the commit, it would be
+    # reloaded with another SELECT
+    db.flush()
+    session_id = session.id
+    db.commit()
+    session_events.labels("created").inc()
+    return session_id, token
+
+
+def refresh(db: Session, token: str) -> Optional[tuple[int, int, Optional[str]]]:
+    """Exchange a refresh token for (session id, user id, new refresh token).
+
+    The new token is None when the presented one was replaced moments ago by
+    a parallel request; the caller keeps the cookie that request set. Returns
+    None for unknown, expired or revoked tokens.
+    """
+    token_hash = hash_token(token)
+    now = _now()
+    session = db.query(UserSession).filter(or_(
+        UserSession.token_hash == token_hash,
+        UserSession.previous_token_hash == token_hash)).first()
+    if session is None or session.revoked_at is not None or _aware(session.expires_at) <= now:
+        session_events.labels("rejected").inc()
+        return None
+    session_id, user_id = session.id, session.user_id
+
+    if session.token_hash != token_hash:
+        if session.rotated_at and \
+                now - _aware(session.rotated_at) <= timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS):
+            session_events.labels("grace").inc()
+            _active_sessions.set(session_id, True)
+            return session_id, user_id, None
+        revoke_session(db, session_id)
+        db.commit()
+        session_events.labels("reuse_revoked").inc()
+        return None
+
+    new_token = secrets.token_urlsafe(32)
+    # Conditional, so two parallel refreshes cannot both rotate the token
+    result = db.execute(
+        update(UserSession)
+        .where(UserSession.id == session_id, UserSession.token_hash == token_hash)
+        .values(previous_token_hash=token_hash, token_hash=hash_token(new_token),
+                rotated_at=now, expires_at=_expiry(session.created_at, now))
+        .execution_options(synchronize_session=False))
+    db.commit()
+    _active_sessions.set(session_id, True)
+    if result.rowcount == 0:
+        session_events.labels("grace").inc()
+        return session_id, user_id, None
+    session_events.labels("refreshed").inc()
+    return session_id, user_id, new_token
+
+
+def is_active(db: Session, session_id: int) -> bool:
+    """Whether a session may still use its access tokens (cached)."""
+    active = _active_sessions.get(session_id)
+    if active is None:
+        row = db.query(UserSession.revoked_at, UserSession.expires_at).filter(
+            UserSession.id == session_id).first()
+        active = row is not None and row.revoked_at is None and \
+            _aware(row.expires_at) > _now()
+        _active_sessions.set(session_id, active)
+    return active
+
+
+def revoke_session(db: Session, session_id: int):
+    """Revoke one session. The caller commits."""
+    db.execute(update(UserSession)
+               .where(UserSession.id == session_id, UserSession.revoked_at.is_(None))
+               .values(revoked_at=_now())
+               .execution_options(synchronize_session=False))
+    _active_sessions.pop(session_id)
+    session_events.labels("revoked").inc()
+
+
+def revoke_token(db: Session, token: str):
+    """End the session a refresh token belongs to (logout). The caller commits."""
+    token_hash = hash_token(token)
+    row = db.query(UserSession.id).filter(or_(
+        UserSession.token_hash == token_hash,
+        UserSession.previous_token_hash == token_hash)).first()
+    if row is not None:
+        revoke_session(db, row.id)
+
+
+def revoke_user_sessions(db: Session, *user_ids: int):
+    """Revoke every session of users, e.g. on deactivation. The caller commits."""
+    session_ids = [row.id for row in db.query(UserSession.id).filter(
+        UserSession.user_id.in_(user_ids), UserSession.revoked_at.is_(None))]
+    if not session_ids:
+        return
+    db.execute(update(UserSession)
+               .where(UserSession.id.in_(session_ids))
+               .values(revoked_at=_now())
+               .execution_options(synchronize_session=False))
+    for session_id in session_ids:
+        _active_sessions.pop(session_id)
+    session_events.labels("revoked").inc(len(session_ids))
+
+
+def purge_expired(db: Session) -> int:
+    """Delete sessions that ended over SESSION_RETENTION_DAYS ago; returns how many."""
+    cutoff = _now() - timedelta(days=SESSION_RETENTION_DAYS)
+    purged = db.execute(delete(UserSession).where(or_(
+        UserSession.expires_at < cutoff, UserSession.revoked_at < cutoff))).rowcount
+    db.commit()
+    session_events.labels("purged").inc(purged)
+    return purged
+
+
+def set_session_cookies(response: Response, access_token: str,
+                        refresh_token: Optional[str] = None):
+    response.set_cookie(key="access_token", value=f"Bearer {access_token}", httponly=True)
+    if refresh_token is not None:
+        response.set_cookie(key=REFRESH_COOKIE, value=refresh_token, httponly=True,
+                            samesite="lax", max_age=int(SESSION_MAX_DAYS * 86400))
+
+
+def clear_session_cookies(response: Response):
+    response.delete_cookie(key="access_token")
+    response.delete_cookie(key=REFRESH_COOKIE)
+
+
+class SessionCookieMiddleware:
+    """Add the cookies of a transparent refresh to whatever response is sent.
+
+    The auth dependencies refresh expired access tokens before the endpoint
+    builds its response, so they leave the new tokens in the request state
+    ("session_cookies") for this middleware to set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookies(message):
+            if message["type"] == "http.response.start":
+                tokens = scope.get("state", {}).get("session_cookies")
+                if tokens is not None:
+                    carrier = Response()
+                    set_session_cookies(carrier, *tokens)
+                    message = {**message, "headers": list(message.get("headers", [])) + [
+                        header for header in carrier.raw_headers if header[0] == b"set-cookie"]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookies)
@@ -16,6 +16,197 @@ function debounce(func, wait) {
     };
 }
 
+// Latest request of each kind; starting a new one aborts the previous one,
+// so quick filter changes do not leave queries running on the server
+const pendingRequests = {};
+
+function supersede(kind) {
+    if (pendingRequests[kind]) {
+        pendingRequests[kind].abort();
+    }
+    const controller = new AbortController();
+    pendingRequests[kind] = controller;
+    return controller.signal;
+}
+
+// Analytics tables are requested in columnar form (?format=columnar): one
+// array per field, dates and timestamps as Unix seconds
+const COLUMNAR = 'columnar';
+
+const HTML_ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+
+function escapeHtml(value) {
+    return String(value).replace(/[&<>"']/g, c => HTML_ESCAPES[c]);
+}
+
+// Unix seconds as the server renders naive UTC times: 01/31/2024 [14:05]
+function formatEpoch(seconds, withTime = false) {
+    if (seconds === null) return 'N/A';
+    const options = { month: '2-digit', day: '2-digit', year: 'numeric', timeZone: 'UTC' };
+    if (withTime) Object.assign(options, { hour: '2-digit', minute: '2-digit', hourCycle: 'h23' });
+    return new Date(seconds * 1000).toLocaleString('en-US', options).replace(',', '');
+}
+
+// =======================
+// TABLE WORKER
+// =======================
+
+// Filtering, sorting and chart shaping run in js/table-worker.js
+const tableWorker = (() => {
+    const meta = document.querySelector('meta[name="table-worker"]');
+    if (!meta || typeof Worker === 'undefined') return null;
+    const worker = new Worker(meta.content);
+    const waiting = new Map();
+    let nextId = 0;
+    worker.onmessage = event => {
+        const { id, error } = event.data;
+        const pending = waiting.get(id);
+        waiting.delete(id);
+        if (error) pending.reject(new Error(error));
+        else pending.resolve(event.data);
+    };
+    return {
+        request(message) {
+            const id = ++nextId;
+            return new Promise((resolve, reject) => {
+                waiting.set(id, { resolve, reject });
+                worker.postMessage({ id, ...message });
+            });
+        }
+    };
+})();
+
+// A table whose body only holds the rows scrolled into view, plus two spacer
+// rows standing in for the rest. The data stays columnar; the worker decides
+// which rows match the filters and in what order.
+class VirtualTable {
+    constructor(table, { name, renderRow, emptyHtml, sort = null, desc = false }) {
+        this.table = table;
+        this.name = name;
+        this.renderRow = renderRow;
+        this.emptyHtml = emptyHtml;
+        this.sort = sort;
+        this.desc = desc;
+        this.filters = {};
+        this.columns = {};
+        this.loadedColumns = {};
+        this.order = new Int32Array(0);
+        this.rowHeight = 0;
+        this.latestQuery = 0;
+        this.scroller = table.closest('.data-table');
+        this.scroller.classList.add('virtual-scroll');
+        this.tbody = table.querySelector('tbody');
+        this.info = document.getElementById(`${table.id}Info`);
+        this.scheduled = false;
+        this.scroller.addEventListener('scroll', () => this.schedule(), { passive: true });
+        window.addEventListener('resize', () => this.schedule());
+        table.querySelectorAll('th[data-sort]').forEach(th => {
+            th.classList.add('sortable');
+            th.addEventListener('click', () => this.sortBy(th.dataset.sort));
+        });
+        this.markSorted();
+    }
+
+    // json: the table as sent by the server, or the response holding it
+    // under field; columns: the table, parsed
+    async load(json, columns, field = null) {
+        // Shown from the first query on the new data, which the worker
+        // answers after loading it
+        this.loadedColumns = columns;
+        await tableWorker.request({ op: 'load', table: this.name, json, field });
+    }
+
+    async query(filters = this.filters) {
+        this.filters = filters;
+        const queryId = ++this.latestQuery;
+        const columns = this.loadedColumns;
+        const { order } = await tableWorker.request({
+            op: 'query', table: this.name, filters, sort: this.sort, desc: this.desc });
+        // Answers to filters typed over since are dropped
+        if (queryId !== this.latestQuery) return;
+        this.columns = columns;
+        this.order = order;
+        this.scroller.scrollTop = 0;
+        this.render();
+    }
+
+    sortBy(column) {
+        this.desc = this.sort === column ? !this.desc : false;
+        this.sort = column;
+        this.markSorted();
+        return this.query();
+    }
+
+    markSorted() {
+        this.table.querySelectorAll('th[data-sort]').forEach(th => {
+            th.classList.toggle('sorted-asc', th.dataset.sort === this.sort && !this.desc);
+            th.classList.toggle('sorted-desc', th.dataset.sort === this.sort && this.desc);
+        });
+    }
+
+    schedule() {
+        if (this.scheduled) return;
+        this.scheduled = true;
+        requestAnimationFrame(() => {
+            this.scheduled = false;
+            this.render();
+        });
+    }
+
+    render() {
+        const total = this.order.length;
+        if (this.info) this.info.textContent = `${total} of ${this.columns ? rowCount(this.columns) : 0} rows`;
+        if (total === 0) {
+            this.tbody.innerHTML = this.emptyHtml;
+            return;
+        }
+        // Until a row has been measured (or while the tab is hidden), guess
+        const rowHeight = this.rowHeight || 48;
+        const overscan = 10;
+        const viewport = this.scroller.clientHeight || 600;
+        const first = Math.max(0, Math.floor(this.scroller.scrollTop / rowHeight) - overscan);
+        const last = Math.min(total, first + Math.ceil(viewport / rowHeight) + 2 * overscan);
+        const rows = [];
+        for (let position = first; position < last; position++) {
+            rows.push(this.renderRow(this.columns, this.order[position]));
+        }
+        this.tbody.innerHTML =
+            `<tr class="virtual-spacer" style="height: ${first * rowHeight}px"></tr>` +
+            rows.join('') +
+            `<tr class="virtual-spacer" style="height: ${(total - last) * rowHeight}px"></tr>`;
+        if (!this.rowHeight) {
+            // Every row gets the height of the tallest rendered one, so that
+            // scroll positions map to rows
+            const heights = Array.from(this.tbody.querySelectorAll('tr[data-row]'),
+                row => row.getBoundingClientRect().height);
+            const tallest = Math.max(...heights);
+            if (tallest > 0) {
+                this.rowHeight = tallest;
+                this.table.style.setProperty('--row-height', `${tallest}px`);
+                this.render();
+            }
+        }
+    }
+
+    // Measure rows again, e.g. once the table's tab is shown
+    refresh() {
+        this.rowHeight = 0;
+        this.table.style.removeProperty('--row-height');
+        this.render();
+    }
+
+    // Row index of the element's row, for the click handlers of its controls
+    rowOf(element) {
+        const row = element.closest('tr[data-row]');
+        return row ? Number(row.dataset.row) : null;
+    }
+}
+
+function rowCount(columns) {
+    const first = Object.keys(columns)[0];
+    return first === undefined ? 0 : columns[first].length;
+}
+
 function getCookie(name) {
     const value = `; ${document.cookie}`;
     const parts = value.split(`; ${name}=`);
@@ -348,108 +539,24 @@ function initializeFilters() {
     if (logDateTo) logDateTo.addEventListener('change', applyLogFilters);
     if (logSearchFilter) logSearchFilter.addEventListener('input', debounce(applyLogFilters, 500));
 
-    // Initialize DataTables
-    initializeDataTables();
+    // Virtualized tables, filtered and sorted in the worker
+    initializeTables();
 }
 
 function applyUserFilters() {
     if (!usersTable) return;
 
-    const roleFilter = document.getElementById('roleFilter')?.value || '';
-    const statusFilter = document.getElementById('statusFilter')?.value || '';
-    const performanceFilter = document.getElementById('performanceFilter')?.value || '';
-    const searchFilter = document.getElementById('searchFilter')?.value || '';
-
-    console.log('Applying user filters:', { roleFilter, statusFilter, performanceFilter, searchFilter });
-
-    // Clear all existing column searches and custom filters
-    usersTable.columns().search('');
+    const filters = {
+        role: document.getElementById('roleFilter')?.value || '',
+        status: document.getElementById('statusFilter')?.value || '',
+        performance: document.getElementById('performanceFilter')?.value || '',
+        search: document.getElementById('searchFilter')?.value || ''
+    };
 
-    // Remove any existing custom search functions
-    $.fn.dataTable.ext.search = $.fn.dataTable.ext.search.filter(function(fn) {
-        return fn.toString().indexOf('userFilterCustom') === -1;
+    // Runs in the worker; typing on only supersedes the pending answer
+    usersTable.query(filters).catch(error => {
+        console.error('Error filtering users:', error);
     });
-
-    // Apply role filter (column 1) - match against role text like "USER" or "ADMIN"
-    if (roleFilter) {
-        usersTable.column(1).search(roleFilter, true, false);
-    }
-
-    // Apply custom search function for status and performance filters
-    if (statusFilter || performanceFilter) {
-        $.fn.dataTable.ext.search.push(function userFilterCustom(settings, data, dataIndex) {
-            if (settings.nTable.id !== 'usersTable') return true;
-
-            let statusMatch = true;
-            let performanceMatch = true;
-
-            // Check status filter (column 2)
-            if (statusFilter) {
-                const statusCell = data[2]; // Status column
-
-                // Extract text content from HTML - look for the actual text within the HTML
-                const tempDiv = document.createElement('div');
-                tempDiv.innerHTML = statusCell;
-                const statusText = tempDiv.textContent || tempDiv.innerText || '';
-
-                console.log('Status filter:', statusFilter, 'Cell HTML:', statusCell, 'Extracted text:', statusText.trim());
-
-                if (statusFilter === 'active') {
-                    statusMatch = statusText.trim() === 'Active';
-                } else if (statusFilter === 'inactive') {
-                    statusMatch = statusText.trim() === 'Inactive';
-                }
-
-                console.log('Status match result:', statusMatch);
-            }
-
-            // Check performance filter (column 4)
-            if (performanceFilter) {
-                const transferRateCell = data[4];
-                console.log('Transfer rate cell content:', transferRateCell);
-
-                // Skip if no transfer rate data
-                if (!transferRateCell || transferRateCell.includes('text-muted') || transferRateCell.includes('—')) {
-                    performanceMatch = false;
-                } else {
-                    // Extract percentage from HTML content
-                    const percentMatch = transferRateCell.match(/(\d+\.?\d*)%/);
-                    if (percentMatch) {
-                        const transferRate = parseFloat(percentMatch[1]);
-                        console.log('Transfer rate found:', transferRate, 'for filter:', performanceFilter);
-
-                        switch (performanceFilter) {
-                            case 'excellent':
-                                performanceMatch = transferRate >= 34;
-                                break;
-                            case 'good':
-                                performanceMatch = transferRate >= 25 && transferRate < 34;
-                                break;
-                            case 'poor':
-                                performanceMatch = transferRate < 25;
-                                break;
-                            default:
-                                performanceMatch = true;
-                        }
-                    } else {
-                        performanceMatch = false;
-                    }
-                }
-
-                console.log('Performance filter:', performanceFilter, 'matches:', performanceMatch);
-            }
-
-            return statusMatch && performanceMatch;
-        });
-    }
-
-    // Apply global search
-    if (searchFilter) {
-        usersTable.search(searchFilter);
-    }
-
-    // Redraw the table
-    usersTable.draw();
 }
 
 function applyAnalyticsFilters() {
@@ -622,6 +729,8 @@ function setupTabHandlers() {
                 loadAnalyticsData();
             } else if (targetId === '#logs-panel') {
                 console.log('Logs tab opened');
+                // Rows could not be measured while the tab was hidden
+                if (logsTable) logsTable.refresh();
                 if (typeof loadLogsData === 'function') {
                     loadLogsData();
                 }
@@ -646,13 +755,15 @@ async function loadAnalyticsData(days = 30, callType = 'all') {
     });
 
     showAnalyticsLoading(true);
+    const signal = supersede('analytics');
 
     try {
         console.log('Fetching real analytics data from API...');
 
         // Build query parameters
         const params = new URLSearchParams({
-            days: days.toString()
+            days: days.toString(),
+            format: COLUMNAR
         });
 
         if (callType && callType !== 'all') {
@@ -678,35 +789,44 @@ async function loadAnalyticsData(days = 30, callType = 'all') {
         const performanceResponse = await fetch(`/admin/analytics/performance?${queryString}`, {
             headers: {
                 'Authorization': getCookie('access_token')
-            }
+            },
+            signal
         });
 
         if (!performanceResponse.ok) {
             throw new Error(`Performance API error: ${performanceResponse.status}`);
         }
 
-        const performanceData = await performanceResponse.json();
-        console.log('Performance data received:', performanceData);
+        // Parsed and shaped for the charts in the worker
+        const performanceJson = await performanceResponse.text();
 
         // Fetch trends data
         const trendsResponse = await fetch(`/admin/analytics/trends?${queryString}`, {
             headers: {
                 'Authorization': getCookie('access_token')
-            }
+            },
+            signal
         });
 
         if (!trendsResponse.ok) {
             throw new Error(`Trends API error: ${trendsResponse.status}`);
         }
 
-        const trendsData = await trendsResponse.json();
-        console.log('Trends data received:', trendsData);
+        const trendsJson = await trendsResponse.text();
+        const { performance, trends } = await tableWorker.request({
+            op: 'charts', performance: performanceJson, trends: trendsJson });
+        if (signal.aborted) return;
+        console.log('Analytics data received:', { performance, trends });
 
         // Store the real data globally
-        analyticsData.performance = performanceData;
-        analyticsData.trends = trendsData;
+        analyticsData.performance = performance;
+        analyticsData.trends = trends;
 
     } catch (error) {
+        if (error.name === 'AbortError') {
+            // Superseded by a newer filter change, which owns the loading state
+            return;
+        }
         console.error('Error fetching analytics data:', error);
         showAlert('Error loading analytics data: ' + error.message, 'danger');
 
@@ -800,8 +920,8 @@ function updateTopPerformersChart() {
     performanceChart.innerHTML = '';
 
     const chartData = [{
-        x: data.map(item => item.username),
-        y: data.map(item => item.transfer_rate),
+        x: data.username,
+        y: data.transfer_rate,
         type: 'bar',
         marker: {
             color: 'rgba(54, 162, 235, 0.8)',
@@ -824,7 +944,7 @@ function updateTopPerformersChart() {
         },
         yaxis: {
             title: 'Transfer Rate (%)',
-            range: [0, Math.max(...data.map(item => item.transfer_rate)) * 1.1]
+            range: [0, data.max_transfer_rate * 1.1]
         },
         margin: { t: 50, b: 80, l: 60, r: 20 },
         showlegend: false
@@ -872,8 +992,8 @@ function updateCallDistributionChart() {
     distributionChart.innerHTML = '';
 
     const chartData = [{
-        labels: data.map(item => item.type),
-        values: data.map(item => item.count),
+        labels: data.type,
+        values: data.count,
         type: 'pie',
         marker: {
             colors: ['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF']
@@ -926,6 +1046,7 @@ function updateTrendsChart() {
     }
 
     const data = analyticsData.trends.trends;
+    const dates = data.date;  // ISO days, see table-worker.js
     console.log('Trends data:', data);
 
     // Check if Plotly is available
@@ -939,8 +1060,8 @@ function updateTrendsChart() {
 
     const chartData = [
         {
-            x: data.map(item => item.date),
-            y: data.map(item => item.total_calls),
+            x: dates,
+            y: data.total_calls,
             type: 'scatter',
             mode: 'lines+markers',
             name: 'Total Calls',
@@ -948,8 +1069,8 @@ function updateTrendsChart() {
             yaxis: 'y'
         },
         {
-            x: data.map(item => item.date),
-            y: data.map(item => item.potential_calls),
+            x: dates,
+            y: data.potential_calls,
             type: 'scatter',
             mode: 'lines+markers',
             name: 'Potential Calls',
@@ -957,8 +1078,8 @@ function updateTrendsChart() {
             yaxis: 'y'
         },
         {
-            x: data.map(item => item.date),
-            y: data.map(item => item.transfer_rate),
+            x: dates,
+            y: data.transfer_rate,
             type: 'scatter',
             mode: 'lines+markers',
             name: 'Transfer Rate (%)',
@@ -1013,53 +1134,157 @@ function updateTrendsChart() {
 // ANALYTICS LOADING AND DEBUGGING
 // =======================
 
-function initializeDataTables() {
-    console.log('=== Initializing DataTables ===');
+function initializeTables() {
+    if (!tableWorker) {
+        console.error('Web Workers are not available; admin tables cannot be shown');
+        return;
+    }
 
-    // Initialize Users Table
     const usersTableElement = document.getElementById('usersTable');
     if (usersTableElement) {
-        usersTable = $(usersTableElement).DataTable({
-            responsive: true,
-            pageLength: 25,
-            order: [[1, 'desc']], // Sort by role (ADMIN first, then USER)
-            columnDefs: [
-                { orderable: false, targets: [4] } // Disable sorting on Actions column
-            ],
-            language: {
-                search: "Search users:",
-                lengthMenu: "Show _MENU_ users per page",
-                info: "Showing _START_ to _END_ of _TOTAL_ users",
-                infoEmpty: "No users found",
-                infoFiltered: "(filtered from _MAX_ total users)"
-            }
+        usersTable = new VirtualTable(usersTableElement, {
+            name: 'users',
+            renderRow: renderUserRow,
+            emptyHtml: '<tr><td colspan="9" class="text-center text-muted py-4">No users found</td></tr>',
+            sort: 'role',  // ADMIN after USER, as before
+            desc: true
+        });
+        usersTableElement.querySelector('tbody').addEventListener('click', handleUserRowClick);
+        const json = document.getElementById('usersTableData').textContent;
+        usersTable.load(json, JSON.parse(json)).then(applyUserFilters).catch(error => {
+            console.error('Error loading users table:', error);
         });
-        console.log('Users table initialized');
     }
 
-    // Initialize Logs Table
     const logsTableElement = document.getElementById('logsTable');
     if (logsTableElement) {
-        logsTable = $(logsTableElement).DataTable({
-            responsive: true,
-            pageLength: 25,
-            order: [[0, 'desc']], // Sort by date/time, newest first
-            columnDefs: [
-                { orderable: false, targets: [5] } // Disable sorting on Actions column if present
-            ],
-            language: {
-                search: "Search logs:",
-                lengthMenu: "Show _MENU_ logs per page",
-                info: "Showing _START_ to _END_ of _TOTAL_ logs",
-                infoEmpty: "No logs found",
-                infoFiltered: "(filtered from _MAX_ total logs)"
-            }
+        logsTable = new VirtualTable(logsTableElement, {
+            name: 'logs',
+            renderRow: renderLogRow,
+            emptyHtml: `
+                <tr>
+                    <td colspan="6" class="text-center text-muted py-4">
+                        <i class="fas fa-search fa-2x mb-2"></i>
+                        <div>No logs found with current filters</div>
+                    </td>
+                </tr>
+            `
+        });
+        logsTableElement.querySelector('tbody').addEventListener('click', handleLogRowClick);
+        const json = document.getElementById('logsTableData').textContent;
+        logsTable.load(json, JSON.parse(json)).then(() => logsTable.query()).catch(error => {
+            console.error('Error loading logs table:', error);
         });
-        console.log('Logs table initialized');
     }
 }
 
+function renderUserRow(columns, i) {
+    const currentUserId = Number(usersTable.table.dataset.currentUserId);
+    const id = columns.id[i];
+    const username = escapeHtml(columns.username[i]);
+    const name = escapeHtml(columns.name[i]);
+    const role = columns.role[i];
+    const isActive = columns.is_active[i];
+    const transferRate = columns.transfer_rate[i];
+    const totalCalls = columns.total_calls[i];
+    const listsCount = columns.log_lists_count[i];
+
+    const userLink = role === 'USER'
+        ? `<a href="#" data-action="showUserLogs" class="text-decoration-none">${username}</a>`
+        : username;
+    const performance = transferRate === null
+        ? '<span class="text-muted">N/A</span>'
+        : `<div class="performance-indicator ${transferRate >= 70 ? 'performance-excellent' : transferRate >= 50 ? 'performance-good' : 'performance-poor'}"></div>`;
+    const actions = id === currentUserId
+        ? '<span class="badge bg-light text-dark">Current User</span>'
+        : `<div class="btn-group btn-group-sm">
+                <button class="btn btn-outline-primary action-btn" data-action="edit" data-bs-toggle="tooltip" title="Edit User"><i class="fas fa-edit"></i></button>
+                ${isActive
+                    ? '<button class="btn btn-outline-warning action-btn" data-action="deactivate" data-bs-toggle="tooltip" title="Deactivate"><i class="fas fa-pause"></i></button>'
+                    : '<button class="btn btn-outline-success action-btn" data-action="activate" data-bs-toggle="tooltip" title="Activate"><i class="fas fa-play"></i></button>'}
+                <button class="btn btn-outline-info action-btn" data-action="resetPassword" data-bs-toggle="tooltip" title="Reset Password"><i class="fas fa-key"></i></button>
+                <button class="btn btn-outline-danger action-btn" data-action="delete" data-bs-toggle="tooltip" title="Delete User"><i class="fas fa-trash"></i></button>
+            </div>`;
+
+    return `<tr data-row="${i}">
+        <td>
+            <div class="d-flex align-items-center">
+                <div class="avatar-sm bg-primary text-white rounded-circle d-flex align-items-center justify-content-center me-3">${escapeHtml(columns.name[i].charAt(0).toUpperCase())}</div>
+                <div>
+                    <div class="fw-bold">${userLink}</div>
+                    <small class="text-muted">${name}</small>
+                </div>
+            </div>
+        </td>
+        <td><span class="badge badge-status bg-${role === 'ADMIN' ? 'danger' : 'primary'}">${role}</span></td>
+        <td>
+            <span class="badge badge-status bg-${isActive ? 'success' : 'secondary'}">
+                <i class="fas fa-${isActive ? 'check' : 'times'} me-1"></i>${isActive ? 'Active' : 'Inactive'}
+            </span>
+        </td>
+        <td>${performance}</td>
+        <td>${transferRate === null ? '<span class="text-muted">—</span>' : `<span class="fw-bold">${transferRate}%</span>`}</td>
+        <td>${totalCalls > 0
+            ? `<span class="fw-bold">${totalCalls}</span><small class="text-muted d-block">${columns.potential_calls[i]} potential</small>`
+            : '<span class="text-muted">0</span>'}</td>
+        <td>${listsCount > 0 ? `<span class="badge bg-info">${listsCount}</span>` : '<span class="text-muted">0</span>'}</td>
+        <td><small>${formatEpoch(columns.created_at[i])}</small></td>
+        <td>${actions}</td>
+    </tr>`;
+}
 
+function handleUserRowClick(event) {
+    const control = event.target.closest('[data-action]');
+    if (!control) return;
+    event.preventDefault();
+    const columns = usersTable.columns;
+    const i = usersTable.rowOf(control);
+    const id = columns.id[i];
+    switch (control.dataset.action) {
+        case 'showUserLogs':
+            return showUserLogs(columns.username[i], id);
+        case 'edit':
+            return editUser(id, columns.username[i], columns.name[i], columns.role[i]);
+        case 'deactivate':
+            return deactivateUser(id);
+        case 'activate':
+            return activateUser(id);
+        case 'resetPassword':
+            return resetPassword(id);
+        case 'delete':
+            return deleteUser(id, columns.username[i]);
+    }
+}
+
+function renderLogRow(columns, i) {
+    const callType = escapeHtml(columns.call_type[i]);
+    const userName = escapeHtml(columns['user.name'][i]);
+    const transferRate = columns['user.transfer_rate'][i];
+    // Only agents have a details view
+    const userCell = columns['user.role'][i] === 'USER'
+        ? `<a href="#" data-action="showUserLogs" class="text-decoration-none">${userName}</a>`
+        : userName;
+    const statusBadge = columns.is_potential_sale[i]
+        ? '<span class="badge bg-success">Potential Sale</span>'
+        : `<span class="badge bg-secondary">${callType}</span>`;
+
+    return `<tr data-row="${i}">
+        <td><small>${formatEpoch(columns.timestamp[i], true)}</small></td>
+        <td>${userCell}</td>
+        <td>${transferRate === null ? '<span class="text-muted">—</span>' : `<span class="fw-bold">${transferRate.toFixed(1)}%</span>`}</td>
+        <td>${escapeHtml(columns['log_list.name'][i] || 'N/A')}</td>
+        <td><span class="badge bg-info">${callType}</span></td>
+        <td>${statusBadge}</td>
+    </tr>`;
+}
+
+function handleLogRowClick(event) {
+    const control = event.target.closest('[data-action="showUserLogs"]');
+    if (!control) return;
+    event.preventDefault();
+    const i = logsTable.rowOf(control);
+    showUserLogs(logsTable.columns['user.username'][i], logsTable.columns['user.id'][i]);
+}
 
 function updateFilterStatusDisplay(days, callType) {
     const statusElement = document.getElementById('filterStatus');
@@ -1102,6 +1327,7 @@ window.loadAnalyticsData = loadAnalyticsData;
 async function loadFilteredLogs(userId = '', callType = '', dateFrom = '', dateTo = '', search = '') {
     console.log('=== Loading Filtered Logs ===');
     console.log('Filters:', { userId, callType, dateFrom, dateTo, search });
+    const signal = supersede('logs');
 
     try {
         // Build query parameters
@@ -1111,6 +1337,7 @@ async function loadFilteredLogs(userId = '', callType = '', dateFrom = '', dateT
         if (dateFrom) params.append('date_from', dateFrom);
         if (dateTo) params.append('date_to', dateTo);
         if (search) params.append('search', search);
+        params.append('format', COLUMNAR);
 
         const queryString = params.toString();
         console.log('Fetching logs with filters:', queryString);
@@ -1118,99 +1345,41 @@ async function loadFilteredLogs(userId = '', callType = '', dateFrom = '', dateT
         const response = await fetch(`/admin/analytics/call-logs?${queryString}`, {
             headers: {
                 'Authorization': getCookie('access_token')
-            }
+            },
+            signal
         });
 
         if (!response.ok) {
             throw new Error(`API error: ${response.status}`);
         }
 
-        const data = await response.json();
+        const json = await response.text();
+        const data = JSON.parse(json);
         console.log('Received filtered logs:', data);
 
         // Update the logs table
-        updateLogsTable(data.logs || []);
+        await updateLogsTable(json, data);
 
-        showAlert(`Loaded ${data.logs ? data.logs.length : 0} filtered logs`, 'success');
+        showAlert(`Loaded ${rowCount(data.logs)} filtered logs`, 'success');
 
     } catch (error) {
+        if (error.name === 'AbortError') {
+            return;
+        }
         console.error('Error loading filtered logs:', error);
         showAlert('Error loading logs: ' + error.message, 'danger');
     }
 }
 
-function updateLogsTable(logs) {
-    console.log('Updating logs table with', logs.length, 'logs');
-
-    const logsTable = document.getElementById('logsTable');
+// json: a call-logs response in columnar form; data: the same, parsed
+async function updateLogsTable(json, data) {
     if (!logsTable) {
         console.error('Logs table not found');
         return;
     }
-
-    const tbody = logsTable.querySelector('tbody');
-    if (!tbody) {
-        console.error('Logs table tbody not found');
-        return;
-    }
-
-    // Clear existing rows
-    tbody.innerHTML = '';
-
-    if (logs.length === 0) {
-        tbody.innerHTML = `
-            <tr>
-                <td colspan="6" class="text-center text-muted py-4">
-                    <i class="fas fa-search fa-2x mb-2"></i>
-                    <div>No logs found with current filters</div>
-                </td>
-            </tr>
-        `;
-        return;
-    }
-
-    // Add filtered logs
-    logs.forEach(log => {
-        const row = document.createElement('tr');
-
-        // Format timestamp
-        const timestamp = new Date(log.timestamp).toLocaleDateString('en-US', {
-            month: '2-digit',
-            day: '2-digit',
-            year: 'numeric',
-            hour: '2-digit',
-            minute: '2-digit',
-            hour12: false
-        });
-
-        // Determine status badge
-        const potentialSaleTypes = ['AOD', 'APPOINTMENT', 'T2', 'HPA'];
-        const isPotentialSale = potentialSaleTypes.includes(log.call_type);
-        const statusBadge = isPotentialSale
-            ? '<span class="badge bg-success">Potential Sale</span>'
-            : `<span class="badge bg-secondary">${log.call_type}</span>`;
-
-        // Create username cell - only make clickable if user role is 'USER'
-        const usernameCell = log.user.role === 'USER'
-            ? `<a href="#" onclick="showUserLogs('${log.user.username}', ${log.user.id}); return false;" class="text-decoration-none">${log.user.name}</a>`
-            : log.user.name;
-
-        // Create transfer rate cell
-        const transferRateCell = log.user.transfer_rate !== null && log.user.transfer_rate !== undefined
-            ? `<span class="fw-bold">${log.user.transfer_rate.toFixed(1)}%</span>`
-            : '<span class="text-muted">—</span>';
-
-        row.innerHTML = `
-            <td><small>${timestamp}</small></td>
-            <td>${usernameCell}</td>
-            <td>${transferRateCell}</td>
-            <td>${log.log_list.name || 'N/A'}</td>
-            <td><span class="badge bg-info">${log.call_type}</span></td>
-            <td>${statusBadge}</td>
-        `;
-
-        tbody.appendChild(row);
-    });
+    console.log('Updating logs table with', rowCount(data.logs), 'logs');
+    await logsTable.load(json, data.logs, 'logs');
+    await logsTable.query();
 }
 
 async function showUserLogs(username, userId) {
@@ -1469,7 +1638,7 @@ function showListDetailsModal(listName, listData, username) {
                     <div class="col-md-4">
                         <div class="card bg-light">
                             <div class="card-body text-center">
-                                <h5 class="text-primary">${listData.calls.length}</h5>
+                                <h5 class="text-primary">${listData.total_calls}</h5>
                                 <small class="text-muted">Total Calls</small>
                             </div>
                         </div>
@@ -1497,7 +1666,7 @@ function showListDetailsModal(listName, listData, username) {
                 <i class="fas fa-phone me-2"></i>
                 Recent Calls
             </h6>
-            <div class="table-responsive">
+            <div class="table-responsive list-calls">
                 <table class="table table-sm">
                     <thead>
                         <tr>
@@ -1506,47 +1675,16 @@ function showListDetailsModal(listName, listData, username) {
                             <th>Status</th>
                         </tr>
                     </thead>
-                    <tbody>
-        `;
-
-        listData.calls.slice(0, 10).forEach(call => {
-            const timestamp = new Date(call.timestamp).toLocaleDateString('en-US', {
-                month: '2-digit',
-                day: '2-digit',
-                year: 'numeric',
-                hour: '2-digit',
-                minute: '2-digit',
-                hour12: false
-            });
-
-            const potentialSaleTypes = ['AOD', 'APPOINTMENT', 'T2', 'HPA'];
-            const isPotentialSale = potentialSaleTypes.includes(call.call_type);
-            const statusBadge = isPotentialSale
-                ? '<span class="badge bg-success">Potential Sale</span>'
-                : `<span class="badge bg-secondary">${call.call_type}</span>`;
-
-            content += `
-                <tr>
-                    <td><small>${timestamp}</small></td>
-                    <td><span class="badge bg-info">${call.call_type}</span></td>
-                    <td>${statusBadge}</td>
-                </tr>
-            `;
-        });
-
-        content += `
-                    </tbody>
+                    <tbody id="listCallsBody"></tbody>
                 </table>
             </div>
+            <div class="text-center mt-3">
+                <small class="text-muted me-2" id="listCallsShown"></small>
+                <button type="button" class="btn btn-outline-primary btn-sm" id="listCallsMore">
+                    <i class="fas fa-chevron-down me-1"></i>Load more
+                </button>
+            </div>
         `;
-
-        if (listData.calls.length > 10) {
-            content += `
-                <div class="text-center mt-3">
-                    <small class="text-muted">Showing 10 of ${listData.calls.length} calls</small>
-                </div>
-            `;
-        }
     } else {
         content = `
             <div class="text-center py-4">
@@ -1559,11 +1697,74 @@ function showListDetailsModal(listName, listData, username) {
 
     modalBody.innerHTML = content;
 
+    if (listData.calls && listData.calls.length > 0) {
+        appendListCalls(modalBody, listData.id, listData, listData.total_calls);
+    }
+
     // Show the modal
-    const bsModal = new bootstrap.Modal(modal);
+    const bsModal = bootstrap.Modal.getOrCreateInstance(modal);
     bsModal.show();
 }
 
+function renderListCallRow(call) {
+    const timestamp = new Date(call.timestamp).toLocaleDateString('en-US', {
+        month: '2-digit',
+        day: '2-digit',
+        year: 'numeric',
+        hour: '2-digit',
+        minute: '2-digit',
+        hourCycle: 'h23'
+    });
+    const callType = escapeHtml(call.call_type);
+    const statusBadge = call.is_potential_sale
+        ? '<span class="badge bg-success">Potential Sale</span>'
+        : `<span class="badge bg-secondary">${callType}</span>`;
+
+    return `
+        <tr>
+            <td><small>${timestamp}</small></td>
+            <td><span class="badge bg-info">${callType}</span></td>
+            <td>${statusBadge}</td>
+        </tr>
+    `;
+}
+
+// Adds a page of calls to the list modal and wires "Load more" to fetch the
+// next one with the page's cursor, so opening a list costs one page however
+// many calls it has
+function appendListCalls(modalBody, listId, page, totalCalls) {
+    const body = modalBody.querySelector('#listCallsBody');
+    const more = modalBody.querySelector('#listCallsMore');
+    body.insertAdjacentHTML('beforeend', page.calls.map(renderListCallRow).join(''));
+    modalBody.querySelector('#listCallsShown').textContent =
+        `Showing ${body.rows.length} of ${totalCalls} calls`;
+
+    more.hidden = !page.next_cursor;
+    more.disabled = false;
+    more.onclick = async () => {
+        more.disabled = true;
+        try {
+            const params = new URLSearchParams({ cursor: page.next_cursor });
+            const response = await fetch(`/admin/lists/${listId}/calls?${params}`, {
+                headers: {
+                    'Authorization': getCookie('access_token')
+                }
+            });
+            if (!response.ok) {
+                throw new Error(`API error: ${response.status}`);
+            }
+            const nextPage = await response.json();
+            // Dropped if the modal has since been opened on another list
+            if (body.isConnected) {
+                appendListCalls(modalBody, listId, nextPage, totalCalls);
+            }
+        } catch (error) {
+            more.disabled = false;
+            showAlert('Error loading calls: ' + error.message, 'danger');
+        }
+    };
+}
+
 function createListDetailsModal() {
     const modalHTML = `
         <div class="modal fade" id="listDetailsModal" tabindex="-1" aria-labelledby="listDetailsModalLabel" aria-hidden="true">
@@ -17,12 +17,26 @@ function getAuthHeaders() {
     };
 }
 
+// fetch() for API calls. The server renews an expired access token from the
+// refresh cookie by itself; if a request still comes back 401, renew
+// explicitly and retry once, and only then send the user to the login page.
+async function authFetch(url, options) {
+    const response = await fetch(url, options);
+    if (response.status !== 401) return response;
+    const refreshed = await fetch("/token/refresh", { method: "POST" });
+    if (!refreshed.ok) {
+        window.location.href = "/login";
+        return response;
+    }
+    return fetch(url, options);
+}
+
 document.getElementById("createLogListForm").addEventListener("submit", async function(event) {
     event.preventDefault();
     const name = document.getElementById("logListName").value.trim();
     if (!name) return;
     try {
-        const response = await fetch("/log-lists/", {
+        const response = await authFetch("/log-lists/", {
             method: "POST",
             headers: getAuthHeaders(),
             body: JSON.stringify({ name })
@@ -58,7 +72,7 @@ if (deleteLogListBtn) {
 
         if (confirm(`Are you sure you want to delete the log list "${logListName}" and all its call logs?`)) {
             try {
-                const response = await fetch(`/log-lists/${logListId}`, {
+                const response = await authFetch(`/log-lists/${logListId}`, {
                     method: "DELETE",
                     headers: getAuthHeaders()
                 });
@@ -77,6 +91,17 @@ if (deleteLogListBtn) {
     });
 }
 
+// Idempotency key for the call being logged. A retry of the same call
+// (after an error or timeout) reuses it, so the server stores it only once.
+let pendingCall = null;
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2);
+}
+
 // Handle call logging (only if element exists)
 const logCallForm = document.getElementById("logCallForm");
 if (logCallForm) {
@@ -90,16 +115,25 @@ if (logCallForm) {
             alert("Please select a call type and ensure you have a log list selected");
             return;
         }
+        if (!pendingCall || pendingCall.callType !== callType || pendingCall.logListId !== logListId) {
+            pendingCall = { callType: callType, logListId: logListId, key: newIdempotencyKey() };
+        }
+        // Ignore double-clicks while the call is being saved
+        const submitButton = logCallForm.querySelector("[type=submit]");
+        if (submitButton) submitButton.disabled = true;
         try {
-            const response = await fetch("/calls/", {
+            const response = await authFetch("/calls/", {
                 method: "POST",
-                headers: getAuthHeaders(),
+                headers: { ...getAuthHeaders(), "Idempotency-Key": pendingCall.key },
                 body: JSON.stringify({ call_type: callType, log_list_id: parseInt(logListId) })
             });
             if (!response.ok) throw new Error("Failed to log call");
+            pendingCall = null;
             window.location.reload();
         } catch (error) {
             alert("Error: " + error.message);
+        } finally {
+            if (submitButton) submitButton.disabled = false;
         }
     });
 }
@@ -112,7 +146,7 @@ document.addEventListener("click", async function(event) {
 
         if (confirm("Are you sure you want to delete this call log?")) {
             try {
-                const response = await fetch(`/calls/${callId}`, {
+                const response = await authFetch(`/calls/${callId}`, {
                     method: "DELETE",
                     headers: getAuthHeaders()
                 });
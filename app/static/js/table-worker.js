@@ -0,0 +1,114 @@
+// Admin dashboard worker: filters and sorts the admin tables and shapes
+// analytics payloads for the charts, off the main thread.
+//
+// Tables are columnar ({field: [values]}), as embedded in the dashboard and
+// returned by the analytics endpoints with ?format=columnar. A query answers
+// with the matching row indexes in display order; the page renders only the
+// rows currently scrolled into view.
+//
+// Messages carry an id, which the reply repeats:
+//   {op: 'load', table, json, field}           -> {rows}
+//   {op: 'query', table, filters, sort, desc}  -> {order: Int32Array}
+//   {op: 'charts', performance, trends}        -> {performance, trends}
+
+const tables = {};
+
+// Row filters per table: (columns, filters) -> predicate on a row index
+const FILTERS = {
+    users(columns, filters) {
+        const search = (filters.search || '').trim().toLowerCase();
+        const searchable = search
+            ? columns.username.map((username, i) =>
+                `${username} ${columns.name[i]} ${columns.role[i]}`.toLowerCase())
+            : null;
+        return i => {
+            if (filters.role && columns.role[i] !== filters.role) return false;
+            if (filters.status === 'active' && !columns.is_active[i]) return false;
+            if (filters.status === 'inactive' && columns.is_active[i]) return false;
+            if (filters.performance) {
+                const rate = columns.transfer_rate[i];
+                if (rate === null) return false;
+                if (filters.performance === 'excellent' && rate < 34) return false;
+                if (filters.performance === 'good' && (rate < 25 || rate >= 34)) return false;
+                if (filters.performance === 'poor' && rate >= 25) return false;
+            }
+            return !searchable || searchable[i].includes(search);
+        };
+    },
+    logs() {
+        // Call logs are filtered by the server
+        return () => true;
+    }
+};
+
+function rowCount(columns) {
+    const first = Object.keys(columns)[0];
+    return first === undefined ? 0 : columns[first].length;
+}
+
+// Many times faster than calling localeCompare for every comparison
+const collator = new Intl.Collator(undefined, { sensitivity: 'base', numeric: true });
+
+function compare(a, b) {
+    // Missing values sort last in either direction, see query()
+    if (typeof a === 'string') return collator.compare(a, b);
+    return a < b ? -1 : a > b ? 1 : 0;
+}
+
+function query(table, filters, sort, desc) {
+    const columns = tables[table];
+    const keep = FILTERS[table](columns, filters || {});
+    const rows = rowCount(columns);
+    const matching = [];
+    for (let i = 0; i < rows; i++) {
+        if (keep(i)) matching.push(i);
+    }
+    if (sort) {
+        const values = columns[sort];
+        const direction = desc ? -1 : 1;
+        // Array.prototype.sort is stable, so ties keep the server's order
+        matching.sort((a, b) => {
+            const x = values[a];
+            const y = values[b];
+            if (x === null || y === null) return (x === null) - (y === null);
+            return direction * compare(x, y);
+        });
+    }
+    return Int32Array.from(matching);
+}
+
+function epochDay(seconds) {
+    return seconds === null ? null : new Date(seconds * 1000).toISOString().slice(0, 10);
+}
+
+function shapeCharts(performanceJson, trendsJson) {
+    const performance = JSON.parse(performanceJson);
+    const trends = JSON.parse(trendsJson);
+    const performers = performance.top_performers;
+    performers.max_transfer_rate = Math.max(0, ...performers.transfer_rate);
+    trends.trends.date = trends.trends.date.map(epochDay);
+    return { performance, trends };
+}
+
+self.onmessage = event => {
+    const { id, op } = event.data;
+    try {
+        if (op === 'load') {
+            // field: where the table is in a larger response, if it is
+            const { table, json, field } = event.data;
+            const parsed = JSON.parse(json);
+            tables[table] = field ? parsed[field] : parsed;
+            self.postMessage({ id, rows: rowCount(tables[table]) });
+        } else if (op === 'query') {
+            const { table, filters, sort, desc } = event.data;
+            const order = query(table, filters, sort, desc);
+            self.postMessage({ id, order }, [order.buffer]);
+        } else if (op === 'charts') {
+            self.postMessage({ id, ...shapeCharts(event.data.performance, event.data.trends) });
+        } else {
+            throw new Error(`Unknown operation: ${op}`);
+        }
+    } catch (error) {
+        self.postMessage({ id, error: error.message });
+    }
+};
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import time
+
+import jinja2
+from fastapi.templating import Jinja2Templates
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from app import assets, metrics
+from app.cache import TTLCache, versions
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+# Compiled template bytecode survives restarts and is shared by workers
+TEMPLATE_CACHE_DIR = os.getenv(
+    "TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "transfer_rate_app_templates"))
+# Fragments are keyed by this process's data versions; the TTL bounds how long
+# another worker's writes can go unnoticed.
+TEMPLATE_FRAGMENT_TTL = float(os.getenv("TEMPLATE_FRAGMENT_TTL", "30"))
+TEMPLATE_FRAGMENT_CACHE_SIZE = int(os.getenv("TEMPLATE_FRAGMENT_CACHE_SIZE", "256"))
+
+template_render_seconds = metrics.registry.histogram(
+    "app_template_render_seconds", "Template render time.", ("template",))
+fragment_cache_requests = metrics.registry.counter(
+    "app_template_fragment_cache_total", "Template fragment cache lookups.",
+    ("fragment", "result"))
+
+
+class FragmentCacheExtension(Extension):
+    """Cache the rendered output of a template block.
+
+        {% cache "users_rows", data_version("users"), current_user.id %}
+            ...
+        {% endcache %}
+
+    The first argument names the fragment, the rest are the cache key. On a
+    hit the block is not evaluated at all.
+    """
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=TTLCache(
+            maxsize=TEMPLATE_FRAGMENT_CACHE_SIZE, ttl=TEMPLATE_FRAGMENT_TTL))
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render_cached", [nodes.List(args)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, key_parts, caller):
+        key = tuple(key_parts)
+        cache = self.environment.fragment_cache
+        rendered = cache.get(key)
+        if rendered is not None:
+            fragment_cache_requests.labels(key[0], "hit").inc()
+            return rendered
+        fragment_cache_requests.labels(key[0], "miss").inc()
+        rendered = caller()
+        cache.set(key, rendered)
+        return rendered
+
+
+class TimedJinja2Templates(Jinja2Templates):
+    """Jinja2Templates that records render time per template."""
+
+    def TemplateResponse(self, *args, **kwargs):
+        name = kwargs.get("name") or next((a for a in args if isinstance(a, str)), "unknown")
+        started = time.perf_counter()
+        try:
+            return super().TemplateResponse(*args, **kwargs)
+        finally:
+            template_render_seconds.labels(name).observe(time.perf_counter() - started)
+
+
+def create_templates() -> TimedJinja2Templates:
+    """Build the template environment with bytecode and fragment caching."""
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+        autoescape=True,
+        extensions=[FragmentCacheExtension],
+        bytecode_cache=jinja2.FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+        # Only check template files for changes while developing
+        auto_reload=os.getenv("ENVIRONMENT") == "development",
+    )
+    env.globals["data_version"] = versions.get
+    env.globals["asset_url"] = assets.asset_url
+    return TimedJinja2Templates(env=env)
+
+
+def precompile(templates: Jinja2Templates):
+    """Compile every template up front instead of on the first request."""
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.env.get_template(name)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Benchmark: year-over-year analytics on call_logs versus the archive.
+
+Seeds --years of calls, --per-day a day over --agents agents, into a
+scratch SQLite database. Times the trends and performance analytics and a
+deep page of the call logs over the whole range with every call in
+call_logs. Then archives all but the last ARCHIVE_HOT_MONTHS months to
+Parquet, prunes them from call_logs, and times the same reads again, as
+call_logs plus DuckDB. Checks that both give the same results:
+
+    python -m bench.archive --years 2 --per-day 400
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.seed import CALL_TYPE_WEIGHTS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--per-day", type=int, default=400)
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    return parser.parse_args(argv)
+
+
+def seed(engine, days: int, per_day: int, agents: int):
+    from sqlalchemy import insert
+    from app.models import Base, CallLog, LogList, User, UserRole, POTENTIAL_SALE_CALL_TYPES
+
+    Base.metadata.create_all(engine)
+    rng = random.Random(50)
+    call_types, weights = zip(*CALL_TYPE_WEIGHTS.items())
+    end = datetime.now().replace(microsecond=0)
+    with engine.begin() as conn:
+        lists = []
+        for i in range(agents):
+            agent_id = conn.execute(insert(User).values(
+                username=f"agent-{i:03d}", name=f"Agent {i}", hashed_password="-",
+                role=UserRole.USER)).inserted_primary_key[0]
+            lists.append((conn.execute(insert(LogList).values(
+                name=f"List {i}", owner_id=agent_id)).inserted_primary_key[0], agent_id))
+        for day in range(days, 0, -1):
+            calls = []
+            # Distinct timestamps, so that pages of calls have one order
+            for second in rng.sample(range(86400), per_day):
+                call_type = rng.choices(call_types, weights)[0]
+                list_id, owner_id = rng.choice(lists)
+                calls.append({
+                    "call_type": call_type, "log_list_id": list_id, "owner_id": owner_id,
+                    "timestamp": end - timedelta(days=day - 1, seconds=second),
+                    "is_potential": call_type in POTENTIAL_SALE_CALL_TYPES,
+                })
+            conn.execute(insert(CallLog), calls)
+
+
+def timed(function, repeat: int):
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+def reads(db, days: int) -> dict:
+    """The year-over-year reads: name -> function returning a comparable result.
+
+    Over days + 1, so that no call leaves the range while the benchmark runs.
+    """
+    from starlette.requests import Request
+    from app import main
+
+    request = Request({"type": "http", "query_string": b"", "headers": []})
+
+    def call_logs(offset):
+        body = json.loads(main.get_filtered_call_logs(request, limit=100, offset=offset, db=db).body)
+        for log in body["logs"]:
+            del log["user"]["transfer_rate"]  # all-time, from call_logs alone once pruned
+        return body
+
+    days += 1
+    return {
+        "trends": lambda: main.trend_analytics(db, days, "all")["trends"],
+        "distribution": lambda: main.performance_analytics(db, days, "potential")[
+            "call_distribution"],
+        "call logs, deep page": lambda: call_logs(days * 300),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    directory = tempfile.mkdtemp(prefix="bench_archive_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    os.environ["ARCHIVE_DIR"] = os.path.join(directory, "archive")
+    # The reads compared are the archive-aware ones, not the all-time totals
+    os.environ["ARCHIVE_ALLOW_PRUNE"] = "true"
+
+    from app import archive
+    from app.database import SessionLocal, engine
+
+    if archive.duckdb is None or archive.pyarrow is None:
+        sys.exit("Needs duckdb and pyarrow: pip install -r requirements-archive.txt")
+    days = 365 * args.years
+    seed(engine, days, args.per_day, args.agents)
+    print(f"{days * args.per_day:,} calls over {days} days, "
+          f"{archive.ARCHIVE_HOT_MONTHS} months kept hot\n")
+
+    results = {}
+    with SessionLocal() as db:
+        for name, read in reads(db, days).items():
+            results[name] = timed(read, args.repeat)
+        started = time.perf_counter()
+        exported = archive.store.export(db)
+        export_s = time.perf_counter() - started
+        started = time.perf_counter()
+        pruned = archive.store.prune(db)
+        prune_s = time.perf_counter() - started
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM")
+    print(f"exported {exported['archived']:,} calls in {export_s:.2f} s, "
+          f"pruned {pruned:,} in {prune_s:.2f} s\n")
+
+    failed = False
+    print(f"{'read':<22}{'call_logs ms':>14}{'archive ms':>12}")
+    with SessionLocal() as db:
+        for name, read in reads(db, days).items():
+            elapsed, result = timed(read, args.repeat)
+            before, expected = results[name]
+            print(f"{name:<22}{before:>14.1f}{elapsed:>12.1f}")
+            if result != expected:
+                print(f"FAIL: {name} differs with the archive")
+                failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
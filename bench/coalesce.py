@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Benchmark: N identical admin reads at once, with and without coalescing.
+
+Sends one request to each coalesced endpoint, then a burst of --burst
+identical requests at the same moment, and reports how many times the
+computation ran and how many SQL statements the burst executed. With
+coalescing on, the burst should run the computation once and execute about
+one request's worth of SQL plus the per-request login lookup. Exits with
+status 1 if any burst ran its computation more than once.
+
+    python -m bench.coalesce --database-url sqlite:///bench/bench.db
+    COALESCE_ENABLED=false python -m bench.coalesce --database-url sqlite:///bench/bench.db
+
+Bulkheads are disabled here, because the analytics class admits only a few
+requests at a time and requests still queued when the leader finishes
+start a new computation. Rate limits are disabled as well, since the whole
+burst comes from one admin.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from bench.run import StatementCounter, lifespan, log_in
+from bench.seed import BENCH_ADMIN
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--burst", type=int, default=20,
+                        help="Identical requests sent at once")
+    return parser.parse_args(argv)
+
+
+def targets(user_id: int):
+    """(flight name, URL) for each coalesced endpoint."""
+    return [
+        ("dashboard", "/admin/dashboard"),
+        ("user_details", f"/admin/users/{user_id}/details"),
+        ("analytics", "/admin/analytics/performance?days=30&call_type=all"),
+        ("analytics", "/admin/analytics/trends?days=90&call_type=potential"),
+    ]
+
+
+async def measure(client, counter, flight, url, burst) -> dict:
+    from app.coalesce import coalesce_calls
+
+    leaders = coalesce_calls.labels(flight, "leader")
+    merged = coalesce_calls.labels(flight, "merged")
+
+    before = counter.count
+    response = await client.get(url)
+    response.raise_for_status()
+    single = counter.count - before
+
+    before = (counter.count, leaders.value, merged.value)
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(client.get(url) for _ in range(burst)))
+    elapsed = time.perf_counter() - started
+    for response in responses:
+        response.raise_for_status()
+    return {
+        "single_sql": single,
+        "burst_sql": counter.count - before[0],
+        # Both stay 0 with COALESCE_ENABLED=false
+        "computations": int(leaders.value - before[1]),
+        "merged": int(merged.value - before[2]),
+        "burst_ms": round(elapsed * 1000, 1),
+    }
+
+
+async def main_async(args) -> dict:
+    import httpx
+    from sqlalchemy import select
+    from app import models
+    from app.database import engine
+    from app.main import app
+
+    with engine.connect() as conn:
+        user_id = conn.execute(
+            select(models.User.id).where(models.User.role == models.UserRole.USER)
+            .order_by(models.User.id).limit(1)).scalar()
+    if user_id is None:
+        sys.exit("No agents found; run `python -m bench.seed` first")
+
+    counter = StatementCounter(engine)
+    transport = httpx.ASGITransport(app=app)
+
+    def make_client(cookies=None):
+        return httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 cookies=cookies, timeout=60.0)
+
+    results = {}
+    async with lifespan(app):
+        cookies = await log_in(make_client, BENCH_ADMIN)
+        async with make_client(cookies) as client:
+            for flight, url in targets(user_id):
+                results[url] = await measure(client, counter, flight, url, args.burst)
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        sys.exit("--database-url or DATABASE_URL is required")
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["BULKHEADS_ENABLED"] = "false"
+    os.environ["RATE_LIMITS_ENABLED"] = "false"
+
+    results = asyncio.run(main_async(args))
+    from app.coalesce import COALESCE_ENABLED
+
+    print(f"{'endpoint':<56}{'single sql':>11}{'burst sql':>10}"
+          f"{'runs':>6}{'merged':>8}{'burst ms':>10}")
+    for url, r in results.items():
+        print(f"{url:<56}{r['single_sql']:>11}{r['burst_sql']:>10}"
+              f"{r['computations']:>6}{r['merged']:>8}{r['burst_ms']:>10}")
+    if COALESCE_ENABLED and any(r["computations"] > 1 for r in results.values()):
+        print(f"FAIL: a burst of {args.burst} identical requests ran more than once")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
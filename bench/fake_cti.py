@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Fake phone system: pushes signed call batches to POST /cti/calls.
+
+Uses the agents and lists of a seeded database, sends NDJSON (or msgpack)
+batches at a target rate and reports accepted events per second and batch
+latency. A share of events is re-sent to exercise deduplication.
+
+    CTI_SIGNING_SECRET=dev-secret python -m bench.fake_cti --database-url sqlite:///bench/bench.db
+    python -m bench.fake_cti --database-url postgresql://... --base-url http://localhost:8000 \\
+        --signing-secret dev-secret --rate 200 --duration 60
+
+In-process runs delete the calls they inserted afterwards (unless --keep).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from bench.run import lifespan, percentile
+from bench.seed import CALL_TYPE_WEIGHTS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--base-url", default=None,
+                        help="Push to a running server instead of in-process")
+    parser.add_argument("--signing-secret", default=os.getenv("CTI_SIGNING_SECRET"),
+                        help="The server's CTI_SIGNING_SECRET")
+    parser.add_argument("--key-id", default="fake-cti")
+    parser.add_argument("--rate", type=float, default=100.0,
+                        help="Target call events per second")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Batches in flight at once")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.02,
+                        help="Share of events delivered twice")
+    parser.add_argument("--format", choices=("ndjson", "msgpack"), default="ndjson")
+    parser.add_argument("--keep", action="store_true",
+                        help="Keep the inserted calls (in-process runs)")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def load_agents():
+    """Active agents with the names of their lists."""
+    from sqlalchemy import select
+    from app import models
+    from app.database import engine
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(models.User.username, models.LogList.name)
+            .join(models.LogList, models.LogList.owner_id == models.User.id)
+            .where(models.User.role == models.UserRole.USER,
+                   models.User.is_active.is_(True))
+        ).all()
+    agents = {}
+    for username, list_name in rows:
+        agents.setdefault(username, []).append(list_name)
+    if not agents:
+        sys.exit("No active agents with lists found; run `python -m bench.seed` first")
+    return sorted(agents.items())
+
+
+class EventSource:
+    """Random call events, with some earlier events delivered again."""
+
+    def __init__(self, agents, run_id, duplicate_rate, rng):
+        self.agents = agents
+        self.run_id = run_id
+        self.duplicate_rate = duplicate_rate
+        self.rng = rng
+        self.sent = 0
+        self.recent = []
+        self.call_types = list(CALL_TYPE_WEIGHTS)
+        self.weights = list(CALL_TYPE_WEIGHTS.values())
+
+    def next_event(self) -> dict:
+        if self.recent and self.rng.random() < self.duplicate_rate:
+            return self.rng.choice(self.recent)
+        username, lists = self.rng.choice(self.agents)
+        self.sent += 1
+        event = {
+            "agent": username,
+            "list": self.rng.choice(lists),
+            "call_type": self.rng.choices(self.call_types, self.weights)[0],
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "external_id": f"fake-{self.run_id}-{self.sent}",
+        }
+        self.recent = (self.recent + [event])[-1000:]
+        return event
+
+    def batch(self, size: int) -> list:
+        return [self.next_event() for _ in range(size)]
+
+
+def encode(events, fmt: str):
+    if fmt == "msgpack":
+        import msgpack
+        return msgpack.packb(events), "application/msgpack"
+    body = "\n".join(json.dumps(e) for e in events).encode()
+    return body, "application/x-ndjson"
+
+
+async def push(make_client, args, source) -> dict:
+    from app.cti import derive_api_secret, sign
+
+    api_secret = derive_api_secret(args.key_id, args.signing_secret)
+    interval = args.batch_size / args.rate
+    deadline = time.perf_counter() + args.duration
+    totals = {"batches": 0, "failed_batches": 0, "events": 0,
+              "inserted": 0, "duplicates": 0, "rejected": 0}
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def send(client, body, content_type):
+        timestamp = str(int(time.time()))
+        headers = {"content-type": content_type, "x-cti-key": args.key_id,
+                   "x-cti-timestamp": timestamp,
+                   "x-cti-signature": sign(api_secret, timestamp, body)}
+        started = time.perf_counter()
+        try:
+            response = await client.post("/cti/calls", content=body, headers=headers)
+        finally:
+            semaphore.release()
+        latencies.append(time.perf_counter() - started)
+        totals["batches"] += 1
+        if response.status_code != 200:
+            totals["failed_batches"] += 1
+            print(f"Batch failed: {response.status_code} {response.text[:200]}")
+            return
+        result = response.json()
+        for key in ("inserted", "duplicates", "rejected"):
+            totals[key] += result[key]
+
+    started = time.perf_counter()
+    async with make_client() as client:
+        tasks = []
+        next_send = started
+        while time.perf_counter() < deadline:
+            await semaphore.acquire()
+            events = source.batch(args.batch_size)
+            totals["events"] += len(events)
+            body, content_type = encode(events, args.format)
+            tasks.append(asyncio.create_task(send(client, body, content_type)))
+            # Pace batches to the target rate; if the server falls behind,
+            # the semaphore holds the generator back instead
+            next_send += interval
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    totals.update({
+        "seconds": round(elapsed, 2),
+        "events_per_second": round(totals["events"] / elapsed, 1),
+        "inserted_per_second": round(totals["inserted"] / elapsed, 1),
+        "batch_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "batch_p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "batch_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    })
+    return totals
+
+
+async def main_async(args, source):
+    import httpx
+
+    if args.base_url:
+        def make_client():
+            return httpx.AsyncClient(base_url=args.base_url, timeout=60.0)
+        return await push(make_client, args, source)
+
+    from app.main import app
+    transport = httpx.ASGITransport(app=app)
+
+    def make_client():
+        return httpx.AsyncClient(transport=transport, base_url="http://fake-cti", timeout=60.0)
+
+    async with lifespan(app):
+        return await push(make_client, args, source)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        sys.exit("--database-url or DATABASE_URL is required")
+    if not args.signing_secret:
+        sys.exit("--signing-secret or CTI_SIGNING_SECRET is required")
+    os.environ["DATABASE_URL"] = args.database_url
+    # The in-process app reads its secret from the environment
+    os.environ["CTI_SIGNING_SECRET"] = args.signing_secret
+
+    run_id = uuid.uuid4().hex[:8]
+    source = EventSource(load_agents(), run_id, args.duplicate_rate,
+                         random.Random(args.seed))
+    try:
+        totals = asyncio.run(main_async(args, source))
+    finally:
+        if not args.base_url and not args.keep:
+            from sqlalchemy import delete
+            from app.database import engine
+            from app.models import CallLog
+            with engine.begin() as conn:
+                conn.execute(delete(CallLog).where(
+                    CallLog.external_id.like(f"fake-{run_id}-%")))
+
+    for key, value in totals.items():
+        print(f"{key:<22}{value}")
+
+
+if __name__ == "__main__":
+    main()
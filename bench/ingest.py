@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Benchmark: call inserts per second, per-row commits vs group commit.
+
+Writes the same number of calls twice against a seeded database: once the
+way POST /calls/ does by default (one session, commit and refresh per call,
+from a thread pool) and once through the batching CallIngestor. Inserted
+rows are deleted afterwards so the dataset stays reproducible.
+
+    python -m bench.ingest --database-url sqlite:///bench/bench.db
+    python -m bench.ingest --database-url postgresql://... --calls 20000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.seed import CALL_TYPE_WEIGHTS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--calls", type=int, default=5000,
+                        help="Calls to insert per mode")
+    parser.add_argument("--concurrency", type=int, default=64,
+                        help="Concurrent writers (requests in flight)")
+    parser.add_argument("--max-batch", type=int, default=200)
+    parser.add_argument("--flush-ms", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def make_rows(lists, count, rng_seed):
+    """(call type, list id, owner id) tuples for random lists."""
+    rng = random.Random(rng_seed)
+    call_types = list(CALL_TYPE_WEIGHTS)
+    weights = list(CALL_TYPE_WEIGHTS.values())
+    return [(rng.choices(call_types, weights)[0], *rng.choice(lists)) for _ in range(count)]
+
+
+async def per_row_commits(rows, concurrency):
+    from app.database import SessionLocal
+    from app.models import CallLog
+
+    def insert(row):
+        db = SessionLocal()
+        try:
+            call = CallLog(call_type=row[0], log_list_id=row[1], owner_id=row[2])
+            db.add(call)
+            db.commit()
+            db.refresh(call)
+        finally:
+            db.close()
+
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        await asyncio.gather(*(loop.run_in_executor(executor, insert, row) for row in rows))
+        return time.perf_counter() - started
+
+
+async def group_commit(rows, concurrency, max_batch, flush_ms):
+    from app.database import engine
+    from app.ingest import CallIngestor
+
+    ingestor = CallIngestor(engine, max_batch=max_batch, flush_ms=flush_ms)
+    await ingestor.start()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def submit(row):
+        async with semaphore:
+            await ingestor.submit(*row)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(submit(row) for row in rows))
+        return time.perf_counter() - started
+    finally:
+        await ingestor.stop()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        sys.exit("--database-url or DATABASE_URL is required")
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from sqlalchemy import delete, func, select
+
+    from app.database import engine
+    from app.ingest import batch_size
+    from app.models import CallLog, LogList
+
+    with engine.connect() as conn:
+        lists = conn.execute(select(LogList.id, LogList.owner_id)).all()
+        first_new_id = (conn.execute(select(func.max(CallLog.id))).scalar() or 0) + 1
+    if not lists:
+        sys.exit("No log lists found, run python -m bench.seed first")
+    rows = make_rows(lists, args.calls, args.seed)
+
+    results = {}
+    try:
+        results["per-row commit"] = asyncio.run(per_row_commits(rows, args.concurrency))
+        results["group commit"] = asyncio.run(
+            group_commit(rows, args.concurrency, args.max_batch, args.flush_ms))
+    finally:
+        with engine.begin() as conn:
+            conn.execute(delete(CallLog).where(CallLog.id >= first_new_id))
+
+    batches = sum(sum(child["counts"]) for child in batch_size.samples().values())
+    print(f"{engine.dialect.name}, {args.calls} calls, concurrency {args.concurrency}")
+    print(f"{'mode':<16}{'seconds':>10}{'inserts/s':>12}")
+    for name, seconds in results.items():
+        print(f"{name:<16}{seconds:>10.2f}{args.calls / seconds:>12.0f}")
+    if batches:
+        print(f"group commit wrote {batches} batches, {args.calls / batches:.1f} rows each")
+
+
+if __name__ == "__main__":
+    main()
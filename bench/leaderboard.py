@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Benchmark: ranking agents with app.leaderboard versus a full recompute.
+
+Times, on a seeded database, what the analytics endpoint did for its top 10
+(count every agent's calls, sort them all) against the leaderboard's top 10,
+bottom 10 and single-agent rank for every window. Then logs --calls random
+calls and deletes a few, recording them on the board as the write paths do,
+times that, and checks the board against a full recompute. The calls are
+written in a transaction that is rolled back at the end:
+
+    python -m bench.leaderboard --database-url sqlite:///bench/bench.db
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=2000)
+    return parser.parse_args(argv)
+
+
+def median_ms(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def log_calls(db, board, rng, count: int) -> float:
+    """Insert and record count calls, delete and unrecord a tenth; ms per call."""
+    from sqlalchemy import delete, insert, select
+    from app.models import CALL_TYPES, CallLog, LogList, POTENTIAL_SALE_CALL_TYPES
+
+    lists = db.execute(select(LogList.id, LogList.owner_id)).all()
+    call_types = sorted(CALL_TYPES)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    recorded = 0.0
+    for _ in range(count):
+        list_id, owner_id = rng.choice(lists)
+        call_type = rng.choice(call_types)
+        # Some today, some earlier in the windows, some before them
+        timestamp = now - timedelta(days=rng.choice((0, 0, 3, 12, 45)), minutes=rng.randint(0, 600))
+        call_id = db.execute(insert(CallLog).returning(CallLog.id), {
+            "call_type": call_type, "log_list_id": list_id, "owner_id": owner_id,
+            "timestamp": timestamp, "is_potential": call_type in POTENTIAL_SALE_CALL_TYPES,
+        }).scalar()
+        started = time.perf_counter()
+        board.record_call_types([(call_id, owner_id, timestamp, call_type)])
+        recorded += time.perf_counter() - started
+        if rng.random() < 0.1:
+            db.execute(delete(CallLog).where(CallLog.id == call_id))
+            started = time.perf_counter()
+            board.record_call_types([(call_id, owner_id, timestamp, call_type)], removed=True)
+            recorded += time.perf_counter() - started
+    return recorded * 1000 / count
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        sys.exit("--database-url or DATABASE_URL is required")
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from app import leaderboard
+    from app.database import SessionLocal
+
+    board = leaderboard.Leaderboard()
+    rng = random.Random(48)
+    with SessionLocal() as db:
+        load_ms = median_ms(lambda: board.load(db), 3)
+        agents = board.size(db)
+        if not agents:
+            sys.exit("No agents found; run `python -m bench.seed` first")
+        some_agent = board.top(db, k=agents)[agents // 2]["user_id"]
+        print(f"{agents} agents, board loaded in {load_ms:.1f} ms\n")
+
+        print(f"{'window':<8}{'recompute ms':>14}{'top 10 ms':>11}{'bottom 10 ms':>14}{'rank ms':>9}")
+        for window in leaderboard.WINDOWS:
+            recompute = median_ms(lambda: leaderboard.recompute(db, window, 0)[:10], args.repeat)
+            top = median_ms(lambda: board.top(db, window, 10), args.repeat)
+            bottom = median_ms(lambda: board.top(db, window, 10, bottom=True), args.repeat)
+            rank = median_ms(lambda: board.rank(db, some_agent, window), args.repeat)
+            print(f"{window:<8}{recompute:>14.2f}{top:>11.3f}{bottom:>14.3f}{rank:>9.3f}")
+
+        per_call = log_calls(db, board, rng, args.calls)
+        print(f"\nrecorded {args.calls} calls at {per_call * 1000:.1f} us each")
+        result = board.check(db)
+        db.rollback()
+    for name, ranking in result["rankings"].items():
+        if ranking["differences"]:
+            print(f"{name}: {ranking['differences']}")
+    if not result["consistent"]:
+        sys.exit("FAIL: the leaderboard differs from a full recompute")
+    print("leaderboard matches a full recompute for every window and threshold")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Microbenchmark: per-request Python overhead of POST /calls/ and GET /.
+
+First times the database work of each request on its own: the statements
+the app runs now (built once, INSERT ... RETURNING) next to the same queries
+written with the query API, as they were before. Then drives the app
+in-process, one request at a time, and splits each request's time into time
+spent inside the database driver and everything else (routing, auth,
+statement building, ORM, rendering):
+
+    python -m bench.micro_hotpath --requests 2000
+
+Runs against a scratch SQLite file. Rate limits, bulkheads, duplicate
+suppression and group commit are off so that every POST runs the plain
+insert path.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+_scratch = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["DATABASE_URL"] = f"sqlite:///{_scratch.name}"
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ["RATE_LIMITS_ENABLED"] = "false"
+os.environ["BULKHEADS_ENABLED"] = "false"
+os.environ["CALL_DEDUPE_WINDOW_MS"] = "0"
+os.environ["CALL_INGEST_BATCHING"] = "false"
+
+import httpx  # noqa: E402
+from sqlalchemy import event, insert, select  # noqa: E402
+
+from app import readmodels, sessions  # noqa: E402
+from app.auth import _user_from_token, get_password_hash  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+from app.main import app, insert_call  # noqa: E402
+from app.models import Base, CallLog, LogList, User, UserRole  # noqa: E402
+from app.schemas import CallLogCreate, TokenData  # noqa: E402
+from bench.run import lifespan, log_in  # noqa: E402
+from bench.seed import BENCH_PASSWORD  # noqa: E402
+
+# Calls shown on the page GET / renders
+PAGE_CALLS = 20
+
+
+class DriverTimer:
+    """Time spent between before_ and after_cursor_execute, and statement count."""
+
+    def __init__(self, engine):
+        self.seconds = 0.0
+        self.statements = 0
+        self.engine = engine
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def remove(self):
+        event.remove(self.engine, "before_cursor_execute", self._before)
+        event.remove(self.engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info["bench_started"] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        self.seconds += time.perf_counter() - conn.info.pop("bench_started")
+        self.statements += 1
+
+
+@event.listens_for(engine, "connect")
+def _no_fsync(dbapi_connection, connection_record):
+    # Commits would otherwise be dominated by the disk, which is not the point
+    dbapi_connection.execute("PRAGMA synchronous=OFF")
+
+
+def seed() -> tuple[int, int]:
+    """(list to post calls into, list shown on the page)."""
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        user_id = conn.execute(insert(User).values(
+            username="agent", name="Agent", role=UserRole.USER,
+            hashed_password=get_password_hash(BENCH_PASSWORD))).inserted_primary_key[0]
+        post_list, page_list = (conn.execute(insert(LogList).values(
+            name=name, owner_id=user_id)).inserted_primary_key[0] for name in ("Post", "Page"))
+        conn.execute(insert(CallLog), [
+            {"call_type": "AOD", "log_list_id": page_list, "owner_id": user_id}
+            for _ in range(PAGE_CALLS)])
+    return post_list, page_list
+
+
+def query_api_post(db, username: str, list_id: int):
+    user = db.query(User).filter(User.username == username).first()
+    log_list = db.query(LogList).filter(LogList.id == list_id).first()
+    assert log_list.owner_id == user.id
+    call = CallLog(call_type="AOD", log_list_id=list_id, owner_id=user.id)
+    db.add(call)
+    db.commit()
+    db.refresh(call)
+
+
+def statement_post(db, token: TokenData, list_id: int):
+    user = _user_from_token(token, db)
+    insert_call(CallLogCreate(call_type="AOD", log_list_id=list_id), user, db)
+
+
+def query_api_page(db, username: str, list_id: int):
+    user = db.query(User).filter(User.username == username).first()
+    statement = select(LogList.id, LogList.name, LogList.owner_id,
+                       *readmodels.USER_COLUMNS).join(
+        User, User.id == LogList.owner_id).order_by(LogList.id).where(
+        LogList.owner_id == user.id)
+    [readmodels.ListRow(list_id, name, owner_id, readmodels.UserRow(*owner))
+     for list_id, name, owner_id, *owner in db.execute(statement)]
+    readmodels.fetch(db, select(*readmodels.CALL_COLUMNS).where(
+        CallLog.log_list_id == list_id).order_by(CallLog.timestamp.desc()), readmodels.CallRow)
+    db.commit()
+
+
+def statement_page(db, token: TokenData, list_id: int):
+    user = _user_from_token(token, db)
+    readmodels.log_lists(db, user.id)
+    readmodels.list_calls(db, list_id)
+    db.commit()
+
+
+def time_data_access(func, arg, list_id: int, count: int) -> float:
+    """µs per call of func(db, arg, list_id), outside the driver."""
+    timer = DriverTimer(engine)
+    db = SessionLocal()
+    for _ in range(min(count, 50)):
+        func(db, arg, list_id)
+    seconds = timer.seconds
+    started = time.perf_counter()
+    for _ in range(count):
+        func(db, arg, list_id)
+    elapsed = time.perf_counter() - started - (timer.seconds - seconds)
+    db.close()
+    timer.remove()
+    return elapsed / count * 1e6
+
+
+def data_access(post_list: int, page_list: int, count: int):
+    db = SessionLocal()
+    user_id = db.query(User.id).filter(User.username == "agent").scalar()
+    session_id, _ = sessions.create_session(db, user_id)
+    db.close()
+    token = TokenData(username="agent", session_id=session_id)
+    print(f"{'database work':<14}{'query API µs':>14}{'statements µs':>15}{'saved':>8}")
+    for name, before, after, list_id in (
+            ("POST /calls/", query_api_post, statement_post, post_list),
+            ("GET /", query_api_page, statement_page, page_list)):
+        before_us = time_data_access(before, "agent", list_id, count)
+        after_us = time_data_access(after, token, list_id, count)
+        print(f"{name:<14}{before_us:>14.0f}{after_us:>15.0f}{1 - after_us / before_us:>8.0%}")
+    print()
+
+
+async def measure(client, timer, request, count: int) -> tuple[float, float, float]:
+    """(µs per request, of which Python, statements per request)."""
+    for _ in range(min(count, 50)):
+        (await request(client)).raise_for_status()
+    seconds, statements = timer.seconds, timer.statements
+    started = time.perf_counter()
+    for _ in range(count):
+        response = await request(client)
+        if response.status_code >= 400:
+            response.raise_for_status()
+    elapsed = time.perf_counter() - started
+    driver = timer.seconds - seconds
+    return (elapsed / count * 1e6, (elapsed - driver) / count * 1e6,
+            (timer.statements - statements) / count)
+
+
+async def main_async(args):
+    post_list, page_list = seed()
+    data_access(post_list, page_list, args.requests)
+    timer = DriverTimer(engine)
+    transport = httpx.ASGITransport(app=app)
+
+    def make_client(cookies=None):
+        return httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 cookies=cookies, timeout=60.0)
+
+    requests = {
+        "POST /calls/": lambda client: client.post(
+            "/calls/", json={"call_type": "AOD", "log_list_id": post_list}),
+        "GET /": lambda client: client.get(f"/?log_list_id={page_list}"),
+    }
+    async with lifespan(app):
+        cookies = await log_in(make_client, "agent")
+        async with make_client(cookies) as client:
+            print(f"{'request':<14}{'µs/req':>9}{'python µs':>11}{'sql/req':>9}")
+            for name, request in requests.items():
+                total, python, statements = await measure(client, timer, request, args.requests)
+                print(f"{name:<14}{total:>9.0f}{python:>11.0f}{statements:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        os.unlink(_scratch.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Microbenchmark: per-request overhead of the metrics middleware.
+
+Calls a trivial ASGI app directly, with and without the middleware, so the
+difference is the cost the metrics add to every request:
+
+    python -m bench.micro_metrics
+"""
+import asyncio
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import metrics  # noqa: E402
+from app.instrumentation import SQLStatsMiddleware  # noqa: E402
+
+ITERATIONS = 200_000
+
+
+class _Route:
+    path = "/calls/"
+
+
+async def bare_app(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 201, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def time_app(app, iterations: int) -> float:
+    scope_template = {"type": "http", "method": "POST", "path": "/calls/"}
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await app(dict(scope_template), receive, send)
+    return (time.perf_counter() - started) / iterations
+
+
+def time_call(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations
+
+
+async def main_async():
+    apps = {
+        "bare app": bare_app,
+        "+ MetricsMiddleware": metrics.MetricsMiddleware(bare_app),
+        "+ SQLStatsMiddleware": SQLStatsMiddleware(bare_app),
+        "+ both": metrics.MetricsMiddleware(SQLStatsMiddleware(bare_app)),
+    }
+    # Warm up label caches
+    for app in apps.values():
+        await time_app(app, 1000)
+    results = {name: await time_app(app, ITERATIONS) for name, app in apps.items()}
+
+    base = results["bare app"]
+    print(f"{'configuration':<24}{'per request':>14}{'overhead':>12}")
+    for name, seconds in results.items():
+        overhead = "" if name == "bare app" else f"{(seconds - base) * 1e6:.2f} us"
+        print(f"{name:<24}{seconds * 1e6:>11.2f} us{overhead:>12}")
+
+    counter = metrics.registry.counter("bench_counter_total", "Benchmark counter.", ("route",))
+    histogram = metrics.registry.histogram("bench_seconds", "Benchmark histogram.", ("route",))
+    child = counter.labels("/calls/")
+    print()
+    print(f"counter.labels().inc()     {time_call(lambda: counter.labels('/calls/').inc(), ITERATIONS) * 1e9:8.0f} ns")
+    print(f"child.inc()                {time_call(child.inc, ITERATIONS) * 1e9:8.0f} ns")
+    print(f"histogram.labels().observe {time_call(lambda: histogram.labels('/calls/').observe(0.01), ITERATIONS) * 1e9:8.0f} ns")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Microbenchmark: encoding the analytics payloads as rows versus columns.
+
+Builds a year of daily trends and a page of call logs shaped like the
+analytics endpoints' results, then encodes each three ways: FastAPI's
+default path (jsonable_encoder, then JSONResponse), the row form through
+app.payloads, and the columnar form. Reports the median encode time and the
+body size, raw and gzipped, with orjson and with the json module:
+
+    python -m bench.micro_payloads --days 365 --logs 1000
+"""
+import argparse
+import gzip
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+
+from app import payloads
+
+CALL_TYPES = ("AOD", "APPOINTMENT", "INVALID", "CUSTOMER SERVICE", "PROVIDER")
+
+
+def trends(days: int) -> dict:
+    first = date(2024, 1, 1)
+    total = [200 + i % 50 for i in range(days)]
+    potential = [80 + i % 30 for i in range(days)]
+    return {"trends": {
+        "date": [first + timedelta(days=i) for i in range(days)],
+        "total_calls": total,
+        "potential_calls": potential,
+        "transfer_rate": [round(p / t * 100, 2) for p, t in zip(potential, total)],
+    }, "filters_applied": {"days": days, "call_type": "all"}}
+
+
+def logs(count: int) -> dict:
+    started = datetime(2024, 1, 1)
+    owners = [i % 40 + 1 for i in range(count)]
+    return {"logs": {
+        "id": list(range(1, count + 1)),
+        "timestamp": [started + timedelta(seconds=17 * i) for i in range(count)],
+        "call_type": [CALL_TYPES[i % len(CALL_TYPES)] for i in range(count)],
+        "user.id": owners,
+        "user.username": [f"agent{owner:05d}" for owner in owners],
+        "user.name": [f"Agent {owner}" for owner in owners],
+        "user.role": ["USER"] * count,
+        "user.transfer_rate": [round(30 + owner / 3, 2) for owner in owners],
+        "log_list.id": [owner * 3 for owner in owners],
+        "log_list.name": [f"Campaign {owner} / week 0" for owner in owners],
+        "is_potential_sale": [i % 5 < 2 for i in range(count)],
+    }, "pagination": {"total": count, "limit": count, "offset": 0, "has_more": False}}
+
+
+def request(query: str = "") -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [],
+                    "query_string": query.encode()})
+
+
+def default_path(payload: dict, tables: tuple):
+    # What the endpoints did before: row dicts with ISO dates, through FastAPI
+    started = time.perf_counter()
+    body = dict(payload)
+    for name in tables:
+        body[name] = payloads._as_rows(payload[name])
+    response = JSONResponse(jsonable_encoder(body))
+    return response.body, time.perf_counter() - started
+
+
+def timed_render(query: str):
+    def encode(payload: dict, tables: tuple):
+        started = time.perf_counter()
+        response = payloads.render(request(query), payload, tables)
+        return response.body, time.perf_counter() - started
+    return encode
+
+
+def median_ms(encode, payload: dict, tables: tuple, repeat: int) -> tuple[float, bytes]:
+    timings = []
+    for _ in range(repeat):
+        body, seconds = encode(payload, tables)
+        timings.append(seconds * 1000)
+    return statistics.median(timings), body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--logs", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    cases = ((f"trends, {args.days} days", trends(args.days), ("trends",)),
+             (f"call logs, {args.logs} rows", logs(args.logs), ("logs",)))
+    paths = (("default", default_path), ("rows", timed_render("")),
+             ("columnar", timed_render("format=columnar")))
+    encoder = payloads.orjson
+    for encoder_name, module in (("orjson", encoder), ("json module", None)):
+        if encoder_name == "orjson" and encoder is None:
+            print("orjson is not installed, skipping it\n")
+            continue
+        payloads.orjson = module
+        print(f"rows and columns encoded with {encoder_name}")
+        print(f"{'payload':<24}{'path':<10}{'ms':>8}{'bytes':>10}{'gzip':>9}")
+        for case, payload, tables in cases:
+            baseline = None
+            for path, encode in paths:
+                elapsed, body = median_ms(encode, payload, tables, args.repeat)
+                line = (f"{case:<24}{path:<10}{elapsed:>8.2f}{len(body):>10,}"
+                        f"{len(gzip.compress(body)):>9,}")
+                if baseline:
+                    line += f"   {baseline[0] / elapsed:.1f}x faster, {baseline[1] / len(body):.1f}x smaller"
+                else:
+                    baseline = (elapsed, len(body))
+                print(line)
+        print()
+    payloads.orjson = encoder
+
+
+if __name__ == "__main__":
+    main()
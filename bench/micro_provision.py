@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Microbenchmark: bcrypt hashing for bulk provisioning, by process count.
+
+Hashes the same batch of temporary passwords with 1, 2, 4, ... processes up
+to the core count, as POST /admin/users/bulk does:
+
+    python -m bench.micro_provision --users 200
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import auth, provisioning  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    passwords = [auth.generate_temp_password() for _ in range(args.users)]
+    workers, baseline = 1, None
+    print(f"{'processes':>10}{'seconds':>10}{'users/s':>10}{'speedup':>10}")
+    while True:
+        started = time.perf_counter()
+        provisioning.hash_passwords(passwords, workers)
+        elapsed = time.perf_counter() - started
+        baseline = baseline or elapsed
+        print(f"{workers:>10}{elapsed:>10.2f}{args.users / elapsed:>10.1f}"
+              f"{baseline / elapsed:>9.1f}x")
+        if workers >= args.max_workers:
+            break
+        workers = min(workers * 2, args.max_workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Microbenchmark: cost of a rate limit check.
+
+Times the in-memory token bucket alone, the full check the auth dependencies
+run (route lookup, bucket, metrics) and the same check from several threads
+at once, as the threadpool runs it:
+
+    python -m bench.micro_ratelimit
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ["RATE_LIMITS_ENABLED"] = "true"
+
+from app import ratelimit  # noqa: E402
+
+ITERATIONS = 200_000
+THREADS = 8
+
+
+class _Request:
+    method = "GET"
+
+    class url:
+        path = "/admin/analytics/performance"
+
+
+def time_call(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    backend = ratelimit.MemoryBackend(ratelimit.RATE_LIMIT_MAX_KEYS)
+    # Huge budget so nothing is rejected; rejections cost an exception on top
+    ratelimit.budgets["analytics"] = (1e9, 1e9)
+    ratelimit.backend = backend
+    users = [f"agent{i:05d}" for i in range(10_000)]
+
+    results = {
+        "bucket, one key": time_call(
+            lambda i: backend.take("analytics:admin", 1e9, 1e9), ITERATIONS),
+        "bucket, 10k keys": time_call(
+            lambda i: backend.take(f"analytics:{users[i % 10_000]}", 1e9, 1e9), ITERATIONS),
+        "enforce_route()": time_call(
+            lambda i: ratelimit.enforce_route(_Request, users[i % 10_000]), ITERATIONS),
+    }
+
+    per_thread = ITERATIONS // THREADS
+    started = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        for future in [pool.submit(time_call,
+                                   lambda i: ratelimit.enforce_route(_Request, users[i % 10_000]),
+                                   per_thread) for _ in range(THREADS)]:
+            future.result()
+    results[f"enforce_route(), {THREADS} threads"] = \
+        (time.perf_counter() - started) / (per_thread * THREADS)
+
+    for name, seconds in results.items():
+        print(f"{name:<32}{seconds * 1e6:>8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Microbenchmark: loading call rows as ORM instances versus read-model rows.
+
+Fills an in-memory database with one list of --rows calls, then loads and
+formats them the way the list endpoints do: once through the ORM
+(CallLog instances) and once through app.readmodels (Core select into
+slotted dataclasses). Reports the median time, and the memory held per row
+while the loaded rows are alive, measured with tracemalloc:
+
+    python -m bench.micro_readmodels --rows 100000
+"""
+import argparse
+import gc
+import os
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import readmodels  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+from app.models import Base, CallLog, LogList, User, UserRole  # noqa: E402
+
+
+def seed(rows: int) -> int:
+    Base.metadata.create_all(engine)
+    started = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        user_id = conn.execute(insert(User).values(
+            username="agent", name="Agent", hashed_password="-", role=UserRole.USER)
+        ).inserted_primary_key[0]
+        list_id = conn.execute(insert(LogList).values(
+            name="List", owner_id=user_id)).inserted_primary_key[0]
+        conn.execute(insert(CallLog), [{
+            "call_type": ("AOD", "INVALID", "CUSTOMER SERVICE")[i % 3],
+            "timestamp": started + timedelta(seconds=i),
+            "log_list_id": list_id,
+            "owner_id": user_id,
+        } for i in range(rows)])
+    return list_id
+
+
+def load_orm(db, list_id: int) -> list:
+    return db.query(CallLog).filter(CallLog.log_list_id == list_id).order_by(
+        CallLog.timestamp.desc()).all()
+
+
+def load_readmodels(db, list_id: int) -> list:
+    return readmodels.list_calls(db, list_id)
+
+
+def as_dicts(calls: list) -> list:
+    return [{
+        "id": call.id,
+        "call_type": call.call_type,
+        "timestamp": call.timestamp.isoformat(),
+        "is_potential_sale": bool(call.is_potential),
+    } for call in calls]
+
+
+def measure(load, list_id: int, repeat: int) -> tuple[float, float]:
+    """(median ms to load and format, bytes held per loaded row)."""
+    timings = []
+    for _ in range(repeat):
+        db = SessionLocal()
+        started = time.perf_counter()
+        as_dicts(load(db, list_id))
+        timings.append((time.perf_counter() - started) * 1000)
+        db.close()
+
+    gc.collect()
+    db = SessionLocal()
+    tracemalloc.start()
+    loaded = load(db, list_id)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_row = held / len(loaded)
+    del loaded
+    db.close()
+    return statistics.median(timings), per_row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    list_id = seed(args.rows)
+    print(f"{args.rows} calls")
+    print(f"{'path':<12}{'ms':>10}{'rows/s':>12}{'bytes/row':>11}")
+    results = {}
+    for name, load in (("orm", load_orm), ("readmodels", load_readmodels)):
+        elapsed, per_row = measure(load, list_id, args.repeat)
+        results[name] = (elapsed, per_row)
+        print(f"{name:<12}{elapsed:>10.1f}{args.rows / elapsed * 1000:>12,.0f}{per_row:>11.0f}")
+    (orm_ms, orm_bytes), (rm_ms, rm_bytes) = results["orm"], results["readmodels"]
+    print(f"readmodels: {orm_ms / rm_ms:.1f}x faster, {orm_bytes / rm_bytes:.1f}x less memory per row")
+
+
+if __name__ == "__main__":
+    main()
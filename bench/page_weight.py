@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Benchmark: bytes transferred per dashboard load, before and after app.assets.
+
+Loads the admin dashboard and an agent's page with the CSS and JS they link,
+as a browser would on a first visit and on a repeat visit:
+
+- before: everything uncompressed from /static, and on a repeat visit one
+  revalidation (If-None-Match, answered 304) per asset
+- after: the page gzipped and the fingerprinted assets precompressed (brotli
+  when installed, otherwise gzip); on a repeat visit the assets come from
+  the browser cache, so only the page is fetched
+
+Counts response body bytes as sent, and requests per load:
+
+    python -m bench.page_weight --database-url sqlite:///bench/bench.db
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+
+from bench.run import lifespan, log_in
+from bench.seed import BENCH_ADMIN
+
+ASSET_LINK = re.compile(r'(?:href|src)="(/(?:assets|static)/[^"]+)"')
+FINGERPRINT = re.compile(r"^/assets/(.+)\.[0-9a-f]{12}(\.\w+)$")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    return parser.parse_args(argv)
+
+
+def unfingerprinted(url: str) -> str:
+    match = FINGERPRINT.match(url)
+    return f"/static/{match.group(1)}{match.group(2)}" if match else url
+
+
+async def load(client, url: str, before: bool, repeat: bool) -> tuple[int, int]:
+    """(bytes, requests) of one page load."""
+    encoding = "identity" if before else "br, gzip"
+    page = await client.get(url, headers={"Accept-Encoding": encoding})
+    page.raise_for_status()
+    transferred, requests = page.num_bytes_downloaded, 1
+    if repeat and not before:
+        # Immutable assets are not requested again
+        return transferred, requests
+    for asset in ASSET_LINK.findall(page.text):
+        if before:
+            asset = unfingerprinted(asset)
+        response = await client.get(asset, headers={"Accept-Encoding": encoding})
+        response.raise_for_status()
+        if repeat:
+            response = await client.get(asset, headers={
+                "Accept-Encoding": encoding, "If-None-Match": response.headers["etag"]})
+            if response.status_code != 304:
+                sys.exit(f"FAIL: revalidating {asset} returned {response.status_code}")
+        transferred += response.num_bytes_downloaded
+        requests += 1
+    return transferred, requests
+
+
+async def main_async(args) -> list:
+    import httpx
+    from sqlalchemy import select
+    from app import models
+    from app.database import engine
+    from app.main import app
+
+    with engine.connect() as conn:
+        agent = conn.execute(
+            select(models.User.username).join(
+                models.LogList, models.LogList.owner_id == models.User.id)
+            .where(models.User.role == models.UserRole.USER)
+            .order_by(models.User.id).limit(1)).scalar()
+    if agent is None:
+        sys.exit("No agents found; run `python -m bench.seed` first")
+
+    transport = httpx.ASGITransport(app=app)
+
+    def make_client(cookies=None):
+        return httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 cookies=cookies, timeout=60.0)
+
+    results = []
+    async with lifespan(app):
+        for username, url in ((BENCH_ADMIN, "/admin/dashboard"), (agent, "/")):
+            cookies = await log_in(make_client, username)
+            async with make_client(cookies) as client:
+                for visit, repeat in (("first visit", False), ("repeat visit", True)):
+                    before = await load(client, url, before=True, repeat=repeat)
+                    after = await load(client, url, before=False, repeat=repeat)
+                    results.append((url, visit, before, after))
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        sys.exit("--database-url or DATABASE_URL is required")
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["BULKHEADS_ENABLED"] = "false"
+    os.environ["RATE_LIMITS_ENABLED"] = "false"
+
+    results = asyncio.run(main_async(args))
+    print(f"{'page':<18}{'visit':<14}{'before B':>10}{'req':>5}{'after B':>10}{'req':>5}{'saved':>8}")
+    for url, visit, (before, before_requests), (after, after_requests) in results:
+        print(f"{url:<18}{visit:<14}{before:>10,}{before_requests:>5}"
+              f"{after:>10,}{after_requests:>5}{1 - after / before:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Benchmark: per-agent call aggregates, through log_lists versus call_logs alone.
+
+Runs the same aggregates two ways on a seeded database: the old shape, which
+joins call_logs to log_lists for the owner and tests call_type for potential
+sales, and the denormalized one that reads owner_id and is_potential off
+call_logs. Prints the median time of each and the query plans:
+
+    python -m bench.per_agent --database-url sqlite:///bench/bench.db
+
+Upgrades the schema first, so an older bench database gets the new columns
+and the backfill.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30,
+                        help="Window of the single-agent query")
+    return parser.parse_args(argv)
+
+
+def queries(agent_id: int, cutoff: datetime) -> list:
+    """(name, joined query, single-table query) pairs returning the same rows."""
+    from sqlalchemy import case, func, select
+    from app.models import CallLog, LogList, POTENTIAL_SALE_CALL_TYPES
+
+    joined_potential = func.sum(case((CallLog.call_type.in_(POTENTIAL_SALE_CALL_TYPES), 1), else_=0))
+    potential = func.sum(case((CallLog.is_potential, 1), else_=0))
+    return [
+        ("all agents",
+         select(LogList.owner_id, func.count(CallLog.id), joined_potential)
+         .join(LogList, LogList.id == CallLog.log_list_id)
+         .group_by(LogList.owner_id).order_by(LogList.owner_id),
+         select(CallLog.owner_id, func.count(CallLog.id), potential)
+         .group_by(CallLog.owner_id).order_by(CallLog.owner_id)),
+        ("one agent, last days",
+         select(func.count(CallLog.id), joined_potential)
+         .join(LogList, LogList.id == CallLog.log_list_id)
+         .where(LogList.owner_id == agent_id, CallLog.timestamp >= cutoff),
+         select(func.count(CallLog.id), potential)
+         .where(CallLog.owner_id == agent_id, CallLog.timestamp >= cutoff)),
+    ]
+
+
+def median_ms(conn, query, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(query).all()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def plan(conn, query) -> str:
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    if conn.dialect.name == "sqlite":
+        sql = str(query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+        return "\n".join(f"    {row[-1]}" for row in rows)
+    sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    rows = conn.exec_driver_sql(f"EXPLAIN {sql}").all()
+    return "\n".join(f"    {row[0]}" for row in rows)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        sys.exit("--database-url or DATABASE_URL is required")
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from sqlalchemy import select
+    from app import migrations, models
+    from app.database import engine
+
+    migrations.upgrade(engine)
+    with engine.connect() as conn:
+        agent_id = conn.execute(
+            select(models.CallLog.owner_id).group_by(models.CallLog.owner_id)
+            .order_by(models.CallLog.owner_id).limit(1)).scalar()
+        if agent_id is None:
+            sys.exit("No calls found; run `python -m bench.seed` first")
+        cutoff = datetime.now() - timedelta(days=args.days)
+
+        print(f"{'query':<24}{'join ms':>10}{'single ms':>11}{'speedup':>9}")
+        plans = []
+        for name, joined, single in queries(agent_id, cutoff):
+            if conn.execute(joined).all() != conn.execute(single).all():
+                sys.exit(f"FAIL: {name}: the two queries disagree")
+            joined_ms = median_ms(conn, joined, args.repeat)
+            single_ms = median_ms(conn, single, args.repeat)
+            print(f"{name:<24}{joined_ms:>10.2f}{single_ms:>11.2f}{joined_ms / single_ms:>8.1f}x")
+            plans.append((name, plan(conn, joined), plan(conn, single)))
+
+    for name, joined_plan, single_plan in plans:
+        print(f"\n{name}, join:\n{joined_plan}\n{name}, single table:\n{single_plan}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""Benchmark runner: drives the hot paths and compares against a baseline.
+
+By default the app is loaded in-process over an ASGI transport, so no server
+is needed. Pass --base-url to benchmark a running deployment instead; the
+database URL is still required so fixtures (agents, lists) can be discovered.
+
+    python -m bench.seed --database-url sqlite:///bench/bench.db --reset
+    python -m bench.run --database-url sqlite:///bench/bench.db
+    python -m bench.run --database-url sqlite:///bench/bench.db --update-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from bench.seed import BENCH_ADMIN, BENCH_PASSWORD, CALL_TYPE_WEIGHTS
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+
+
+# Scenarios: each returns (role, method, url, request kwargs) for one request.
+# "agent" requests are sent with a random agent session, "admin" with the
+# bench administrator session and "anonymous" with no cookies at all.
+
+def call_storm(rng, fixtures):
+    agent = rng.choice(fixtures["agents"])
+    payload = {
+        "call_type": rng.choices(list(CALL_TYPE_WEIGHTS),
+                                 list(CALL_TYPE_WEIGHTS.values()))[0],
+        "log_list_id": rng.choice(agent["list_ids"]),
+    }
+    return agent["username"], "POST", "/calls/", {"json": payload}
+
+
+def agent_dashboard(rng, fixtures):
+    agent = rng.choice(fixtures["agents"])
+    list_id = rng.choice(agent["list_ids"])
+    return agent["username"], "GET", f"/?log_list_id={list_id}", {}
+
+
+def admin_dashboard(rng, fixtures):
+    return "admin", "GET", "/admin/dashboard", {}
+
+
+def analytics_churn(rng, fixtures):
+    days = rng.choice((7, 30, 90, 365))
+    call_type = rng.choice(("all", "all", "potential", "AOD", "INVALID"))
+    endpoint = rng.choice(("performance", "trends", "call-logs"))
+    if endpoint == "call-logs":
+        params = [f"limit={rng.choice((25, 50, 100))}"]
+        if rng.random() < 0.4:
+            params.append(f"user_id={rng.choice(fixtures['agents'])['id']}")
+        if rng.random() < 0.3:
+            params.append(f"call_type={rng.choice(list(CALL_TYPE_WEIGHTS))}")
+        if rng.random() < 0.3:
+            since = datetime.now() - timedelta(days=days)
+            params.append(f"date_from={since.date().isoformat()}")
+        if rng.random() < 0.2:
+            params.append(f"search=agent{rng.randrange(100):03d}")
+        return "admin", "GET", "/admin/analytics/call-logs?" + "&".join(params), {}
+    return ("admin", "GET",
+            f"/admin/analytics/{endpoint}?days={days}&call_type={call_type}", {})
+
+
+def filter_churn(rng, fixtures):
+    """Analytics requests abandoned early, like an admin flipping filters."""
+    role, method, url, kwargs = analytics_churn(rng, fixtures)
+    if rng.random() < 0.7:
+        kwargs["abandon_after"] = rng.uniform(0.02, 0.2)
+    return role, method, url, kwargs
+
+
+def login_storm(rng, fixtures):
+    agent = rng.choice(fixtures["agents"])
+    form = {"username": agent["username"], "password": BENCH_PASSWORD}
+    return "anonymous", "POST", "/login", {"data": form}
+
+
+def export(rng, fixtures):
+    if rng.random() < 0.5:
+        agent = rng.choice(fixtures["agents"])
+        return "admin", "GET", f"/admin/users/{agent['id']}/details", {}
+    offset = rng.randrange(0, max(1, fixtures["total_calls"] - 1000))
+    return ("admin", "GET",
+            f"/admin/analytics/call-logs?limit=1000&offset={offset}", {})
+
+
+SCENARIOS = {
+    "call_storm": call_storm,
+    "agent_dashboard": agent_dashboard,
+    "admin_dashboard": admin_dashboard,
+    "analytics_churn": analytics_churn,
+    "filter_churn": filter_churn,
+    "login_storm": login_storm,
+    "export": export,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--base-url", default=None,
+                        help="Benchmark a running server instead of in-process")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="Comma-separated scenario names")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Seconds to run each scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--sessions", type=int, default=16,
+                        help="Number of agents to log in for agent scenarios")
+    parser.add_argument("--noise", default=None,
+                        help="Scenario to run alongside each measured one, "
+                             "e.g. analytics_churn to test isolation")
+    parser.add_argument("--noise-concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative latency/throughput drift")
+    return parser.parse_args(argv)
+
+
+def load_fixtures(sessions: int, rng: random.Random) -> dict:
+    """Pick active agents that own at least one list."""
+    from sqlalchemy import select, func
+    from app import models
+    from app.database import engine
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(models.User.id, models.User.username, models.LogList.id)
+            .join(models.LogList, models.LogList.owner_id == models.User.id)
+            .where(models.User.role == models.UserRole.USER,
+                   models.User.is_active.is_(True))
+        ).all()
+        total_calls = conn.execute(select(func.count(models.CallLog.id))).scalar()
+
+    agents = {}
+    for user_id, username, list_id in rows:
+        agents.setdefault(user_id, {"id": user_id, "username": username,
+                                    "list_ids": []})["list_ids"].append(list_id)
+    if not agents:
+        sys.exit("No active agents with lists found; run `python -m bench.seed` first")
+    chosen = rng.sample(sorted(agents.values(), key=lambda a: a["id"]),
+                        min(sessions, len(agents)))
+    return {"agents": chosen, "total_calls": total_calls}
+
+
+class StatementCounter:
+    """Counts SQL statements executed by the in-process app.
+
+    Also adds up the time spent in statements and the time connections were
+    checked out of the pool, including work for requests nobody waits for.
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.engine = engine
+        self.count = 0
+        self.db_seconds = 0.0
+        self.checkout_seconds = 0.0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "after_cursor_execute", self._on_finish)
+        event.listen(engine, "handle_error", self._on_error)
+        event.listen(engine.pool, "checkout", self._on_checkout)
+        event.listen(engine.pool, "checkin", self._on_checkin)
+
+    def _on_execute(self, conn, *args):
+        self.count += 1
+        conn.info["bench_started"] = time.perf_counter()
+
+    def _on_finish(self, conn, *args):
+        started = conn.info.pop("bench_started", None)
+        if started is not None:
+            self.db_seconds += time.perf_counter() - started
+
+    def _on_error(self, context):
+        if context.connection is not None and not context.connection.closed:
+            self._on_finish(context.connection)
+
+    def _on_checkout(self, dbapi_connection, record, proxy):
+        record.info["bench_checkout"] = time.perf_counter()
+
+    def _on_checkin(self, dbapi_connection, record):
+        started = record.info.pop("bench_checkout", None)
+        if started is not None:
+            self.checkout_seconds += time.perf_counter() - started
+
+    async def settle(self, checked_out: int, timeout: float = 30.0):
+        """Wait for abandoned requests to give their connections back."""
+        deadline = time.perf_counter() + timeout
+        while self.engine.pool.checkedout() > checked_out and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Run the ASGI lifespan protocol, which ASGITransport does not do."""
+    queue = asyncio.Queue()
+    await queue.put({"type": "lifespan.startup"})
+    started = asyncio.Event()
+    stopped = asyncio.Event()
+
+    async def receive():
+        return await queue.get()
+
+    async def send(message):
+        if message["type"].startswith("lifespan.startup"):
+            started.set()
+        elif message["type"].startswith("lifespan.shutdown"):
+            stopped.set()
+
+    task = asyncio.create_task(
+        app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, receive, send))
+    await started.wait()
+    try:
+        yield
+    finally:
+        await queue.put({"type": "lifespan.shutdown"})
+        await stopped.wait()
+        await task
+
+
+async def scrape_metrics(make_client, names) -> dict:
+    """Sum the samples of the named metrics on a running server's /metrics."""
+    # With the server's METRICS_TOKEN, as Prometheus scrapes it
+    headers = {"Authorization": f"Bearer {os.environ['METRICS_TOKEN']}"} \
+        if os.getenv("METRICS_TOKEN") else {}
+    async with make_client() as client:
+        response = await client.get("/metrics", headers=headers)
+    totals = dict.fromkeys(names, 0.0)
+    for line in response.text.splitlines():
+        name = line.split("{", 1)[0].split(" ", 1)[0]
+        if name in totals:
+            totals[name] += float(line.rsplit(" ", 1)[1])
+    return totals
+
+
+async def settle_server(make_client, checked_out: float, timeout: float = 30.0):
+    """Wait until a running server's abandoned requests have finished."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        current = await scrape_metrics(make_client, ["app_db_pool_checked_out"])
+        if current["app_db_pool_checked_out"] <= checked_out:
+            return
+        await asyncio.sleep(0.1)
+
+
+async def log_in(make_client, username: str) -> dict:
+    async with make_client() as client:
+        response = await client.post(
+            "/login", data={"username": username, "password": BENCH_PASSWORD})
+    token = response.cookies.get("access_token")
+    if response.status_code != 302 or not token:
+        raise RuntimeError(f"Could not log in as {username}: {response.status_code}")
+    return {"access_token": token}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_scenario(name, make_client, cookies, fixtures, args, counter,
+                       concurrency=None):
+    """Run one scenario for args.duration seconds and return its summary."""
+    build = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    rejected = 0
+    abandoned = 0
+    header_statements = []
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(worker_id):
+        nonlocal errors, rejected, abandoned
+        rng = random.Random(args.seed * 1000 + worker_id)
+        clients = {}
+        try:
+            while time.perf_counter() < deadline:
+                role, method, url, kwargs = build(rng, fixtures)
+                if role not in clients:
+                    clients[role] = make_client(cookies.get(role))
+                abandon_after = kwargs.pop("abandon_after", None)
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(
+                        clients[role].request(method, url, **kwargs), abandon_after)
+                except asyncio.TimeoutError:
+                    abandoned += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+                if response.status_code == 503:
+                    rejected += 1
+                    # Back off like a well-behaved client would
+                    await asyncio.sleep(float(response.headers.get("retry-after", 0)))
+                if "x-sql-statements" in response.headers:
+                    header_statements.append(int(response.headers["x-sql-statements"]))
+        finally:
+            for client in clients.values():
+                await client.aclose()
+
+    statements_before = counter.count if counter else 0
+    db_before = (counter.db_seconds, counter.checkout_seconds) if counter else None
+    checked_out = counter.engine.pool.checkedout() if counter else 0
+    # Against a server, DB time comes from its /metrics (not with --noise,
+    # which would mix both scenarios)
+    server_names = ["app_sql_seconds_total", "app_db_pool_checked_out"]
+    server_before = None
+    if args.base_url and not args.noise:
+        server_before = await scrape_metrics(make_client, server_names)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency or args.concurrency)))
+    elapsed = time.perf_counter() - started
+    if counter:
+        await counter.settle(checked_out)
+        db_seconds = counter.db_seconds - db_before[0]
+    elif server_before:
+        await settle_server(make_client, server_before["app_db_pool_checked_out"])
+        server_after = await scrape_metrics(make_client, server_names)
+        db_seconds = server_after["app_sql_seconds_total"] - server_before["app_sql_seconds_total"]
+    else:
+        db_seconds = None
+
+    latencies.sort()
+    requests = len(latencies)
+    if counter:
+        statements = (counter.count - statements_before) / requests if requests else None
+    elif header_statements:
+        statements = sum(header_statements) / len(header_statements)
+    else:
+        statements = None
+    return {
+        "requests": requests,
+        "errors": errors,
+        # 503s from saturated bulkheads, also counted in errors
+        "rejected": rejected,
+        # Requests the client gave up on (filter_churn), not in the latencies
+        "abandoned": abandoned,
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "statements_per_request": round(statements, 2) if statements is not None else None,
+        # Total statement time, including requests nobody waited for, and
+        # (in-process only) time connections were checked out of the pool
+        "db_seconds": round(db_seconds, 2) if db_seconds is not None else None,
+        "checkout_seconds": round(counter.checkout_seconds - db_before[1], 2) if counter else None,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return human-readable regressions of results against the baseline."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base or not current["requests"]:
+            continue
+        if base.get("p95_ms") and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms > baseline {base['p95_ms']}ms")
+        if base.get("p99_ms") and current["p99_ms"] > base["p99_ms"] * (1 + 2 * tolerance):
+            regressions.append(f"{name}: p99 {current['p99_ms']}ms > baseline {base['p99_ms']}ms")
+        if base.get("throughput_rps") and \
+                current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {current['throughput_rps']}/s < baseline {base['throughput_rps']}/s")
+        # Statement counts are deterministic per request shape, so any real
+        # increase is a new query (often an N+1) rather than noise.
+        base_statements = base.get("statements_per_request")
+        statements = current.get("statements_per_request")
+        if base_statements is not None and statements is not None and \
+                statements > base_statements * 1.1 + 0.5:
+            regressions.append(
+                f"{name}: {statements} statements/request > baseline {base_statements}")
+    return regressions
+
+
+async def main_async(args) -> dict:
+    import httpx
+
+    rng = random.Random(args.seed)
+    fixtures = load_fixtures(args.sessions, rng)
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = set(names + ([args.noise] if args.noise else [])) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    counter = None
+    if args.base_url:
+        app = None
+
+        def make_client(cookies=None):
+            return httpx.AsyncClient(base_url=args.base_url, cookies=cookies,
+                                     timeout=60.0)
+    else:
+        from app.main import app
+        from app.database import engine
+        counter = StatementCounter(engine)
+        transport = httpx.ASGITransport(app=app)
+
+        def make_client(cookies=None):
+            return httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                     cookies=cookies, timeout=60.0)
+
+    async def run_all():
+        cookies = {"admin": await log_in(make_client, BENCH_ADMIN)}
+        for agent in fixtures["agents"]:
+            cookies[agent["username"]] = await log_in(make_client, agent["username"])
+        scenarios = {}
+        for name in names:
+            print(f"Running {name} for {args.duration}s "
+                  f"at concurrency {args.concurrency}...", flush=True)
+            if not args.noise:
+                scenarios[name] = await run_scenario(
+                    name, make_client, cookies, fixtures, args, counter)
+                continue
+            # Statement counts are meaningless while the noise runs too
+            scenarios[name], noise = await asyncio.gather(
+                run_scenario(name, make_client, cookies, fixtures, args, None),
+                run_scenario(args.noise, make_client, cookies, fixtures, args, None,
+                             concurrency=args.noise_concurrency))
+            scenarios[name]["noise"] = {args.noise: noise}
+        return scenarios
+
+    if app is not None:
+        async with lifespan(app):
+            scenarios = await run_all()
+    else:
+        scenarios = await run_all()
+
+    from app.database import engine
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "dialect": engine.dialect.name,
+            "mode": "http" if args.base_url else "in-process",
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "noise": args.noise,
+            "noise_concurrency": args.noise_concurrency if args.noise else None,
+            "sessions": len(fixtures["agents"]),
+            "total_calls": fixtures["total_calls"],
+        },
+        "scenarios": scenarios,
+    }
+
+
+def print_table(results: dict):
+    header = f"{'scenario':<18}{'reqs':>8}{'err':>6}{'rps':>10}" \
+             f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'sql/req':>10}{'db s':>8}"
+    print(header)
+    print("-" * len(header))
+    rows = []
+    for name, s in results["scenarios"].items():
+        rows.append((name, s))
+        for noise_name, noise in s.get("noise", {}).items():
+            rows.append((f"  + {noise_name}", noise))
+    for name, s in rows:
+        print(f"{name:<18}{s['requests']:>8}{s['errors']:>6}{s['throughput_rps']:>10}"
+              f"{str(s['p50_ms']):>10}{str(s['p95_ms']):>10}{str(s['p99_ms']):>10}"
+              f"{str(s['statements_per_request']):>10}{str(s.get('db_seconds')):>8}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        sys.exit("--database-url or DATABASE_URL is required")
+    os.environ["DATABASE_URL"] = args.database_url
+    # A handful of sessions generate the load of a whole floor, which the
+    # per-user rate limits would reject (in-process runs only)
+    os.environ.setdefault("RATE_LIMITS_ENABLED", "false")
+
+    results = asyncio.run(main_async(args))
+    print()
+    print_table(results)
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --update-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("meta", {}).get("dialect") != results["meta"]["dialect"]:
+        print("Warning: baseline was recorded against a different database dialect")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nREGRESSIONS:")
+        for line in regressions:
+            print(f"  - {line}")
+        sys.exit(1)
+    print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
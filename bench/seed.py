@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Synthetic data generator for benchmarks.
+
+Creates N agents, M log lists and K calls with a realistic call-type mix and
+timestamps spread over working hours. Works against PostgreSQL or SQLite:
+
+    python -m bench.seed --database-url sqlite:///bench/bench.db \
+        --agents 100 --lists 300 --calls 20000 --days 90
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+BENCH_PASSWORD = "bench-password"
+BENCH_ADMIN = "bench-admin"
+
+# Roughly what a sales floor logs: most calls are not transfers, and the
+# potential-sale types are dominated by AOD/APPOINTMENT.
+CALL_TYPE_WEIGHTS = {
+    "AOD": 14,
+    "APPOINTMENT": 10,
+    "T2": 6,
+    "HPA": 3,
+    "AFCT2": 2,
+    "AFCAPPOINTMENT": 2,
+    "NON-MED": 3,
+    "CUSTOMER SERVICE": 18,
+    "INVALID": 14,
+    "PROVIDER": 7,
+    "BROKER": 5,
+    "U65": 6,
+    "LOYALTY": 4,
+    "CALLBLUE": 3,
+    "SEMINAR": 3,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                        help="Target database (defaults to $DATABASE_URL)")
+    parser.add_argument("--agents", type=int, default=100)
+    parser.add_argument("--lists", type=int, default=300)
+    parser.add_argument("--calls", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=90,
+                        help="Spread call timestamps over this many days")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="Random seed, so runs are reproducible")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--reset", action="store_true",
+                        help="Drop and recreate all tables first")
+    return parser.parse_args(argv)
+
+
+def call_timestamps(rng: random.Random, count: int, days: int):
+    """Return sorted call timestamps during working hours (Mon-Sat, 8am-8pm)."""
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+    stamps = []
+    while len(stamps) < count:
+        day = start + timedelta(days=rng.randrange(days + 1))
+        if day.weekday() == 6:
+            continue
+        # Peaks mid-morning and mid-afternoon
+        hour = min(19, max(8, int(rng.choice((10, 14)) + rng.gauss(0, 2))))
+        stamp = day.replace(hour=hour, minute=rng.randrange(60),
+                            second=rng.randrange(60))
+        if stamp <= end:
+            stamps.append(stamp)
+    stamps.sort()
+    return stamps
+
+
+def seed(database_url: str, agents: int, lists: int, calls: int, days: int,
+         rng_seed: int = 42, batch_size: int = 5000, reset: bool = False) -> dict:
+    """Populate the database and return a summary of what was created."""
+    os.environ["DATABASE_URL"] = database_url
+    from sqlalchemy import insert, select, func
+    from app import models
+    from app.auth import get_password_hash
+    from app.database import engine
+
+    if reset:
+        models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+
+    rng = random.Random(rng_seed)
+    started = time.perf_counter()
+    # bcrypt is the slow part of user creation, so every bench account
+    # shares one precomputed hash.
+    hashed_password = get_password_hash(BENCH_PASSWORD)
+    types = list(CALL_TYPE_WEIGHTS)
+    weights = list(CALL_TYPE_WEIGHTS.values())
+
+    with engine.begin() as conn:
+        admin_id = conn.execute(
+            select(models.User.id).where(models.User.username == BENCH_ADMIN)
+        ).scalar()
+        if admin_id is None:
+            admin_id = conn.execute(insert(models.User).values(
+                username=BENCH_ADMIN, name="Bench Administrator",
+                hashed_password=hashed_password, role=models.UserRole.ADMIN,
+                is_active=True, must_change_password=False,
+            ).returning(models.User.id)).scalar_one()
+
+        offset = conn.execute(select(func.count(models.User.id))).scalar()
+        conn.execute(insert(models.User), [{
+            "username": f"agent{offset + i:05d}",
+            "name": f"Agent {offset + i}",
+            "hashed_password": hashed_password,
+            "role": models.UserRole.USER,
+            "is_active": rng.random() > 0.05,
+            "must_change_password": False,
+            "created_by_id": admin_id,
+        } for i in range(agents)])
+        agent_ids = conn.execute(
+            select(models.User.id).where(models.User.role == models.UserRole.USER)
+        ).scalars().all()
+
+        conn.execute(insert(models.LogList), [{
+            "name": f"Campaign {i % 25} / week {i // 25}",
+            "owner_id": agent_ids[i % len(agent_ids)],
+        } for i in range(lists)])
+        owners = dict(conn.execute(select(models.LogList.id, models.LogList.owner_id)).all())
+        list_ids = list(owners)
+
+        # Busy agents work a handful of lists; weight lists so a few are hot.
+        list_weights = [rng.paretovariate(1.5) for _ in list_ids]
+        stamps = call_timestamps(rng, calls, days)
+        for first in range(0, calls, batch_size):
+            chunk = stamps[first:first + batch_size]
+            chosen_lists = rng.choices(list_ids, list_weights, k=len(chunk))
+            chosen_types = rng.choices(types, weights, k=len(chunk))
+            conn.execute(insert(models.CallLog), [{
+                "call_type": call_type,
+                "timestamp": stamp,
+                "log_list_id": list_id,
+                "owner_id": owners[list_id],
+            } for stamp, list_id, call_type in zip(chunk, chosen_lists, chosen_types)])
+
+    return {
+        "agents": len(agent_ids),
+        "lists": len(list_ids),
+        "calls": calls,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        sys.exit("--database-url or DATABASE_URL is required")
+    summary = seed(args.database_url, args.agents, args.lists, args.calls,
+                   args.days, args.seed, args.batch_size, args.reset)
+    print(f"Seeded {summary['agents']} agents, {summary['lists']} lists, "
+          f"{summary['calls']} calls in {summary['seconds']}s")
+    print(f"Admin login: {BENCH_ADMIN} / {BENCH_PASSWORD}")
+
+
+if __name__ == "__main__":
+    main()
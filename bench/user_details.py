@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Benchmark: the admin user-details payload versus agent tenure.
+
+Seeds one agent per tenure (total calls) into a scratch SQLite database and
+builds /admin/users/{id}/details for each two ways: as before, with every
+call of every list inlined, and as now, with list summaries only. Then pages
+through the agent's largest list as the list modal does, comparing the
+(timestamp, id) cursor with OFFSET for the first and the last page, and
+checks that walking every page returns each call once, in order. Prints
+median times and payload sizes:
+
+    python -m bench.user_details --tenures 1000,10000,100000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.seed import CALL_TYPE_WEIGHTS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tenures", default="1000,10000,100000",
+                        help="Comma-separated call counts, one agent each")
+    parser.add_argument("--lists", type=int, default=10, help="Lists per agent")
+    parser.add_argument("--repeat", type=int, default=10)
+    return parser.parse_args(argv)
+
+
+def seed(engine, tenures: list, lists: int) -> list:
+    """Agent ids, one per tenure, with that many calls over their lists."""
+    from sqlalchemy import insert
+    from app.models import Base, CallLog, LogList, User, UserRole, POTENTIAL_SALE_CALL_TYPES
+
+    Base.metadata.create_all(engine)
+    rng = random.Random(47)
+    call_types, weights = zip(*CALL_TYPE_WEIGHTS.items())
+    started = datetime(2020, 1, 1)
+    agents = []
+    with engine.begin() as conn:
+        for tenure in tenures:
+            agent_id = conn.execute(insert(User).values(
+                username=f"tenure-{tenure}", name=f"Agent with {tenure} calls",
+                hashed_password="-", role=UserRole.USER)).inserted_primary_key[0]
+            list_ids = [conn.execute(insert(LogList).values(
+                name=f"List {i}", owner_id=agent_id)).inserted_primary_key[0]
+                for i in range(lists)]
+            calls = []
+            for i in range(tenure):
+                call_type = rng.choices(call_types, weights)[0]
+                calls.append({
+                    "call_type": call_type,
+                    "timestamp": started + timedelta(minutes=7 * i),
+                    "log_list_id": list_ids[i % lists],
+                    "owner_id": agent_id,
+                    "is_potential": call_type in POTENTIAL_SALE_CALL_TYPES,
+                })
+            conn.execute(insert(CallLog), calls)
+            # Over a page per list stamped by the database's CURRENT_TIMESTAMP,
+            # in one second: ties, stored in another format than SQLAlchemy's
+            conn.execute(insert(CallLog), [{
+                "call_type": call_types[i % len(call_types)], "log_list_id": list_id,
+                "owner_id": agent_id,
+                "is_potential": call_types[i % len(call_types)] in POTENTIAL_SALE_CALL_TYPES,
+            } for list_id in list_ids for i in range(60)])
+            agents.append(agent_id)
+    return agents
+
+
+def details_before(db, user_id: int) -> dict:
+    """/admin/users/{id}/details as it was: every call of every list inlined."""
+    from sqlalchemy import select
+    from app import crud, readmodels
+    from app.main import user_details
+    from app.models import CallLog
+
+    details = user_details(db, user_id)
+    calls_by_list = {}
+    for call in readmodels.fetch(db, select(*readmodels.CALL_COLUMNS).where(
+            CallLog.owner_id == user_id).order_by(CallLog.timestamp.desc()), readmodels.CallRow):
+        calls_by_list.setdefault(call.log_list_id, []).append({
+            "id": call.id,
+            "call_type": call.call_type,
+            "timestamp": call.timestamp.isoformat() if call.timestamp else None,
+            "is_potential_sale": bool(call.is_potential)
+        })
+    details["log_lists"] = [{
+        "id": summary["id"],
+        "name": summary["name"],
+        "total_calls": summary["total_calls"],
+        "potential_calls": summary["potential_calls"],
+        "transfer_rate": summary["transfer_rate"],
+        "calls": calls_by_list.get(summary["id"], [])
+    } for summary in crud.get_user_log_list_summaries(db, user_id)]
+    return details
+
+
+def details_after(db, user_id: int) -> dict:
+    from app.main import user_details
+    return user_details(db, user_id)
+
+
+def timed(build, repeat: int) -> tuple[float, int]:
+    """Median ms to build and encode a payload, and its size in bytes."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = json.dumps(build(), default=str).encode()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), len(body)
+
+
+def offset_page(db, list_id: int, offset: int, limit: int) -> list:
+    from app import readmodels
+    from app.models import CallLog
+
+    statement = readmodels.LIST_CALLS.order_by(CallLog.id.desc()).offset(offset).limit(limit)
+    return readmodels.fetch(db, statement, readmodels.CallRow, {"log_list_id": list_id})
+
+
+def walk(db, list_id: int, limit: int, total: int) -> tuple[list, tuple]:
+    """Ids of a list's calls, page by page, and the cursor key of the last page.
+
+    Stops past total calls, should pages repeat calls.
+    """
+    from app import readmodels
+
+    ids, key, last_key = [], None, None
+    while True:
+        calls, next_key = readmodels.list_calls_page(db, list_id, limit, key)
+        ids += [call.id for call in calls]
+        if next_key is None or len(ids) > total:
+            return ids, last_key
+        last_key = key = next_key
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tenures = [int(tenure) for tenure in args.tenures.split(",")]
+    directory = tempfile.mkdtemp(prefix="bench_user_details_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+
+    from app import readmodels
+    from app.database import SessionLocal, engine
+    from app.main import LIST_CALLS_PAGE_SIZE
+
+    agents = seed(engine, tenures, args.lists)
+    page = LIST_CALLS_PAGE_SIZE
+
+    print(f"{'tenure':>8}  {'details':<8}{'ms':>9}{'bytes':>12}")
+    with SessionLocal() as db:
+        for tenure, agent_id in zip(tenures, agents):
+            for name, build in (("before", details_before), ("after", details_after)):
+                elapsed, size = timed(lambda: build(db, agent_id), args.repeat)
+                print(f"{tenure:>8}  {name:<8}{elapsed:>9.2f}{size:>12,}")
+        print()
+
+        failed = False
+        print(f"{'tenure':>8}  {'list page':<16}{'offset ms':>10}{'cursor ms':>10}")
+        for tenure, agent_id in zip(tenures, agents):
+            largest = max(readmodels.list_stats(db, agent_id), key=lambda stats: stats.total_calls)
+            last_offset = (largest.total_calls - 1) // page * page
+            # The cursor the modal holds before loading the last page
+            ids, last_key = walk(db, largest.id, page, largest.total_calls)
+            if ids != [call.id for call in offset_page(db, largest.id, 0, None)]:
+                print(f"FAIL: paging list {largest.id} repeats or skips calls")
+                failed = True
+            for name, offset, key in (("first", 0, None), ("last", last_offset, last_key)):
+                offset_ms, _ = timed(lambda: offset_page(db, largest.id, offset, page), args.repeat)
+                cursor_ms, _ = timed(lambda: readmodels.list_calls_page(db, largest.id, page, key)[0],
+                                     args.repeat)
+                print(f"{tenure:>8}  {name + ' of ' + str(largest.total_calls):<16}"
+                      f"{offset_ms:>10.2f}{cursor_ms:>10.2f}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())